@@ -0,0 +1,93 @@
+import logging
+import math
+import os
+
+from decoded_audio import asr_sample_rate
+
+try:
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+except ImportError:
+    WhisperModel = None
+    BatchedInferencePipeline = None
+
+logger = logging.getLogger(__name__)
+
+# Selected per deployment, e.g. ASR_BACKEND=faster-whisper ASR_MODEL=small
+default_backend_name = os.environ.get('ASR_BACKEND', 'whisper-timestamped')
+default_model_name = os.environ.get('ASR_MODEL', 'tiny') # tiny, base, small, medium, large
+whisper_window_seconds = 30
+
+
+class WhisperTimestampedBackend(object):
+    """PyTorch Whisper via whisper_timestamped, fp32 on CPU."""
+    name = 'whisper-timestamped'
+
+    def __init__(self, model_name, threads):
+        import torch
+        import whisper_timestamped as whisper
+        torch.set_num_threads(threads)
+        self.whisper = whisper
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio, language, speech_windows=None):
+        """speech_windows is unused: whisper_timestamped slides its 30s window over audio of any length."""
+        return self.whisper.transcribe(self.model, audio, language=language)
+
+
+class FasterWhisperBackend(object):
+    """CTranslate2 Whisper via faster-whisper: int8 weights, batched beam search, word timestamps.
+    Output is converted to the whisper_timestamped result shape ({'text', 'segments': [{'id', 'start', 'end',
+    'text', 'words': [{'text', 'start', 'end', 'confidence'}]}]}) that subtitle rendering consumes.
+    The batched pipeline only decodes windows of up to whisper_window_seconds that it is given (clip_timestamps),
+    so audio without speech windows goes through the model's own sequential, sliding-window transcription."""
+    name = 'faster-whisper'
+    beam_size = 5
+    batch_size = 8
+
+    def __init__(self, model_name, threads, compute_type='int8'):
+        if WhisperModel is None:
+            raise ImportError("ASR backend 'faster-whisper' requires the faster-whisper package.")
+        self.model = WhisperModel(model_name, device='cpu', compute_type=compute_type, cpu_threads=threads)
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+
+    def transcribe(self, audio, language, speech_windows=None):
+        """speech_windows: (start, end) sample ranges of audio holding speech (the engine's VAD intervals)."""
+        options = dict(language=language, beam_size=self.beam_size, word_timestamps=True, vad_filter=False)
+        if speech_windows:
+            segments, _ = self.pipeline.transcribe(audio, batch_size=self.batch_size,
+                                                   clip_timestamps=self.clip_timestamps(speech_windows), **options)
+        else:
+            segments, _ = self.model.transcribe(audio, **options)
+        result_segments = []
+        for seg in segments:
+            words = []
+            for w in seg.words or []:
+                words.append({'text': w.word.strip(), 'start': w.start, 'end': w.end, 'confidence': w.probability})
+            result_segments.append({'id': len(result_segments), 'start': seg.start, 'end': seg.end,
+                                    'text': seg.text, 'words': words})
+        return {'text': "".join(seg['text'] for seg in result_segments), 'segments': result_segments, 'language': language}
+
+    def clip_timestamps(self, speech_windows):
+        """The windows as the batched pipeline's clip_timestamps (sample offsets), longer ones split evenly into
+        pieces of at most whisper_window_seconds."""
+        max_samples = whisper_window_seconds * asr_sample_rate
+        clips = []
+        for start, end in speech_windows:
+            pieces = max(1, math.ceil((end - start) / max_samples))
+            step = math.ceil((end - start) / pieces)
+            for piece_start in range(start, end, step):
+                clips.append({'start': piece_start, 'end': min(end, piece_start + step)})
+        return clips
+
+
+asr_backends = {
+    WhisperTimestampedBackend.name: WhisperTimestampedBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def create_backend(backend_name, model_name, threads):
+    if backend_name not in asr_backends:
+        raise ValueError("unsupported ASR backend: " + backend_name + ". Expected one of " + ", ".join(asr_backends))
+    logger.info(f"Loading ASR backend {backend_name} with model {model_name} ({threads} threads)")
+    return asr_backends[backend_name](model_name, threads)
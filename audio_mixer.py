@@ -0,0 +1,323 @@
+import logging
+import os
+import subprocess
+
+import numpy as np
+from moviepy import AudioArrayClip, afx, vfx
+from moviepy.config import FFMPEG_BINARY
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+mix_sample_rate = 44100
+mix_channels = 2
+# Buses: master is mixed as-is, narration is mixed as-is and keys the ducking of the ducked bus (music, video sound).
+master_bus = 'master'
+narration_bus = 'narration'
+ducked_bus = 'ducked'
+target_loudness_lufs = float(os.environ.get('RENDER_TARGET_LUFS', -14))
+peak_ceiling_dbfs = -1.0
+duck_window_seconds = 0.02
+duck_threshold_dbfs = -45.0 # narration RMS above this counts as speech
+duck_depth_db = -15.0
+duck_hold_seconds = 0.3 # speech gaps shorter than this keep the duck
+duck_smoothing_seconds = 0.2
+mix_block_seconds = 10 # unit of the block-wise passes over the master (finalize, write)
+# A cue layout row: which source plays from start to end (timeline seconds), faded in and out over fade seconds.
+cue_dtype = np.dtype([('cue', np.int32), ('start', np.float64), ('end', np.float64), ('fade', np.float32)])
+
+
+def decode_pcm(filename, sample_rate=mix_sample_rate, channels=mix_channels):
+    """The first audio stream of filename as float32 samples of shape (n, channels)."""
+    cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-i", filename, "-map", "0:a:0",
+           "-ac", str(channels), "-ar", str(sample_rate), "-f", "f32le", "pipe:1"]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to decode audio from {filename}: {result.stderr.decode(errors='ignore')}")
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, channels)
+
+
+def k_weighting_filter(sample_rate):
+    """(b, a) of the ITU-R BS.1770 K-weighting (high shelf then high pass) at sample_rate, as one cascade."""
+    gain_db, shelf_hz, shelf_q = 3.999843853973347, 1681.974450955533, 0.7071752369554196
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * shelf_hz / sample_rate
+    alpha = np.sin(w0) / (2 * shelf_q)
+    shelf_b = [a * ((a + 1) + (a - 1) * np.cos(w0) + 2 * np.sqrt(a) * alpha),
+               -2 * a * ((a - 1) + (a + 1) * np.cos(w0)),
+               a * ((a + 1) + (a - 1) * np.cos(w0) - 2 * np.sqrt(a) * alpha)]
+    shelf_a = [(a + 1) - (a - 1) * np.cos(w0) + 2 * np.sqrt(a) * alpha,
+               2 * ((a - 1) - (a + 1) * np.cos(w0)),
+               (a + 1) - (a - 1) * np.cos(w0) - 2 * np.sqrt(a) * alpha]
+    pass_hz, pass_q = 38.13547087602444, 0.5003270373238773
+    w0 = 2 * np.pi * pass_hz / sample_rate
+    alpha = np.sin(w0) / (2 * pass_q)
+    pass_b = [(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2]
+    pass_a = [1 + alpha, -2 * np.cos(w0), 1 - alpha]
+    return np.polymul(shelf_b, pass_b), np.polymul(shelf_a, pass_a)
+
+
+class LoudnessMeter(object):
+    """Streaming BS.1770 integrated loudness: push() blocks of (n, channels) samples in order, then integrated().
+    Only the K-weighted energy of each 100 ms step is kept; the gated 400 ms blocks (75% overlap) are built from them."""
+    def __init__(self, sample_rate=mix_sample_rate, channels=mix_channels):
+        self.step = int(round(sample_rate * 0.1))
+        self.b, self.a = k_weighting_filter(sample_rate)
+        self.state = np.zeros((len(self.a) - 1, channels))
+        self.energies = []
+        self.pending = np.zeros((0, channels))
+
+    def push(self, samples):
+        weighted, self.state = signal.lfilter(self.b, self.a, samples, axis=0, zi=self.state)
+        weighted = np.concatenate([self.pending, weighted]) if len(self.pending) else weighted
+        whole = len(weighted) // self.step * self.step
+        if whole:
+            steps = weighted[:whole].reshape(-1, self.step, weighted.shape[1])
+            self.energies.append(np.square(steps).sum(axis=1))
+        self.pending = weighted[whole:]
+
+    def integrated(self):
+        """Gated loudness in LUFS; -inf for silence or less than one 400 ms block."""
+        if not self.energies:
+            return -np.inf
+        energies = np.concatenate(self.energies)
+        if len(energies) < 4:
+            return -np.inf
+        # Channel weights are 1 for left/right; the block power is the sum over channels.
+        blocks = sliding_window_view(energies.sum(axis=1), 4).sum(axis=1) / (4 * self.step)
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[block_loudness > -70]
+        if len(gated) == 0:
+            return -np.inf
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10
+        gated = blocks[(block_loudness > -70) & (block_loudness > relative_gate)]
+        return -0.691 + 10 * np.log10(gated.mean())
+
+
+def volume_factor(effects):
+    """Combined gain of the MultiplyVolume effects in effects."""
+    factor = 1.0
+    for effect in effects:
+        if isinstance(effect, afx.MultiplyVolume):
+            factor *= effect.factor
+    return factor
+
+
+def speed_factor(effects):
+    factor = 1.0
+    for effect in effects:
+        if isinstance(effect, vfx.MultiplySpeed):
+            factor *= effect.factor
+    return factor
+
+
+class AudioMixer(object):
+    """A preallocated float32 master buffer for a whole render.
+    Each source file is decoded once (by a single ffmpeg run) however often it is placed; add() writes
+    a placement into the master with one vectorized multiply-add, the gain and any fades folded into
+    a single envelope. clip() hands the result to MoviePy as one PCM stream.
+    Placements on the narration bus also add their energy to a sidechain envelope (per duck window) as they are
+    mixed; placements on the ducked bus are only recorded, and finalize() mixes them into the master block by block
+    under the gain curve derived from that envelope, metering the loudness of the result in the same pass."""
+    def __init__(self, duration, sample_rate=mix_sample_rate, channels=mix_channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.duration = duration
+        self.master = np.zeros((int(round(duration * sample_rate)), channels), dtype=np.float32)
+        self.ducked_placements = []
+        self.duck_window = int(round(duck_window_seconds * sample_rate))
+        self.sidechain = np.zeros(-(-len(self.master) // self.duck_window), dtype=np.float64)
+        self.sources = {}
+        self.finalized = False
+        self.output_gain = 1.0
+        self.loudness = None
+        self.peak = None
+
+    def pcm(self, filename):
+        if filename not in self.sources:
+            self.sources[filename] = decode_pcm(filename, self.sample_rate, self.channels)
+        return self.sources[filename]
+
+    def add(self, source, start, duration=None, gain=1.0, fade_in=0, fade_out=0, speed=1.0, bus=master_bus):
+        """Mixes source (a filename or float32 (n, channels) samples) in at start seconds on bus.
+        duration (timeline seconds, default: all of it) cuts it short; speed > 1 plays it faster, as MultiplySpeed does.
+        fade_in/fade_out are linear ramps in timeline seconds from the placement's start and to its end."""
+        if self.finalized:
+            raise RuntimeError("AudioMixer is already finalized")
+        if bus not in (master_bus, narration_bus, ducked_bus):
+            raise ValueError("unsupported audio bus: " + str(bus))
+        samples = self.pcm(source) if isinstance(source, str) else source
+        if gain == 0 or len(samples) == 0:
+            return
+        length = int(np.ceil(len(samples) / speed))
+        if duration is not None:
+            length = min(length, int(round(duration * self.sample_rate)))
+        first = int(round(start * self.sample_rate))
+        lo = max(first, 0)
+        hi = min(first + length, len(self.master))
+        if hi <= lo:
+            return
+        placement = (samples, first, length, gain, fade_in, fade_out, speed)
+        if bus == ducked_bus:
+            self.ducked_placements.append((lo, hi, placement))
+            return
+        self.__mix(self.__place(placement, lo, hi), lo, hi, bus)
+
+    def add_streamed(self, filename, start, gain=1.0, bus=master_bus):
+        """Mixes filename in at start seconds like add(), but decodes it a block at a time straight into the mix
+        instead of holding all of its samples: for long sources placed once, at their own speed and without fades."""
+        if self.finalized:
+            raise RuntimeError("AudioMixer is already finalized")
+        if bus not in (master_bus, narration_bus):
+            raise ValueError("unsupported audio bus for a streamed source: " + str(bus))
+        cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-i", filename, "-map", "0:a:0",
+               "-ac", str(self.channels), "-ar", str(self.sample_rate), "-f", "f32le", "pipe:1"]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        block_bytes = mix_block_seconds * self.sample_rate * self.channels * 4
+        position = int(round(start * self.sample_rate))
+        with process.stdout:
+            # Blocks are read whole: a short read only happens at the end of the stream.
+            for chunk in iter(lambda: process.stdout.read(block_bytes), b''):
+                samples = np.frombuffer(chunk, dtype=np.float32).reshape(-1, self.channels)
+                lo, hi = max(position, 0), min(position + len(samples), len(self.master))
+                if hi > lo and gain != 0:
+                    placed = samples[lo - position:hi - position]
+                    self.__mix(placed * np.float32(gain) if gain != 1 else placed, lo, hi, bus)
+                position += len(samples)
+                if position >= len(self.master):
+                    process.kill() # the rest is past the end of the mix
+                    break
+        stderr = process.stderr.read()
+        process.wait()
+        if process.returncode != 0 and position < len(self.master):
+            raise RuntimeError(f"Failed to decode audio from {filename}: {stderr.decode(errors='ignore')}")
+
+    def add_cues(self, sources, cues, gain=1.0, bus=master_bus):
+        """Mixes a cue layout (a cue_dtype array) whose cue ids index sources (filenames or samples).
+        Each distinct (cue, length, fade) is rendered with its gain and fades once; its rows are then slice-adds."""
+        lengths = np.round((cues['end'] - cues['start']) * self.sample_rate).astype(np.int64)
+        rendered = {}
+        for row, length in zip(cues, lengths):
+            key = (int(row['cue']), int(length), float(row['fade']))
+            if key not in rendered:
+                source = sources[key[0]]
+                samples = self.pcm(source) if isinstance(source, str) else source
+                samples = samples[:length]
+                offsets = np.arange(len(samples))
+                envelope = self.__envelope(offsets, len(samples), gain, key[2], key[2])
+                rendered[key] = samples * (np.float32(envelope) if np.ndim(envelope) == 0 else envelope[:, None])
+            self.add(rendered[key], start=row['start'], bus=bus)
+
+    def finalize(self, target_lufs=None):
+        """Mixes the ducked bus into the master under the sidechain gain curve and measures the result's loudness
+        and peak, one block at a time. With target_lufs, the output gain is set to reach it without the peak
+        exceeding peak_ceiling_dbfs; clip() and write() apply that gain. Mixing is closed afterwards."""
+        if self.finalized:
+            return
+        self.finalized = True
+        if not self.ducked_placements and target_lufs is None:
+            return
+        duck_gain = self.duck_gain_curve() if self.ducked_placements else None
+        window_centers = (np.arange(len(self.sidechain)) + 0.5) * self.duck_window
+        meter = LoudnessMeter(self.sample_rate, self.channels) if target_lufs is not None else None
+        peak = 0.0
+        block = mix_block_seconds * self.sample_rate
+        for lo in range(0, len(self.master), block):
+            hi = min(lo + block, len(self.master))
+            placements = [(max(lo, p_lo), min(hi, p_hi), placement) for p_lo, p_hi, placement in self.ducked_placements
+                          if p_lo < hi and p_hi > lo]
+            if placements:
+                gain = np.interp(np.arange(lo, hi), window_centers, duck_gain).astype(np.float32)[:, None]
+                for p_lo, p_hi, placement in placements:
+                    self.master[p_lo:p_hi] += self.__place(placement, p_lo, p_hi) * gain[p_lo - lo:p_hi - lo]
+            if meter is not None:
+                meter.push(self.master[lo:hi])
+                peak = max(peak, float(np.abs(self.master[lo:hi]).max()))
+        self.ducked_placements = []
+        if meter is None:
+            return
+        self.loudness = meter.integrated()
+        self.peak = peak
+        if np.isfinite(self.loudness) and peak > 0:
+            ceiling = 10 ** (peak_ceiling_dbfs / 20) / peak
+            self.output_gain = float(min(10 ** ((target_lufs - self.loudness) / 20), ceiling))
+        logger.info(f"Mix loudness {self.loudness:.1f} LUFS, peak {peak:.3f}; output gain {self.output_gain:.3f} for {target_lufs} LUFS")
+
+    def duck_gain_curve(self):
+        """Gain of the ducked bus per duck window: duck_depth_db wherever narration is active (held across short
+        pauses), unity elsewhere, smoothed so the music fades rather than steps."""
+        rms = np.sqrt(self.sidechain / (self.duck_window * self.channels))
+        with np.errstate(divide='ignore'):
+            active = 20 * np.log10(rms) > duck_threshold_dbfs
+        target = np.where(active, 10 ** (duck_depth_db / 20), 1.0)
+        hold = max(1, int(round(duck_hold_seconds / duck_window_seconds)))
+        padded = np.pad(target, (hold // 2, hold - 1 - hold // 2), constant_values=1.0)
+        held = sliding_window_view(padded, hold).min(axis=1)
+        smoothing = max(1, int(round(duck_smoothing_seconds / duck_window_seconds)))
+        padded = np.pad(held, (smoothing // 2, smoothing - 1 - smoothing // 2), mode='edge')
+        return np.convolve(padded, np.full(smoothing, 1.0 / smoothing), mode='valid')
+
+    def clip(self):
+        self.finalize()
+        clip = AudioArrayClip(self.master, fps=self.sample_rate)
+        return clip.with_volume_scaled(self.output_gain) if self.output_gain != 1.0 else clip
+
+    def write(self, filename, codec="aac"):
+        """Encodes the master (with the output gain) to filename, clipped to full scale. The master is piped to
+        ffmpeg a block at a time through one reused buffer, so no full-length copy of it is made."""
+        self.finalize()
+        cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-y", "-f", "f32le", "-ar", str(self.sample_rate),
+               "-ac", str(self.channels), "-i", "pipe:0", "-c:a", codec, filename]
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        block = mix_block_seconds * self.sample_rate
+        buffer = np.empty((min(block, len(self.master)), self.channels), dtype=np.float32)
+        try:
+            for lo in range(0, len(self.master), block):
+                pcm = buffer[:min(block, len(self.master) - lo)]
+                np.multiply(self.master[lo:lo + len(pcm)], np.float32(self.output_gain), out=pcm)
+                np.clip(pcm, -1.0, 1.0, out=pcm)
+                process.stdin.write(memoryview(pcm).cast('B'))
+            process.stdin.close()
+        except BrokenPipeError:
+            pass # ffmpeg exited early; its error is reported below
+        stderr = process.stderr.read()
+        process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"Failed to encode mixed audio to {filename}: {stderr.decode(errors='ignore')}")
+
+    def __mix(self, placed, lo, hi, bus):
+        self.master[lo:hi] += placed
+        if bus == narration_bus:
+            # Energy per duck window of the global grid; the first window may be partial.
+            first_window = -(-lo // self.duck_window) * self.duck_window
+            bounds = np.concatenate([[0], np.arange(first_window - lo, hi - lo, self.duck_window)])
+            bounds = np.unique(bounds[bounds < hi - lo])
+            energy = np.square(placed, dtype=np.float64).sum(axis=1)
+            self.sidechain[(lo + bounds) // self.duck_window] += np.add.reduceat(energy, bounds)
+
+    def __place(self, placement, lo, hi):
+        """Samples lo to hi (master positions) of a placement (see add), with its gain, fades and speed applied."""
+        samples, first, length, gain, fade_in, fade_out, speed = placement
+        offsets = np.arange(lo - first, hi - first)
+        if speed == 1:
+            placed = samples[offsets[0]:offsets[-1] + 1]
+        else:
+            placed = samples[np.minimum((offsets * speed).astype(np.int64), len(samples) - 1)]
+        envelope = self.__envelope(offsets, length, gain, fade_in, fade_out)
+        if np.ndim(envelope) == 0:
+            return placed * np.float32(envelope) if envelope != 1 else placed
+        return placed * envelope[:, None]
+
+    def __envelope(self, offsets, length, gain, fade_in, fade_out):
+        """Gain per placed sample; a plain scalar when there are no fades."""
+        if not fade_in and not fade_out:
+            return gain
+        t = offsets.astype(np.float32) / self.sample_rate
+        envelope = np.full(len(offsets), gain, dtype=np.float32)
+        if fade_in:
+            envelope *= np.minimum(t / fade_in, 1)
+        if fade_out:
+            envelope *= np.clip((length / self.sample_rate - t) / fade_out, 0, 1)
+        return envelope
@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from moviepy import ColorClip, VideoClip, VideoFileClip
+
+logger = logging.getLogger(__name__)
+
+default_max_open_decoders = int(os.environ.get('RENDER_MAX_OPEN_DECODERS', 8))
+
+
+class LazyClipSource(object):
+    """One video decoder (ffmpeg reader) for a file, opened on first use and closable at any time;
+    a later request simply reopens it. timeline_end is when the render no longer needs it."""
+    def __init__(self, manager, filename, transform=None, timeline_end=None):
+        self.manager = manager
+        self.filename = filename
+        self.transform = transform
+        self.timeline_end = timeline_end
+        self.file_clip = None
+        self.clip = None
+
+    @property
+    def is_open(self):
+        return self.file_clip is not None
+
+    def open(self):
+        self.file_clip = VideoFileClip(self.filename, audio=False)
+        self.clip = self.transform(self.file_clip) if self.transform is not None else self.file_clip
+
+    def close(self):
+        if self.file_clip is not None:
+            try: self.file_clip.close()
+            except Exception as e: logger.warning(f"Error closing reader for {self.filename}: {e}")
+        self.file_clip = None
+        self.clip = None
+
+    def get_frame(self, t):
+        return self.manager.acquire(self).get_frame(t)
+
+
+class ClipReaderManager(object):
+    """Bounds how many video decoders a render holds.
+    Clips built by video_clip know their size and duration up front (from probed metadata) and only open their
+    reader when the compositor first asks for a frame, i.e. at their start time. advance(t),
+    called by the frame pipeline before each frame is composed (before_frame), closes readers whose timeline_end
+    has passed, and at most max_open readers are open at once: the least recently used one is closed (and reopened
+    if needed later)."""
+    def __init__(self, max_open=default_max_open_decoders):
+        self.max_open = max(1, max_open)
+        self.sources = []
+        self.open_sources = OrderedDict()
+        self.lock = threading.RLock()
+        self.opened_count = 0
+        self.peak_open = 0
+
+    def video_clip(self, filename, source_size, duration, fps, transform=None, timeline_end=None):
+        """A video clip (no audio) of filename, whose display size is source_size. transform is applied to the
+        VideoFileClip on open; the clip's size is found by running it on a blank frame of source_size instead."""
+        source = self.__add_source(filename, transform=transform, timeline_end=timeline_end)
+        size = tuple(source_size)
+        if transform is not None:
+            size = transform(ColorClip(size=size, color=(0, 0, 0), duration=1)).get_frame(0).shape[:2][::-1]
+        clip = VideoClip()
+        clip.frame_function = source.get_frame
+        clip.size = size
+        clip.duration = duration
+        clip.end = duration
+        clip.fps = fps
+        return clip
+
+    def acquire(self, source):
+        with self.lock:
+            if source.is_open:
+                self.open_sources.move_to_end(id(source))
+                return source.clip
+            while len(self.open_sources) >= self.max_open:
+                _, lru = self.open_sources.popitem(last=False)
+                logger.debug(f"Closing least recently used reader {lru.filename}")
+                lru.close()
+            source.open()
+            self.open_sources[id(source)] = source
+            self.opened_count += 1
+            self.peak_open = max(self.peak_open, len(self.open_sources))
+            return source.clip
+
+    def advance(self, t):
+        """Closes every open reader whose timeline_end is before t."""
+        with self.lock:
+            for key, source in list(self.open_sources.items()):
+                if source.timeline_end is not None and source.timeline_end < t:
+                    del self.open_sources[key]
+                    source.close()
+
+    def close_all(self):
+        with self.lock:
+            for source in self.open_sources.values():
+                source.close()
+            self.open_sources.clear()
+        logger.info(f"Reader manager: {len(self.sources)} sources, {self.opened_count} opens, peak {self.peak_open} open (max {self.max_open})")
+
+    def __add_source(self, filename, transform=None, timeline_end=None):
+        source = LazyClipSource(self, filename, transform, timeline_end)
+        self.sources.append(source)
+        return source
@@ -1,8 +1,10 @@
+import bisect
 import random
 import os
 import json
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from moviepy import *
 import numpy as np
@@ -14,10 +16,18 @@ import scipy.signal
 import matplotlib.pyplot as plt
 from s3_wrapper import upload_file_via_presigned_url, download_file_via_presigned_url
 
-from gemini import GeminiClient
+from transcript_analysis import TranscriptAnalyzer
+from stage_timings import StageTimings
+from decoded_audio import DecodedAudio, asr_sample_rate, default_analysis_sample_rate
+from transcription import TranscriptionEngine
+from transcript_writer import create_transcript_writer, default_transcript_format, get_transcript_writer_class
 
 logger = logging.getLogger(__name__)
 
+peak_reference_sample_rate = 22050
+peak_hop_length = 512
+progressive_upload_interval_seconds = 15
+
 
 class ContextGenerator(object):
     def __new__(cls):
@@ -30,16 +40,31 @@ class ContextGenerator(object):
         pass
 
 
-    def transcribe_video_to_cloud(self, sourceRemoteS3Url, sinkRemoteS3Url):
+    def transcribe_video_to_cloud(self, sourceRemoteS3Url, sinkRemoteS3Url, transcriptFormat=default_transcript_format):
         logger.debug('attempting to transcribe resources: src ' + sourceRemoteS3Url + ' : dest ' + sinkRemoteS3Url)
+        writer_class = get_transcript_writer_class(transcriptFormat)
         local_video_filename = str(random.randint(0, 9999)) + "tmp_video.mp4"
         successful_download = download_file_via_presigned_url(sourceRemoteS3Url, local_video_filename)
         if not successful_download:
             logger.error('failed to download source video file for transcription: ' + sourceRemoteS3Url)
             return False
-        transcript_filename = str(random.randint(0, 9999)) + "tmp_transcript.json"
-        self.__generate_transcription_file(local_video_filename, transcript_filename, 'en')
-        successful_upload = upload_file_via_presigned_url(sinkRemoteS3Url, transcript_filename)
+        transcript_filename = str(random.randint(0, 9999)) + "tmp_transcript" + writer_class.file_extension
+        last_upload = [time.monotonic()]
+        def upload_partial(segments):
+            # Streamable formats are valid after every chunk; re-put the growing file so readers can start early.
+            if not writer_class.streamable or time.monotonic() - last_upload[0] < progressive_upload_interval_seconds:
+                return
+            last_upload[0] = time.monotonic()
+            try:
+                upload_file_via_presigned_url(sinkRemoteS3Url, transcript_filename, content_type=writer_class.content_type)
+            except Exception as e:
+                logger.warning('partial transcript upload failed, continuing: ' + str(e))
+
+        with DecodedAudio(local_video_filename, analysis_sample_rate=asr_sample_rate) as decoded_audio:
+            self.__generate_transcription_file(local_video_filename, transcript_filename, 'en',
+                                               audio=decoded_audio.asr_samples, audioPath=decoded_audio.asr_path,
+                                               onSegments=upload_partial, transcriptFormat=transcriptFormat)
+        successful_upload = upload_file_via_presigned_url(sinkRemoteS3Url, transcript_filename, content_type=writer_class.content_type)
         if not successful_upload:
             logger.error('failed to upload transcription file: ' + sinkRemoteS3Url)
             return False
@@ -49,123 +74,150 @@ class ContextGenerator(object):
         os.remove(transcript_filename)
         return True
     
-    def get_noteable_timestamps(self, sourceVideoFilename, saveAsTranscriptionFilename='', saveAsFramesDirectory='.', sourceAudioFilename='.', language = 'en'):
-        transcriptSegments = self.__generate_transcription_file(filename=sourceVideoFilename, saveAsFilename=saveAsTranscriptionFilename, language=language)
-        noteable_times, metadata = self.__analyze_transcript(transcriptSegments)
-        
-        peak_audio_times = self.__generate_peaks(filename=sourceVideoFilename)
-        joined_times, joined_metadata = self.__left_join_times(peak_audio_times, noteable_times, metadata)
+    def get_noteable_timestamps(self, sourceVideoFilename, saveAsTranscriptionFilename='', saveAsFramesDirectory='.', sourceAudioFilename='.', language = 'en', joinWindowSeconds = 60, analysisSampleRate = default_analysis_sample_rate):
+        # Stage DAG: decode -> (transcribe -> analyze), decode -> peaks; (analyze, peaks) -> join.
+        # Peaks run alongside transcription, and transcript slices go to the analyzer as soon as they exist.
+        if not joinWindowSeconds > 0:
+            # Match scores are distances relative to the window.
+            raise ValueError("joinWindowSeconds must be positive, got " + str(joinWindowSeconds))
+        timings = StageTimings('noteable-timestamps')
+        with timings.stage('decode'):
+            # Straight from the original: only the audio stream is decoded.
+            decoded_audio = DecodedAudio(sourceVideoFilename, analysis_sample_rate=analysisSampleRate)
 
-        asc_join_times = sorted(joined_times)
-        compacted_times = self.__compact_times(asc_join_times)
+        analysis = self.__get_transcript_analyzer().start_session()
+        def on_segments(segments):
+            timings.begin('analyze', depends_on=['transcribe'])
+            analysis.submit(segments)
+
+        try:
+            with analysis, ThreadPoolExecutor(max_workers=1) as executor:
+                peaks_future = executor.submit(timings.timed, 'peaks', self.__generate_peaks,
+                                               decoded_audio.analysis_samples, decoded_audio.analysis_sample_rate, depends_on=['decode'])
+                with timings.stage('transcribe', depends_on=['decode']):
+                    self.__generate_transcription_file(filename=sourceVideoFilename, saveAsFilename=saveAsTranscriptionFilename,
+                                                       language=language, audio=decoded_audio.asr_samples, audioPath=decoded_audio.asr_path,
+                                                       onSegments=on_segments)
+                timings.begin('analyze', depends_on=['transcribe'])
+                noteable_times, metadata = analysis.finish()
+                timings.end('analyze')
+                peak_audio_times = peaks_future.result()
+        finally:
+            decoded_audio.close()
+
+        with timings.stage('join', depends_on=['analyze', 'peaks']):
+            joined_times, joined_scores, joined_metadata = self.__left_join_times(peak_audio_times, noteable_times, metadata, joinWindowSeconds)
+            compacted_times = self.__compact_times(joined_times, joined_scores, joinWindowSeconds)
         for i in compacted_times:
             print('notable time: ' + str(i))
+        timings.report()
         
         return compacted_times, joined_metadata
 
-    def __compact_times(self, times):
+    def __compact_times(self, times, scores, windowSeconds):
+        """Windowed non-maximum suppression.
+        Keeps the highest scoring time, drops every other time within windowSeconds of it, and repeats.
+        Returns the kept times in ascending order."""
         if len(times) == 0:
-            return times
-        compacted_times = []
-        compacted_times.append(times[0])
-        minute = 60
-        for i in times:
-            if compacted_times[len(compacted_times) - 1] + minute > i:
+            return []
+        times = np.asarray(times, dtype=float)
+        scores = np.asarray(scores, dtype=float)
+        # Highest score first; earlier time wins ties.
+        order = np.lexsort((times, -scores))
+        kept = []
+        for idx in order:
+            t = times[idx]
+            pos = bisect.bisect_left(kept, t)
+            if pos > 0 and t - kept[pos - 1] < windowSeconds:
                 continue
-            compacted_times.append(i)
+            if pos < len(kept) and kept[pos] - t < windowSeconds:
+                continue
+            kept.insert(pos, t)
 
-        return compacted_times
+        return [float(t) for t in kept]
     
-    def __left_join_times(self, leftTimes, rightTimes, metadata):
+    def __left_join_times(self, leftTimes, rightTimes, metadata, windowSeconds):
+        """Matches audio peaks (left) to LLM flagged moments (right) within windowSeconds.
+        Both sides are sorted once and matched by binary search, O((n+m) log n).
+        Returns the matched peak times, their match scores in [0, 1] (1 is an exact hit, 0 the window edge),
+        and the metadata rows that have a peak within the window (annotated with MatchScore)."""
+        peaks = np.sort(np.asarray(leftTimes, dtype=float))
         if len(rightTimes) == 0:
-            return leftTimes
-        join = []
+            # Nothing flagged by the LLM; fall back to the raw peaks.
+            return peaks.tolist(), [0.0] * len(peaks), []
+        moments = np.sort(np.asarray(rightTimes, dtype=float))
+        peak_distances = self.__nearest_distances(moments, peaks)
+        peak_matches = peak_distances <= windowSeconds
+        peak_scores = 1.0 - peak_distances[peak_matches] / windowSeconds
+
         joined_metadata = []
         metadata_added = {}
-        for lt in leftTimes:
-            for rt in rightTimes:
-                minute = 60
-                if lt >= rt - minute or lt <= rt + minute:
-                    join.append(lt)
-                    break
-            for rtm in metadata:
-                minute = 60
-                isWithinValidTimeframe = lt >= rtm['StartSeconds'] - minute or lt <= rtm['StartSeconds'] + minute
-                if isWithinValidTimeframe and rtm['StartSeconds'] not in metadata_added:
-                    joined_metadata.append(rtm)
-                    metadata_added[rtm['StartSeconds']] = True
+        if len(metadata) > 0 and len(peaks) > 0:
+            metadata_starts = np.asarray([rtm['StartSeconds'] for rtm in metadata], dtype=float)
+            metadata_distances = self.__nearest_distances(peaks, metadata_starts)
+            for rtm, distance in zip(metadata, metadata_distances):
+                if distance > windowSeconds or rtm['StartSeconds'] in metadata_added:
+                    continue
+                rtm['MatchScore'] = round(float(1.0 - distance / windowSeconds), 3)
+                joined_metadata.append(rtm)
+                metadata_added[rtm['StartSeconds']] = True
 
-        
-        return join, joined_metadata
+        return peaks[peak_matches].tolist(), peak_scores.tolist(), joined_metadata
 
-    def __generate_transcription_file(self, filename, saveAsFilename, language):
-        audio = whisper.load_audio(filename)
-        model = whisper.load_model("tiny") # tiny, base, small, medium, large
-        results = whisper.transcribe(model, audio, language=language)
+    def __nearest_distances(self, sortedTimes, queryTimes):
+        """Distance from each query time to its nearest neighbour in sortedTimes (inf when sortedTimes is empty)."""
+        queryTimes = np.asarray(queryTimes, dtype=float)
+        if len(sortedTimes) == 0:
+            return np.full(len(queryTimes), np.inf)
+        right = np.searchsorted(sortedTimes, queryTimes)
+        left = np.clip(right - 1, 0, len(sortedTimes) - 1)
+        right = np.clip(right, 0, len(sortedTimes) - 1)
+        return np.minimum(np.abs(queryTimes - sortedTimes[left]), np.abs(sortedTimes[right] - queryTimes))
+
+    def __generate_transcription_file(self, filename, saveAsFilename, language, audio=None, audioPath=None, onSegments=None, transcriptFormat=default_transcript_format):
+        """Transcribes filename (or its already decoded 16kHz samples) into the minified transcript.
+        If saveAsFilename is set, segments are streamed to it in transcriptFormat as each chunk finishes.
+        onSegments, if given, is called with each chunk's minified segments after they are written."""
+        if audio is None:
+            audio = whisper.load_audio(filename)
         minified_result = {}
         minified_result['segments'] = []
-        minified_result['transcript'] = results['text']
-        for i, seg in enumerate(results['segments']):
-             segment = {}
-             segment['id'] = seg['id']
-             segment['text'] = seg['text']
-             segment['timestampStartSeconds'] = seg['start']
-             segment['timestampEndSeconds'] = seg['end']
-             minified_result['segments'].append(segment)
-        if len(saveAsFilename) > 0:
-            with open(saveAsFilename, "w") as f:
-                # Write data to the file
-                f.write(json.dumps(minified_result))
+        transcript_parts = []
+        writer = create_transcript_writer(transcriptFormat, saveAsFilename) if len(saveAsFilename) > 0 else None
+        try:
+            for chunk_segments in TranscriptionEngine().transcribe_iter(audio, language, audio_path=audioPath):
+                minified_segments = []
+                for seg in chunk_segments:
+                     segment = {}
+                     segment['id'] = seg['id']
+                     segment['text'] = seg['text']
+                     segment['timestampStartSeconds'] = seg['start']
+                     segment['timestampEndSeconds'] = seg['end']
+                     minified_segments.append(segment)
+                     transcript_parts.append(seg['text'])
+                minified_result['segments'] += minified_segments
+                if writer is not None:
+                    writer.write_segments(minified_segments)
+                if onSegments is not None and len(minified_segments) > 0:
+                    onSegments(minified_segments)
+        finally:
+            if writer is not None:
+                writer.close()
+        minified_result['transcript'] = "".join(transcript_parts)
         return minified_result
     
-    def __analyze_transcript(self, transcriptSegments):
-        if len(transcriptSegments['segments']) == 0:
-            return []
-        segments = transcriptSegments['segments']
-        max_slice_size = 100
-        # Generate subslices
-        analysisAgentClient = GeminiClient()
-        notable_timestamps = []
-        timestamp_metadata = []
-        for start in range(0, len(segments), max_slice_size):
-            # Generate subslices for the current chunk
-            chunk_end = min(start + max_slice_size, len(segments))
-            subslice = segments[start:chunk_end]
-            respJsonStr = analysisAgentClient.call_model_json_out(self.__get_analysis_query(), json.dumps(subslice))
-            responseData = json.loads(respJsonStr)
-            print('gemini response: ' + json.dumps(responseData))
-            notable_timestamps += responseData['AllTimestampSeconds']
-            timestamp_metadata += responseData['TimestampMetadata']
-            print('sleeping...')
-            time.sleep(10)
-
-        return notable_timestamps, timestamp_metadata
-
-    def __get_analysis_query(self):
-        request = """You are a musical scoring professional. You are able to identify emotional, climactic, and significant moments from media.
-        Your goal is to analyze the following transcript for significant moments that should be punctuated in music. Your output will be a json valid array of integers.
-        Expected json output:
-        {
-            "AllTimestampSeconds": int[],
-            "TimestampMetadata": [
-                {
-                    "StartSeconds": int,
-                    "Reason": "A reason for the inclusion of this timestamp as a noteable moment. Should include relevant details to justify its inclusion, and provide context."
-                },
-            ] 
-        }
-        ###
-        """
-        return request
+    def __get_transcript_analyzer(self):
+        if not hasattr(self, 'transcript_analyzer'):
+            self.transcript_analyzer = TranscriptAnalyzer()
+        return self.transcript_analyzer
 
     
-    def __generate_peaks(self, filename):
-        audio_file = AudioFileClip(filename)
-        temp_audio_file = str(random.randint(0, 9999)) + "tmp_audio.mp3"
-        audio_file.write_audiofile(temp_audio_file)
-        y, sr = librosa.load(temp_audio_file)
+    def __generate_peaks(self, y, sr):
+        # Peak parameters below are in STFT frames tuned for librosa's 22050Hz/512 hop;
+        # scale the hop so a frame spans the same time at any sample rate.
+        hop_length = int(round(peak_hop_length * sr / peak_reference_sample_rate))
         # Calculate STFT
-        stft = librosa.stft(y)
+        stft = librosa.stft(y, n_fft=4 * hop_length, hop_length=hop_length)
 
         # Calculate the RMS energy
         rms = librosa.amplitude_to_db(np.abs(stft), ref=np.max)
@@ -187,7 +239,7 @@ class ContextGenerator(object):
         peaks = peaks[top_peak_indices]
 
         # Convert peak indices to timestamps
-        peak_times = librosa.frames_to_time(peaks, sr=sr)
+        peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=hop_length)
         peak_amplitudes = rms[peaks]
         
         # Sort peaks by amplitude in descending order
@@ -198,7 +250,7 @@ class ContextGenerator(object):
         """for i, (time, amplitude) in enumerate(zip(peak_times, peak_amplitudes), 1):
             print(f"{i}. Time: {time:.2f} seconds | Intensity: {amplitude:.4f}")
 
-        times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=512)
+        times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length)
 
         plt.figure(figsize=(20, 10))
         plt.plot(times, rms, label='RMS Energy')
@@ -212,5 +264,4 @@ class ContextGenerator(object):
 
         print("Peak Timestamps (seconds):", peak_times)
 
-        os.remove(temp_audio_file)
         return peak_times
\ No newline at end of file
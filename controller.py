@@ -5,6 +5,8 @@ import threading
 from flasgger import Swagger
 import logging
 from s3_wrapper import generate_presigned_url
+from transcript_writer import default_transcript_format, transcript_writers
+from encoding_profiles import encoding_profiles
 app = Flask(__name__)
 app.config['SWAGGER'] = {
     'title': 'Video Renderer API',  # Optional: Set a title for your docs
@@ -49,9 +51,18 @@ def index():
 # watermarkText: string
 # contentLookupKey: string
 # mediaType: string
+# encodingProfile: optional; draft, standard or archival
+# preview: optional boolean; a low-resolution, low frame rate ultrafast draft of the same timeline
+# storyboardIntervalSeconds: optional number; a preview as a JPEG contact sheet of a frame every that many seconds
 @app.route("/video-renderer/movie", methods=["POST"])
 def create_movie():
     data = request.get_json()  # Get the JSON data from the request
+    encoding_profile = data.get('encodingProfile')
+    if encoding_profile is not None and encoding_profile not in encoding_profiles:
+        return {"error": f"Invalid encodingProfile: {encoding_profile}. Expected one of {', '.join(encoding_profiles)}"}, 400
+    storyboard_interval = data.get('storyboardIntervalSeconds')
+    if not movie_render.is_valid_storyboard_interval(storyboard_interval):
+        return {"error": f"Invalid storyboardIntervalSeconds: {storyboard_interval}. Expected a positive number"}, 400
     def render_movie():
         inst = movie_render.MovieRenderer()
         inst.perform_render(is_short_form=data["isShortForm"],
@@ -60,7 +71,10 @@ def create_movie():
                             language=data["language"],
                             watermark_text=data["watermarkText"],
                             local_save_as=data["contentLookupKey"],
-                            filepath_prefix=data["filepathPrefix"])
+                            filepath_prefix=data["filepathPrefix"],
+                            encoding_profile=encoding_profile,
+                            preview=data.get("preview", False),
+                            storyboard_interval=storyboard_interval)
     t1 = threading.Thread(target=render_movie)
     t1.start()
     return "Ok"
@@ -125,8 +139,17 @@ def create_transcription():
               example: "https://your-bucket.s3.region.amazonaws.com/videos/input.mp4?AWSAccessKeyId=..."
             sinkPresignedS3Url:
               type: string
-              description: A valid S3 presigned URL allowing PUT access for uploading the resulting transcription JSON file.
+              description: A valid S3 presigned URL allowing PUT access for uploading the resulting transcription file.
               example: "https://your-bucket.s3.region.amazonaws.com/transcripts/output.json?AWSAccessKeyId=..."
+            transcriptFormat:
+              type: string
+              enum: [json, jsonl, srt, vtt]
+              default: json
+              description: >
+                  Output format. json is the original {segments, transcript} document, uploaded once complete.
+                  jsonl (one segment per line, application/x-ndjson), srt (application/x-subrip) and vtt (text/vtt)
+                  are re-uploaded to the sink as segments are transcribed, so the sink can be read before the job
+                  ends; the sink URL must be presigned for the matching ContentType.
           required:
             - sourcePresignedS3Url
             - sinkPresignedS3Url
@@ -165,9 +188,12 @@ def create_transcription():
         if not source_url: missing.append("sourcePresignedS3Url")
         if not sink_url: missing.append("sinkPresignedS3Url")
         return {"error": f"Missing required fields: {', '.join(missing)}"}, 400
+    transcript_format = data.get('transcriptFormat', default_transcript_format)
+    if transcript_format not in transcript_writers:
+        return {"error": f"Invalid transcriptFormat: {transcript_format}. Expected one of {', '.join(transcript_writers)}"}, 400
     def generate_context():
         inst = context_generator.ContextGenerator()
-        inst.transcribe_video_to_cloud(data['sourcePresignedS3Url'], data['sinkPresignedS3Url'])
+        inst.transcribe_video_to_cloud(data['sourcePresignedS3Url'], data['sinkPresignedS3Url'], transcript_format)
 
     t1 = threading.Thread(target=generate_context, daemon=True)
     t1.start()
@@ -226,6 +252,11 @@ def create_video_cuts():
               type: boolean
               description: When true, adds subtitles to your video per-spoken-word for highest engagement.
               example: true
+            encodingProfile:
+              type: string
+              description: Encoder quality/speed tier for the cuts. Defaults to the server's ENCODING_PROFILE (standard).
+              enum: ["draft", "standard", "archival"]
+              example: "standard"
             Cuts:
               type: array
               description: A list of cuts to be generated from the source video.
@@ -305,6 +336,9 @@ def create_video_cuts():
         errors.append("allowCropping must be a boolean (true or false).")
     if not isinstance(enable_subtitles, bool):
         errors.append("enableSubtitles must be a boolean (true or false).")
+    encoding_profile = data.get('encodingProfile')
+    if encoding_profile is not None and encoding_profile not in encoding_profiles:
+        errors.append(f"encodingProfile must be one of {', '.join(encoding_profiles)}.")
     if not isinstance(cuts_data, list) or not cuts_data:
         errors.append("Cuts must be a non-empty list/array.")
     else:
@@ -339,13 +373,13 @@ def create_video_cuts():
     # --- End Input Validation ---
 
     # Define the function to run in a thread (pass validated data)
-    def process_video_cuts_async(source, ratio, cropping, subtitles, cuts):
+    def process_video_cuts_async(source, ratio, cropping, subtitles, cuts, encoding_profile):
         inst = movie_render.MovieRenderer()
-        inst.create_subclips(source, ratio, cropping, subtitles, cuts)
+        inst.create_subclips(source, ratio, cropping, subtitles, cuts, encoding_profile)
 
     # Start the background process
     app.logger.info("Request validated. Starting background thread for video cutting.")
-    thread_args = (source_url, desired_ratio, allow_cropping, enable_subtitles, cuts_data)
+    thread_args = (source_url, desired_ratio, allow_cropping, enable_subtitles, cuts_data, encoding_profile)
     t1 = threading.Thread(target=process_video_cuts_async, args=thread_args, daemon=True)
     t1.start()
 
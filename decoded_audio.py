@@ -0,0 +1,130 @@
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+logger = logging.getLogger(__name__)
+
+asr_sample_rate = 16000 # Whisper's native rate.
+default_analysis_sample_rate = 22050 # librosa's default; peak detection is tuned for it.
+npy_header_size = 128
+read_chunk_bytes = 1 << 20
+
+
+class DecodedAudio(object):
+    """Per-job decoded audio artifact.
+    The source's first audio stream is decoded by a single ffmpeg run into mono float32 .npy files,
+    one at 16kHz for ASR and one at the analysis rate, which every consumer then memory-maps
+    instead of decoding the source again. Use as a context manager, or call close() to delete the files."""
+    def __init__(self, source_filename, work_dir=None, analysis_sample_rate=default_analysis_sample_rate):
+        self.source_filename = source_filename
+        self.analysis_sample_rate = analysis_sample_rate
+        self.owns_work_dir = work_dir is None
+        self.work_dir = tempfile.mkdtemp(prefix="decoded_audio_") if work_dir is None else work_dir
+        self.asr_path = os.path.join(self.work_dir, "audio_" + str(asr_sample_rate) + ".npy")
+        self.analysis_path = os.path.join(self.work_dir, "audio_" + str(analysis_sample_rate) + ".npy")
+        try:
+            self.__decode()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def asr_samples(self):
+        """16kHz mono float32 samples, memory-mapped copy-on-write (safe to hand to torch.from_numpy)."""
+        return np.load(self.asr_path, mmap_mode='c')
+
+    @property
+    def analysis_samples(self):
+        """Mono float32 samples at analysis_sample_rate, memory-mapped read-only."""
+        return np.load(self.analysis_path, mmap_mode='r')
+
+    @property
+    def duration(self):
+        return len(self.asr_samples) / asr_sample_rate
+
+    def close(self):
+        for path in (self.asr_path, self.analysis_path):
+            if os.path.exists(path):
+                try: os.remove(path)
+                except OSError as e: logger.warning(f"Could not remove decoded audio {path}: {e}")
+        if self.owns_work_dir and os.path.isdir(self.work_dir):
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def __decode(self):
+        outputs = [(asr_sample_rate, self.asr_path)]
+        if self.analysis_sample_rate != asr_sample_rate:
+            outputs.append((self.analysis_sample_rate, self.analysis_path))
+        # ffmpeg decodes the input once and resamples it for each output; the first output goes to
+        # stdout, any others to extra pipes inherited under the same fd number.
+        cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-threads", "0", "-i", self.source_filename]
+        extra_pipes = []
+        for i, (sample_rate, _) in enumerate(outputs):
+            if i == 0:
+                target = "pipe:1"
+            else:
+                read_fd, write_fd = os.pipe()
+                extra_pipes.append((read_fd, write_fd))
+                target = "pipe:" + str(write_fd)
+            cmd += ["-map", "0:a:0", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", target]
+
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   pass_fds=[w for _, w in extra_pipes])
+        for _, w in extra_pipes:
+            os.close(w)
+        readers = [process.stdout] + [os.fdopen(r, 'rb') for r, _ in extra_pipes]
+        errors = []
+        threads = []
+        for reader, (_, path) in zip(readers, outputs):
+            t = threading.Thread(target=self.__write_npy, args=(reader, path, errors), daemon=True)
+            t.start()
+            threads.append(t)
+        stderr = process.stderr.read()
+        for t in threads:
+            t.join()
+        process.wait()
+        if process.returncode != 0 or errors:
+            raise RuntimeError(f"Failed to decode audio from {self.source_filename}: {stderr.decode(errors='ignore')} {errors}")
+        if len(outputs) == 1:
+            # Analysis rate is the ASR rate; share the one artifact.
+            self.analysis_path = self.asr_path
+        logger.info(f"Decoded audio for {self.source_filename}: {self.duration:.2f}s")
+
+    def __write_npy(self, reader, path, errors):
+        """Streams raw float32 into an .npy file: a fixed-size header is reserved up front and
+        filled in once the sample count is known, so nothing is buffered in memory."""
+        try:
+            with reader, open(path, 'wb') as f:
+                f.write(b'\0' * npy_header_size)
+                total_bytes = 0
+                while True:
+                    chunk = reader.read(read_chunk_bytes)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    total_bytes += len(chunk)
+                sample_count = total_bytes // 4
+                f.truncate(npy_header_size + sample_count * 4)
+                f.seek(0)
+                f.write(self.__npy_header(sample_count))
+        except Exception as e:
+            errors.append(e)
+
+    def __npy_header(self, sample_count):
+        header = "{'descr': '<f4', 'fortran_order': False, 'shape': (" + str(sample_count) + ",), }"
+        prefix = b'\x93NUMPY\x01\x00'
+        padding = npy_header_size - len(prefix) - 2 - len(header) - 1
+        header_bytes = (header + ' ' * padding + '\n').encode('latin1')
+        return prefix + struct.pack('<H', len(header_bytes)) + header_bytes
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# An SQS queue URL, or file://<directory> for a queue on a shared (or local) filesystem. Unset: segments render locally.
+chunk_queue_url = os.environ.get('RENDER_CHUNK_QUEUE')
+chunk_visibility_timeout_seconds = int(os.environ.get('RENDER_CHUNK_VISIBILITY_TIMEOUT', 600))
+chunk_render_timeout_seconds = int(os.environ.get('RENDER_CHUNK_TIMEOUT', 4 * 3600))
+chunk_wait_seconds = 20
+poll_interval_seconds = 2
+
+
+class FileChunkQueue(object):
+    """A directory used as a work queue with SQS semantics, for local runs and tests: receive() claims a message by
+    renaming it into claimed/ (atomic, so each message goes to one worker), extend() renews the claim and a claim
+    older than its visibility timeout is handed out again."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending_dir = os.path.join(directory, 'pending')
+        self.claimed_dir = os.path.join(directory, 'claimed')
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.claimed_dir, exist_ok=True)
+
+    def send(self, body):
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex}.json"
+        partial_path = os.path.join(self.directory, name + '.partial')
+        with open(partial_path, 'w') as f:
+            json.dump(body, f)
+        os.replace(partial_path, os.path.join(self.pending_dir, name))
+
+    def receive(self, visibility_timeout, wait_seconds=0):
+        """(body, handle) of the oldest pending message, or (None, None) if none arrives within wait_seconds."""
+        deadline = time.time() + wait_seconds
+        while True:
+            self.__requeue_expired(visibility_timeout)
+            for name in sorted(os.listdir(self.pending_dir)):
+                claimed_path = os.path.join(self.claimed_dir, name)
+                try:
+                    os.rename(os.path.join(self.pending_dir, name), claimed_path)
+                except FileNotFoundError:
+                    continue # claimed by another worker
+                os.utime(claimed_path)
+                with open(claimed_path) as f:
+                    return json.load(f), claimed_path
+            if time.time() >= deadline:
+                return None, None
+            time.sleep(poll_interval_seconds)
+
+    def extend(self, handle, visibility_timeout):
+        os.utime(handle)
+
+    def delete(self, handle):
+        try: os.remove(handle)
+        except FileNotFoundError: pass
+
+    def __requeue_expired(self, visibility_timeout):
+        now = time.time()
+        for name in os.listdir(self.claimed_dir):
+            claimed_path = os.path.join(self.claimed_dir, name)
+            try:
+                if now - os.path.getmtime(claimed_path) > visibility_timeout:
+                    os.rename(claimed_path, os.path.join(self.pending_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+class SqsChunkQueue(object):
+    def __init__(self, queue_url):
+        import queue_wrapper # needs AWS credentials; only imported when SQS is used
+        self.sqs = queue_wrapper.sqs
+        self.queue_url = queue_url
+
+    def send(self, body):
+        self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(body))
+
+    def receive(self, visibility_timeout, wait_seconds=0):
+        response = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=1,
+                                            VisibilityTimeout=visibility_timeout, WaitTimeSeconds=min(wait_seconds, 20))
+        if not "Messages" in response:
+            return None, None
+        message = response['Messages'][0]
+        return json.loads(message['Body']), message['ReceiptHandle']
+
+    def extend(self, handle, visibility_timeout):
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=handle, VisibilityTimeout=visibility_timeout)
+
+    def delete(self, handle):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=handle)
+
+
+def get_chunk_queue(url=None):
+    url = url or chunk_queue_url
+    if url and url.startswith('file://'):
+        return FileChunkQueue(url[len('file://'):])
+    if url and url.startswith('https://sqs.'):
+        return SqsChunkQueue(url)
+    raise ValueError("unsupported render chunk queue: " + str(url) + ". Expected an SQS queue URL or file://<directory>")
+
+
+class RenderChunkWorker(object):
+    """Renders chunk jobs from the queue: frames of a render (see MovieRenderer.render_segment) whose request, and the
+    segment file to write, are on the shared media volume. The message stays invisible to other workers while the
+    chunk renders; a failure is reported next to the segment as <segment>.failed for the coordinator."""
+    def __init__(self, queue=None):
+        self.queue = queue if queue is not None else get_chunk_queue()
+
+    def start_poll(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                logger.error("exception in render chunk worker: " + traceback.format_exc())
+                time.sleep(poll_interval_seconds)
+
+    def run_once(self, wait_seconds=chunk_wait_seconds):
+        """Renders one chunk if one arrives within wait_seconds; returns whether it did."""
+        job, handle = self.queue.receive(chunk_visibility_timeout_seconds, wait_seconds)
+        if job is None:
+            return False
+        rendered = threading.Event()
+
+        def keep_invisible():
+            while not rendered.wait(chunk_visibility_timeout_seconds / 3):
+                self.queue.extend(handle, chunk_visibility_timeout_seconds)
+
+        heartbeat = threading.Thread(target=keep_invisible, daemon=True)
+        heartbeat.start()
+        try:
+            self.__render(job)
+        finally:
+            rendered.set()
+            heartbeat.join()
+            self.queue.delete(handle)
+        return True
+
+    def __render(self, job):
+        output = job['output']
+        if os.path.exists(output):
+            return # redelivered after it was rendered
+        try:
+            with open(job['requestPath']) as f:
+                request = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Dropping chunk {job['index']} of render {job['renderId']}: its request is gone")
+            return
+        partial_path = output + '.partial.ts'
+        logger.info(f"Rendering chunk {job['index']} (frames {job['frameRange']}) of render {job['renderId']}")
+        try:
+            from movie_render import MovieRenderer
+            MovieRenderer().render_segment(request, tuple(job['frameRange']), partial_path)
+            os.replace(partial_path, output)
+        except Exception:
+            logger.error(f"Chunk {job['index']} of render {job['renderId']} failed: " + traceback.format_exc())
+            with open(output + '.failed', 'w') as f:
+                f.write(traceback.format_exc())
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+
+def render_distributed(request, frame_ranges, segment_files, queue=None, timeout=chunk_render_timeout_seconds):
+    """Publishes a chunk job per frame range of request and waits until each is rendered to its segment file.
+    request and the segments must be on the shared media volume, where request is written next to the first segment.
+    While waiting, this process renders chunks from the queue too, so the render completes even with no other worker running."""
+    queue = queue if queue is not None else get_chunk_queue()
+    worker = RenderChunkWorker(queue)
+    render_id = uuid.uuid4().hex
+    request_path = segment_files[0] + ".render.json"
+    with open(request_path, 'w') as f:
+        json.dump(request, f, default=_json_scalar)
+    try:
+        for i, (frame_range, path) in enumerate(zip(frame_ranges, segment_files)):
+            queue.send({'renderId': render_id, 'index': i, 'requestPath': request_path,
+                        'frameRange': list(frame_range), 'output': path})
+        logger.info(f"Published {len(frame_ranges)} chunks as render {render_id}")
+        deadline = time.time() + timeout
+        while True:
+            failed = [path for path in segment_files if os.path.exists(path + '.failed')]
+            if failed:
+                with open(failed[0] + '.failed') as f:
+                    raise RuntimeError(f"Rendering {failed[0]} failed: {f.read()}")
+            if all(os.path.exists(path) for path in segment_files):
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"Chunks of render {render_id} not rendered within {timeout}s")
+            worker.run_once(wait_seconds=poll_interval_seconds)
+    finally:
+        # Chunks still queued find their request gone and are dropped.
+        for path in [request_path] + [p + '.failed' for p in segment_files]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _json_scalar(value):
+    if hasattr(value, 'item'):
+        return value.item() # numpy scalars in transcripts
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(stream=sys.stdout)])
+    RenderChunkWorker().start_poll()
@@ -0,0 +1,76 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+default_encoding_profile = os.environ.get('ENCODING_PROFILE', 'standard')
+preview_encoding_profile = 'preview'
+encoder_threads = int(os.environ.get('ENCODER_THREADS', 0)) # 0: one per available CPU
+
+
+class EncodingProfile(object):
+    """libx264 settings for one quality tier.
+    gop_seconds sets the keyframe interval relative to the output fps. With preserve_source_fps the output never
+    exceeds the sources' frame rate (duplicated frames cost encode time and bits for nothing), and max_fps caps it.
+    cut_crf (default crf) is the quality of cuts and copyright-stripped videos."""
+    def __init__(self, name, preset, crf, gop_seconds, tune=None, preserve_source_fps=True, max_fps=None, cut_crf=None):
+        self.name = name
+        self.preset = preset
+        self.crf = crf
+        self.cut_crf = crf if cut_crf is None else cut_crf
+        self.gop_seconds = gop_seconds
+        self.tune = tune
+        self.preserve_source_fps = preserve_source_fps
+        self.max_fps = max_fps
+
+    @property
+    def threads(self):
+        if encoder_threads > 0:
+            return encoder_threads
+        return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+    def output_fps(self, requested_fps, source_fps=()):
+        """requested_fps, lowered to the fastest source (when preserving source fps and any source fps is known) and to max_fps."""
+        fps = requested_fps
+        known_source_fps = [f for f in source_fps if f]
+        if self.preserve_source_fps and known_source_fps:
+            fps = min(fps, max(known_source_fps))
+        if self.max_fps is not None:
+            fps = min(fps, self.max_fps)
+        return fps
+
+    def ffmpeg_params(self, fps, crf=None):
+        params = ['-crf', str(crf or self.crf), '-g', str(max(1, round(self.gop_seconds * fps)))]
+        if self.tune is not None:
+            params += ['-tune', self.tune]
+        return params
+
+    def write_params(self, fps, extra_ffmpeg_params=(), threads=None, crf=None):
+        """Keyword arguments for MoviePy's write_videofile. threads and crf override the profile's."""
+        return {
+            'codec': 'libx264',
+            'preset': self.preset,
+            'threads': threads or self.threads,
+            'ffmpeg_params': self.ffmpeg_params(fps, crf) + list(extra_ffmpeg_params),
+        }
+
+    def report(self, fps, threads=None, crf=None):
+        """What an encode used, for job results and logs; pass the same overrides as to write_params."""
+        return {'encodingProfile': self.name, 'preset': self.preset, 'crf': crf or self.crf, 'tune': self.tune,
+                'gopFrames': max(1, round(self.gop_seconds * fps)), 'fps': fps, 'threads': threads or self.threads}
+
+
+encoding_profiles = {
+    'draft': EncodingProfile('draft', preset='veryfast', crf=28, gop_seconds=2, tune='fastdecode', max_fps=30),
+    'standard': EncodingProfile('standard', preset='medium', crf=18, gop_seconds=2, cut_crf=20),
+    'archival': EncodingProfile('archival', preset='slow', crf=14, gop_seconds=4, tune='film'),
+    # Layout checks: see MovieRenderer.perform_render(preview=True).
+    'preview': EncodingProfile('preview', preset='ultrafast', crf=30, gop_seconds=2, tune='fastdecode', max_fps=15),
+}
+
+
+def get_encoding_profile(name=None):
+    name = name or default_encoding_profile
+    if name not in encoding_profiles:
+        raise ValueError("unsupported encoding profile: " + str(name) + ". Expected one of " + ", ".join(encoding_profiles))
+    return encoding_profiles[name]
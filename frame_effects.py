@@ -0,0 +1,50 @@
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+from moviepy import ImageClip
+from moviepy.Clip import Clip
+from moviepy.Effect import Effect
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FusedColorEffect(Effect):
+    """MirrorX, MultiplyColor(multiply) and LumContrast(lum, contrast, contrast_threshold) as one stage.
+    The color math is per 8-bit value, so it is precomputed into a 256-entry LUT with MoviePy's exact
+    rounding; each frame is then mirrored and mapped with a single np.take into a buffer reused across
+    frames, instead of three effects each allocating (and the contrast one float64) frames."""
+
+    multiply: float = 1.0
+    lum: float = 0
+    contrast: float = 0
+    contrast_threshold: float = 127
+    mirror_x: bool = False
+
+    def lut(self):
+        values = np.arange(256, dtype=np.float64)
+        multiplied = np.minimum(255, self.multiply * values).astype("uint8") * 1.0
+        corrected = multiplied + self.lum + self.contrast * (multiplied - float(self.contrast_threshold))
+        return np.clip(corrected, 0, 255).astype("uint8")
+
+    def apply(self, clip: Clip) -> Clip:
+        """Apply the effect to the clip."""
+        lut = self.lut()
+        columns = slice(None, None, -1) if self.mirror_x else slice(None)
+        if isinstance(clip, ImageClip):
+            # Computed once for stills, so the result must own its memory.
+            clip = clip.image_transform(lambda frame: lut[frame[:, columns]])
+        else:
+            buffer = [None]
+
+            def fused(get_frame, t):
+                frame = get_frame(t)[:, columns]
+                if buffer[0] is None or buffer[0].shape != frame.shape:
+                    buffer[0] = np.empty(frame.shape, dtype=np.uint8)
+                return np.take(lut, frame, out=buffer[0])
+
+            clip = clip.transform(fused)
+        if self.mirror_x and clip.mask is not None:
+            clip.mask = clip.mask.image_transform(lambda mask: mask[:, ::-1])
+        return clip
@@ -0,0 +1,220 @@
+import logging
+import os
+import queue
+import threading
+
+import numpy as np
+import proglog
+from PIL import Image, ImageDraw
+from moviepy import CompositeVideoClip
+from moviepy.tools import compute_position
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+from static_layers import StaticLayerClip
+
+logger = logging.getLogger(__name__)
+
+max_frames_in_flight = int(os.environ.get('RENDER_MAX_FRAMES_IN_FLIGHT', 4))
+storyboard_columns = 6
+storyboard_tile_width = 320
+
+
+class FrameCompositor(object):
+    """Composes a clip's frame at t straight into a caller's (h, w, 3) uint8 buffer.
+    For a CompositeVideoClip each layer is blended over only the region it covers, with Pillow's integer
+    paste/alpha_composite arithmetic, so frames are identical to CompositeVideoClip.frame_function's without its
+    full-frame RGBA canvas and result image per transparent layer. Over an opaque canvas Pillow's masked paste and
+    alpha_composite agree, and each layer is one 16-bit blend. A transparent background (CompositeVideoClip's default)
+    keeps an alpha plane, allocated once, until an opaque layer covers the whole frame."""
+    def __init__(self, clip):
+        self.clip = clip
+        self.size = tuple(clip.size)
+        self.alpha = None
+
+    def compose(self, t, out):
+        clip = self.clip
+        if not isinstance(clip, CompositeVideoClip):
+            _copy_into(out, clip.get_frame(t))
+            return out
+        bg = clip.bg
+        bg_alpha = _copy_into(out, bg.get_frame(t - bg.start))
+        if bg.mask:
+            bg_alpha = _mask_bytes(bg.mask.get_frame(t - bg.mask.start))
+        alpha = None
+        if bg_alpha is not None and not (bg_alpha.shape == out.shape[:2] and bg_alpha.min() == 255):
+            if self.alpha is None:
+                self.alpha = np.empty(out.shape[:2], dtype=np.uint8)
+            alpha = self.alpha
+            alpha[:] = 0
+            _fit_into(alpha, bg_alpha)
+        for layer in clip.playing_clips(t):
+            alpha = self.__compose_layer(layer, t, out, alpha)
+        return out
+
+    def __compose_layer(self, layer, t, out, alpha):
+        """Blends layer into out; returns the alpha plane, or None once the canvas is opaque."""
+        if isinstance(layer, StaticLayerClip):
+            rgb, layer_alpha = layer.layer_pixels
+            x, y = layer.layer_position
+        else:
+            ct = t - layer.start
+            rgb = layer.get_frame(ct)
+            if rgb.dtype != np.uint8:
+                rgb = rgb.astype(np.uint8)
+            layer_alpha = rgb[:, :, 3] if rgb.shape[2] == 4 else None
+            rgb = rgb[:, :, :3]
+            if layer.mask is not None:
+                layer_alpha = np.zeros(rgb.shape[:2], dtype=np.uint8)
+                _fit_into(layer_alpha, _mask_bytes(layer.mask.get_frame(ct)))
+            x, y = compute_position((rgb.shape[1], rgb.shape[0]), (out.shape[1], out.shape[0]),
+                                    layer.pos(ct), layer.relative_pos)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + rgb.shape[1], out.shape[1]), min(y + rgb.shape[0], out.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return alpha
+        region = (slice(y0, y1), slice(x0, x1))
+        source = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        if layer_alpha is None:
+            out[region] = rgb[source]
+            if alpha is None or (x1 - x0, y1 - y0) == (out.shape[1], out.shape[0]):
+                return None
+            alpha[region] = 255
+        elif alpha is None:
+            _blend_opaque(out[region], rgb[source], layer_alpha[source])
+        else:
+            _alpha_composite(out[region], alpha[region], rgb[source], layer_alpha[source])
+        return alpha
+
+
+class StreamingVideoWriter(FFMPEG_VideoWriter):
+    """FFMPEG_VideoWriter that hands each frame's own memory to the pipe instead of a bytes copy of it."""
+    def write_frame(self, img_array):
+        try:
+            self.proc.stdin.write(memoryview(img_array).cast('B'))
+        except IOError:
+            super().write_frame(img_array) # fails the same way, raising MoviePy's error with ffmpeg's output
+
+
+def write_videofile(clip, filename, fps, audio_file=None, before_frame=None, max_in_flight=None, frame_range=None,
+                    codec='libx264', preset='medium', threads=None, ffmpeg_params=None):
+    """Encodes clip as VideoClip.write_videofile does, audio_file (if any) being muxed as-is.
+    Frames are composed into max_in_flight preallocated buffers that a writer thread pipes to ffmpeg and hands back,
+    so memory stays at that many frames whatever the layer count. before_frame(t) is called before each frame.
+    frame_range (first, stop) encodes only those frames of the clip (at t = index / fps).
+    Transparency is not written: the libx264 output has none."""
+    max_in_flight = max(1, max_in_flight or max_frames_in_flight)
+    first, stop = frame_range if frame_range is not None else (0, int(clip.duration * fps))
+    compositor = FrameCompositor(clip)
+    width, height = compositor.size
+    free = queue.Queue()
+    for _ in range(max_in_flight):
+        free.put(np.empty((height, width, 3), dtype=np.uint8))
+    filled = queue.Queue()
+    errors = []
+    bar = proglog.default_bar_logger('bar')
+    with StreamingVideoWriter(filename, (width, height), fps, codec=codec, audiofile=audio_file, preset=preset,
+                              threads=threads, ffmpeg_params=ffmpeg_params) as writer:
+        def drain():
+            while True:
+                frame = filled.get()
+                if frame is None:
+                    return
+                if not errors:
+                    try: writer.write_frame(frame)
+                    except Exception as e: errors.append(e)
+                free.put(frame)
+
+        thread = threading.Thread(target=drain, daemon=True)
+        thread.start()
+        try:
+            for frame_index in bar.iter_bar(frame_index=np.arange(first, stop)):
+                if errors:
+                    break
+                t = frame_index / fps
+                if before_frame is not None:
+                    before_frame(t)
+                frame = free.get()
+                compositor.compose(t, frame)
+                filled.put(frame)
+        finally:
+            filled.put(None)
+            thread.join()
+    if errors:
+        raise errors[0]
+    logger.info(f"Wrote {filename} through {max_in_flight} frame buffers")
+
+
+def write_storyboard(clip, filename, interval, before_frame=None, columns=storyboard_columns, tile_width=storyboard_tile_width):
+    """Saves a contact sheet of clip to filename as a JPEG: its frame every interval seconds, scaled to tile_width,
+    in rows of columns tiles, each labelled with its time. before_frame(t) is called before each frame."""
+    compositor = FrameCompositor(clip)
+    width, height = compositor.size
+    tile_height = max(1, round(height * tile_width / width))
+    times = np.arange(0, clip.duration, interval)
+    rows = max(1, -(-len(times) // columns))
+    sheet = Image.new('RGB', (columns * tile_width, rows * tile_height))
+    draw = ImageDraw.Draw(sheet)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    for i, t in enumerate(times):
+        if before_frame is not None:
+            before_frame(t)
+        compositor.compose(t, frame)
+        x, y = (i % columns) * tile_width, (i // columns) * tile_height
+        sheet.paste(Image.fromarray(frame).resize((tile_width, tile_height), Image.BILINEAR), (x, y))
+        draw.text((x + 6, y + 6), f"{int(t // 60)}:{t % 60:04.1f}", fill='white', stroke_width=2, stroke_fill='black')
+    sheet.save(filename, format='JPEG', quality=85)
+    logger.info(f"Wrote {filename}: {len(times)} frames every {interval}s")
+
+
+def _copy_into(out, frame):
+    """Copies frame's color into out (top-left aligned, zero padded), as uint8. Returns its alpha channel, if any."""
+    h, w = min(out.shape[0], frame.shape[0]), min(out.shape[1], frame.shape[1])
+    if frame.shape[:2] != out.shape[:2]:
+        out[:] = 0
+    np.copyto(out[:h, :w], frame[:h, :w, :3], casting='unsafe')
+    return frame[:, :, 3].astype(np.uint8) if frame.shape[2] == 4 else None
+
+
+def _mask_bytes(mask):
+    """A float mask frame as 8-bit alpha, quantized as VideoClip.compose_on does."""
+    return (mask * 255).astype(np.uint8)
+
+
+def _fit_into(target, alpha):
+    """alpha into target, top-left aligned: cropped if larger, the rest of target left as is."""
+    h, w = min(target.shape[0], alpha.shape[0]), min(target.shape[1], alpha.shape[1])
+    target[:h, :w] = alpha[:h, :w]
+
+
+def _shift_div255(a):
+    return ((a >> 8) + a) >> 8
+
+
+def _blend_opaque(dst, src, mask):
+    """Pillow's masked paste (and alpha_composite over an opaque dst), in place: dst = div255(src * mask + dst * (255 - mask)).
+    Exact in 16 bits: the sum plus its rounding terms stays below 65536."""
+    mask = mask[:, :, None].astype(np.uint16)
+    acc = src.astype(np.uint16)
+    acc *= mask
+    np.subtract(255, mask, out=mask)
+    part = dst.astype(np.uint16)
+    part *= mask
+    acc += part
+    acc += 128
+    np.right_shift(acc, 8, out=part)
+    acc += part
+    acc >>= 8
+    dst[:] = acc
+
+
+def _alpha_composite(dst, dst_alpha, src, src_alpha):
+    """Pillow's Image.alpha_composite of src over a transparent dst, in place."""
+    sa = src_alpha.astype(np.uint32)[:, :, None]
+    da = dst_alpha.astype(np.uint32)[:, :, None]
+    out_alpha = sa * 255 + da * (255 - sa)
+    coef1 = sa * (255 * 255 * 128) // np.maximum(out_alpha, 1)
+    coef2 = 255 * 128 - coef1
+    blended = _shift_div255(src * coef1 + dst * coef2 + (0x80 << 7)) >> 7
+    visible = sa > 0
+    dst[:] = np.where(visible, blended, dst)
+    dst_alpha[:] = np.where(visible, _shift_div255(out_alpha + 0x80), da)[:, :, 0]
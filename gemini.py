@@ -1,9 +1,22 @@
+import ast
+import hashlib
 import json
 import logging
+import re
+import threading
 import time
+from collections import OrderedDict
 import vertexai
 from vertexai.generative_models import GenerativeModel, SafetySetting
 logger = logging.getLogger(__name__)
+
+analysis_model_name = "gemini-2.0-flash"
+json_repair_model_name = "gemini-1.5-flash-001"
+response_cache_ttl_seconds = 3600
+response_cache_max_entries = 512
+# A json string literal ("..."), or a python one ('...') as the literal_eval fallback accepts.
+string_literal = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'', re.DOTALL)
+
 class GeminiClient(object):
     model = None
     safety_config = [
@@ -43,22 +56,15 @@ class GeminiClient(object):
             return
         
         vertexai.init(project="three-doors-422720", location="us-west1")
+        self.models = {}
+        self.models_lock = threading.Lock()
+        self.response_cache = OrderedDict()
+        self.response_cache_lock = threading.Lock()
         self.initialized = True
         
     # API Docs: https://cloud.google.com/vertex-ai/generative-ai/docs/reference/python/latest
     def call_model(self, system_instruction, prompt_text) -> str:
-        self.model = GenerativeModel("gemini-2.0-flash",
-                                 system_instruction=system_instruction,
-                                 safety_settings=self.safety_config)
-        response = self.model.generate_content(
-            prompt_text
-            )
-        safety = "3"
-        for c in response.candidates:
-            if str(c.finish_reason) == safety:
-                logger.info("Gemini responded with safety flag.")
-                return "[EDITOR_FORBIDDEN] LLM safety flagged content."
-        return response.text
+        return self.__generate(analysis_model_name, system_instruction, prompt_text)
     
     def call_model_json_out(self, system_instruction, prompt_text) -> str:
         responseText = self.call_model(system_instruction=system_instruction,
@@ -73,10 +79,14 @@ class GeminiClient(object):
         maxRetries = 3
         if retryCount > maxRetries:
             logger.error("failed to sanitize json text")
-            return Exception("max retries exceeded for sanitizing json")
+            raise ValueError("max retries exceeded for sanitizing json")
         isValidJson = self.parse(respText)
         if isValidJson:
             return respText
+        repairedText = self.repair_json(respText)
+        if repairedText is not None:
+            logger.info("Repaired invalid json locally")
+            return repairedText
         logger.info("Detected invalid json")
         jsonInstruction = """
             The following input is invalid json.
@@ -84,19 +94,120 @@ class GeminiClient(object):
             return syntactically correct json.
             ###
         """
-        self.model = GenerativeModel("gemini-1.5-flash-001",
-                                 system_instruction=jsonInstruction,
-                                 safety_settings=self.safety_config)
-        response = self.model.generate_content(
-            respText
-            )
-        respText = response.text.replace('```json', '').replace('```', '')
+        # Not cached: a retry should get a fresh repair attempt rather than the same invalid output.
+        respText = self.__generate(json_repair_model_name, jsonInstruction, respText, use_cache=False)
+        respText = respText.replace('```json', '').replace('```', '')
         isValidJson = self.parse(respText)
         if isValidJson:
             return respText
-        time.sleep(15)
         return self.sanitize_json(respText=respText, retryCount=retryCount+1)
     
+    def repair_json(self, text):
+        """Tolerant local parse of almost-json model output.
+        Handles surrounding prose, trailing commas, python literals and unclosed brackets.
+        Returns a valid json string, or None if the text could not be repaired."""
+        start_candidates = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+        if not start_candidates:
+            return None
+        text = text[min(start_candidates):]
+        end = max(text.rfind('}'), text.rfind(']'))
+        candidates = [text[:end + 1]] if end >= 0 else []
+        candidates.append(self.__close_brackets(text))
+        for candidate in candidates:
+            candidate = self.__sub_outside_strings(r',\s*([}\]])', r'\1', candidate)
+            if self.parse(candidate):
+                return candidate
+            try:
+                pythonic = self.__sub_outside_strings(r'\btrue\b', 'True', candidate)
+                pythonic = self.__sub_outside_strings(r'\bfalse\b', 'False', pythonic)
+                pythonic = self.__sub_outside_strings(r'\bnull\b', 'None', pythonic)
+                return json.dumps(ast.literal_eval(pythonic))
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                continue
+        return None
+    
+    def __sub_outside_strings(self, pattern, replacement, text):
+        """re.sub applied only to the text between string literals, so string contents are never rewritten."""
+        parts = []
+        position = 0
+        for literal in string_literal.finditer(text):
+            parts.append(re.sub(pattern, replacement, text[position:literal.start()]))
+            parts.append(literal.group())
+            position = literal.end()
+        parts.append(re.sub(pattern, replacement, text[position:]))
+        return ''.join(parts)
+
+    def __close_brackets(self, text):
+        """Appends whatever closing quotes/brackets a truncated response is missing."""
+        stack = []
+        in_string = False
+        escaped = False
+        for ch in text:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch in '{[':
+                stack.append('}' if ch == '{' else ']')
+            elif ch in '}]' and stack and stack[-1] == ch:
+                stack.pop()
+        closed = text + ('"' if in_string else '')
+        closed = re.sub(r'[,:]\s*$', '', closed.rstrip())
+        return closed + ''.join(reversed(stack))
+    
+    def __generate(self, model_name, system_instruction, prompt_text, use_cache=True) -> str:
+        cache_key = hashlib.sha256("\x00".join([model_name, system_instruction, prompt_text]).encode('utf-8')).hexdigest()
+        cached = self.__get_cached_response(cache_key) if use_cache else None
+        if cached is not None:
+            logger.debug("gemini response cache hit: " + cache_key)
+            return cached
+        response = self.__get_model(model_name, system_instruction).generate_content(
+            prompt_text
+            )
+        safety = "3"
+        for c in response.candidates:
+            if str(c.finish_reason) == safety:
+                logger.info("Gemini responded with safety flag.")
+                return "[EDITOR_FORBIDDEN] LLM safety flagged content."
+        if use_cache:
+            self.__put_cached_response(cache_key, response.text)
+        return response.text
+    
+    def __get_model(self, model_name, system_instruction):
+        key = (model_name, system_instruction)
+        with self.models_lock:
+            if key not in self.models:
+                self.models[key] = GenerativeModel(model_name,
+                                 system_instruction=system_instruction,
+                                 safety_settings=self.safety_config)
+            self.model = self.models[key]
+            return self.model
+    
+    def __get_cached_response(self, cache_key):
+        with self.response_cache_lock:
+            entry = self.response_cache.get(cache_key)
+            if entry is None:
+                return None
+            expires_at, text = entry
+            if expires_at < time.monotonic():
+                del self.response_cache[cache_key]
+                return None
+            self.response_cache.move_to_end(cache_key)
+            return text
+    
+    def __put_cached_response(self, cache_key, text):
+        with self.response_cache_lock:
+            self.response_cache[cache_key] = (time.monotonic() + response_cache_ttl_seconds, text)
+            self.response_cache.move_to_end(cache_key)
+            while len(self.response_cache) > response_cache_max_entries:
+                self.response_cache.popitem(last=False)
+    
     def parse(self, text) -> bool:
         try:
             json.loads(text)
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+metadata_db_path = os.environ.get('MEDIA_METADATA_DB', os.path.join(tempfile.gettempdir(), "media_metadata.sqlite3"))
+max_parallel_probes = 8
+
+
+class MediaMetadata(object):
+    """The subset of an ffprobe record the renderer needs, without opening a decoder."""
+    def __init__(self, duration=0.0, width=0, height=0, fps=0.0, rotation=0, has_video=False, has_audio=False,
+                 video_codec=None, audio_codec=None, bit_rate=0, stream_types=None):
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.rotation = rotation
+        self.has_video = has_video
+        self.has_audio = has_audio
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+        self.bit_rate = bit_rate
+        self.stream_types = stream_types if stream_types is not None else []
+
+    @property
+    def size(self):
+        """Display (width, height), i.e. after applying the rotation tag the way decoders do."""
+        if self.rotation % 180 == 90:
+            return (self.height, self.width)
+        return (self.width, self.height)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    @classmethod
+    def from_ffprobe(cls, probe):
+        streams = probe.get('streams', [])
+        video = next((s for s in streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        fmt = probe.get('format', {})
+        duration = _to_float(fmt.get('duration')) or _to_float((video or audio or {}).get('duration'))
+        metadata = cls(duration=duration, has_video=video is not None, has_audio=audio is not None,
+                       bit_rate=int(_to_float(fmt.get('bit_rate'))),
+                       stream_types=[s.get('codec_type') for s in streams])
+        if video is not None:
+            metadata.width = int(video.get('width', 0))
+            metadata.height = int(video.get('height', 0))
+            metadata.fps = _to_fraction(video.get('avg_frame_rate')) or _to_fraction(video.get('r_frame_rate'))
+            metadata.video_codec = video.get('codec_name')
+            metadata.rotation = _rotation(video)
+        if audio is not None:
+            metadata.audio_codec = audio.get('codec_name')
+        return metadata
+
+
+def probe_media(filename):
+    """Container and stream metadata via ffprobe; reads headers only, no frames are decoded."""
+    cmd = [FFPROBE_BINARY, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", filename]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {filename}: {result.stderr.decode(errors='ignore')}")
+    return MediaMetadata.from_ffprobe(json.loads(result.stdout))
+
+
+class MediaMetadataCache(object):
+    """ffprobe results cached in SQLite, keyed by absolute path + mtime + size, so a file is probed once
+    until it changes. Shared by every process on the host (WAL mode); each thread gets its own connection."""
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(MediaMetadataCache, cls).__new__(cls)
+            cls.instance.initialized = False
+        return cls.instance
+
+    def __init__(self):
+        if self.initialized == True:
+            return
+        self.db_path = metadata_db_path
+        self.local = threading.local()
+        with self.__connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS media_metadata ("
+                         "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+                         "record TEXT NOT NULL, probed_at REAL NOT NULL)")
+        self.initialized = True
+
+    def probe(self, filename):
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        row = self.__connection().execute("SELECT mtime_ns, size, record FROM media_metadata WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            return MediaMetadata.from_dict(json.loads(row[2]))
+        metadata = probe_media(path)
+        with self.__connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO media_metadata (path, mtime_ns, size, record, probed_at) VALUES (?, ?, ?, ?, ?)",
+                         (path, stat.st_mtime_ns, stat.st_size, json.dumps(metadata.to_dict()), time.time()))
+        return metadata
+
+    def probe_many(self, filenames):
+        """{filename: MediaMetadata}; cache misses are probed concurrently."""
+        filenames = list(dict.fromkeys(filenames))
+        if len(filenames) <= 1:
+            return {f: self.probe(f) for f in filenames}
+        with ThreadPoolExecutor(max_workers=min(max_parallel_probes, len(filenames))) as executor:
+            return dict(zip(filenames, executor.map(self.probe, filenames)))
+
+    def __connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_fraction(value):
+    if not value or '/' not in value:
+        return _to_float(value)
+    num, den = value.split('/', 1)
+    return _to_float(num) / _to_float(den) if _to_float(den) else 0.0
+
+
+def _rotation(video_stream):
+    rotate = video_stream.get('tags', {}).get('rotate')
+    if rotate is not None:
+        return int(_to_float(rotate)) % 360
+    for side_data in video_stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(_to_float(side_data['rotation'])) % 360
+    return 0
@@ -13,20 +13,65 @@ from botocore.exceptions import ClientError
 from moviepy import *
 import numpy as np
 import whisper_timestamped as whisper
-from moviepy.audio.fx import AudioFadeIn, AudioFadeOut
-from moviepy.audio.AudioClip import concatenate_audioclips
 from s3_wrapper import download_file_via_presigned_url, upload_file_via_presigned_url
+from decoded_audio import DecodedAudio, asr_sample_rate
+from transcription import TranscriptionEngine
+from subtitle_index import SubtitleIndex
+from media_metadata import MediaMetadataCache
+from clip_readers import ClipReaderManager
+from static_layers import flatten_static_layers
+from frame_effects import FusedColorEffect
+from encoding_profiles import get_encoding_profile, preview_encoding_profile
+from frame_pipeline import write_videofile, write_storyboard
+from segmented_render import (render_segments, closed_gop_params, plan_segments, plan_aligned_segments, render_segmented, segment_filenames,
+                               concat_segments, min_segment_seconds)
+from distributed_render import chunk_queue_url, render_distributed
+from segment_cache import SegmentCache, segment_cache_dir, segment_cache_seconds
+from audio_mixer import (AudioMixer, volume_factor, speed_factor, master_bus, narration_bus, ducked_bus,
+                         target_loudness_lufs, cue_dtype)
+import subprocess
 import tempfile
+from moviepy.config import FFMPEG_BINARY
 
 logger = logging.getLogger(__name__)
 
 thumbnail_duration = .85
 narrator_padding = 3
+timed_media_types = ('Video', 'Vocal', 'Music', 'Sfx')
+preview_resolution = int(os.environ.get('RENDER_PREVIEW_RESOLUTION', 360)) # shorter side of preview renders
+# Video codecs the mp4 muxer stores as-is, so a new soundtrack can be muxed without re-encoding the picture.
+mp4_copyable_video_codecs = {'h264', 'hevc', 'mpeg4', 'av1', 'vp9'}
+# Bus levels of a render's mix, before ducking and loudness normalization.
+narration_gain = 1.7
+background_music_gain = 0.3 # music videos keep their music at 1
+video_sound_gain = 0.4
+
+
+def is_valid_storyboard_interval(value):
+    """storyboardIntervalSeconds of a render request: absent, or a positive number of seconds."""
+    return value is None or (not isinstance(value, bool) and isinstance(value, (int, float)) and value > 0)
+
+
 class RenderClip(object):
-    def __init__(self, clip, render_metadata, subtitle_segments = []):
+    """A sequence on the render timeline. start/duration are scheduled from probed metadata before any
+    decoder is opened; file-backed clips stay None until the timeline is complete and are then built as
+    lazy clips (see ClipReaderManager) with hold_duration (stills), effects and start applied in that order."""
+    def __init__(self, clip, render_metadata, subtitle_segments = [], filename=None, duration=None, media_metadata=None):
         self.clip = clip
         self.render_metadata = render_metadata
         self.subtitle_segments = subtitle_segments
+        self.filename = filename
+        self.media_metadata = media_metadata
+        self.start = 0
+        self.duration = duration if duration is not None or clip is None else clip.duration
+        self.hold_duration = None
+        self.effects = []
+        # What else decides its frames, for clips with no file (e.g. a text clip's text and color).
+        self.fingerprint = None
+
+    @property
+    def end(self):
+        return self.start + self.duration
 
 class MovieRenderer(object):
     def __new__(cls):
@@ -41,12 +86,16 @@ class MovieRenderer(object):
         ratio: str, # "Landscape" or "Portrait"
         cropping: bool, # If True, crop to fill target AR. If False, pad to fit target AR.
         subtitles: bool,
-        cuts: List[Dict[str, Any]]
+        cuts: List[Dict[str, Any]],
+        encoding_profile: str = None
     ):
         """
         Downloads source, creates subclips, applies aspect ratio/subs, uploads.
         Handles aspect ratio conversion correctly, especially with subtitles.
+        Returns the encoding report of each uploaded cut.
         """
+        profile = get_encoding_profile(encoding_profile)
+        encoding_reports = []
         logger.info(f"Starting subclip creation. Target Ratio: {ratio}, Cropping: {cropping}, Subtitles: {subtitles}, Cuts: {len(cuts)}")
 
         # Check if whisper is available if subtitles are requested
@@ -58,6 +107,7 @@ class MovieRenderer(object):
         temp_dir = None
         local_source_path = None
         whisper_segments = None
+        subtitle_index = None
 
         try:
             temp_dir = tempfile.mkdtemp(prefix="subclip_")
@@ -73,41 +123,45 @@ class MovieRenderer(object):
             if not Path(local_source_path).is_file() or os.path.getsize(local_source_path) == 0:
                 raise IOError(f"Downloaded source file is invalid or empty: {local_source_path}")
 
-            logger.info("Loading source video with MoviePy...")
-            # Load with target_resolution=None to avoid initial resize if possible
-            source_clip = VideoFileClip(local_source_path, audio=True)
-            logger.info(f"Source video loaded. Duration: {source_clip.duration:.2f}s, Size: {source_clip.size}")
+            # Duration, size and streams come from the cached ffprobe record; no decoder is opened for them.
+            source_metadata = MediaMetadataCache().probe(local_source_path)
+            logger.info(f"Source video probed. Duration: {source_metadata.duration:.2f}s, Size: {source_metadata.size}")
 
             # --- Transcription Logic ---
             if subtitles:
-                audio_path = os.path.join(temp_dir, "source_audio.aac")
-                logger.info("Attempting audio extraction for transcription...")
+                logger.info("Attempting audio decode for transcription...")
                 try:
-                    if source_clip.audio:
-                        source_clip.audio.write_audiofile(audio_path, codec='aac', bitrate='192k', logger=None)
-                        logger.info(f"Audio extracted to {audio_path}")
-                        # Use self reference as create_subclips is part of the class
-                        whisper_segments = self.__get_transcribed_text(audio_path, language="en") # Assuming 'en', make configurable
+                    if source_metadata.has_audio:
+                        # Decoded once straight from the source into a memory-mapped 16kHz buffer that Whisper
+                        # transcribes and aligns against.
+                        with DecodedAudio(local_source_path, work_dir=temp_dir, analysis_sample_rate=asr_sample_rate) as decoded_audio:
+                            logger.info(f"Audio decoded: {decoded_audio.duration:.2f}s")
+                            # Use self reference as create_subclips is part of the class
+                            whisper_segments = self.__get_transcribed_text(local_source_path, language="en", # Assuming 'en', make configurable
+                                                                           audio=decoded_audio.asr_samples, audio_path=decoded_audio.asr_path)
                         if whisper_segments is None:
                             logger.warning("Transcription failed or returned no segments. Subtitles will be skipped for all clips.")
                         else:
                             logger.info(f"Transcription complete. Found {len(whisper_segments)} segments.")
+                            subtitle_index = SubtitleIndex(whisper_segments)
                     else:
                         logger.warning("Source video lacks audio. Cannot generate subtitles.")
                         subtitles = False # Disable permanently if no source audio
                 except Exception as audio_ex:
                     logger.error(f"Error during audio extraction/transcription: {audio_ex}", exc_info=True)
                     subtitles = False # Disable permanently on error
-                finally:
-                    if Path(audio_path).exists():
-                        try: os.remove(audio_path)
-                        except OSError as e: logger.warning(f"Could not remove temp audio file {audio_path}: {e}")
             # --- End Transcription Logic ---
 
+            logger.info("Loading source video with MoviePy...")
+            # Final encodes read the original; load with target_resolution=None to avoid initial resize if possible
+            source_clip = VideoFileClip(local_source_path, audio=True)
+            # Container and decoder durations can differ by a frame; never cut past either.
+            source_duration = min(source_metadata.duration, source_clip.duration) if source_metadata.duration else source_clip.duration
+
             # Process each cut
             for i, cut_info in enumerate(cuts):
                 start_time = cut_info.get('startTimeSeconds', 0.0)
-                end_time = cut_info.get('endTimeSeconds', source_clip.duration)
+                end_time = cut_info.get('endTimeSeconds', source_duration)
                 upload_url = cut_info.get('presignedS3Url')
                 subclip_index = i + 1
 
@@ -119,9 +173,9 @@ class MovieRenderer(object):
 
                 # Validate times
                 if start_time < 0: start_time = 0
-                if end_time > source_clip.duration:
-                    logger.warning(f"Subclip {subclip_index}: end time ({end_time:.2f}s) exceeds source duration ({source_clip.duration:.2f}s). Clamping.")
-                    end_time = source_clip.duration
+                if end_time > source_duration:
+                    logger.warning(f"Subclip {subclip_index}: end time ({end_time:.2f}s) exceeds source duration ({source_duration:.2f}s). Clamping.")
+                    end_time = source_duration
                 if start_time >= end_time:
                     logger.warning(f"Skipping subclip {subclip_index}: start time ({start_time:.2f}s) not before end time ({end_time:.2f}s).")
                     continue
@@ -158,7 +212,10 @@ class MovieRenderer(object):
                     aspect_match = abs(src_aspect - target_aspect_val) < aspect_tolerance
 
                     # Base ffmpeg params (codec, quality, etc.)
-                    base_ffmpeg_params = ['-crf', '20', '-preset', 'medium']
+                    # Cuts keep the source frame rate unless the profile caps it.
+                    output_fps = profile.output_fps(source_clip.fps)
+                    profile_write_params = profile.write_params(output_fps, crf=profile.cut_crf)
+                    base_ffmpeg_params = profile_write_params['ffmpeg_params']
                     # This list will hold FFmpeg filter arguments (e.g., ['-vf', 'filter_string'])
                     vf_filter_params = []
                     # This list will hold the actual filter strings (e.g., "scale=...", "setsar=1")
@@ -200,28 +257,8 @@ class MovieRenderer(object):
                         # --- Generate and Composite Subtitles ---
                         if whisper_segments:
                            logger.info(f"Generating subtitles for subclip {subclip_index}...")
-                           relevant_segments = []
-                           subclip_duration_secs = end_time - start_time
-                           for seg in whisper_segments:
-                               # ... (Segment filtering logic - unchanged) ...
-                               seg_start = seg.get('start', 0); seg_end = seg.get('end', 0)
-                               if max(start_time, seg_start) < min(end_time, seg_end):
-                                   adj_seg = copy.deepcopy(seg)
-                                   adj_seg['start'] = max(0, seg_start - start_time)
-                                   adj_seg['end'] = min(subclip_duration_secs, seg_end - start_time)
-                                   if adj_seg['end'] > adj_seg['start']:
-                                       if 'words' in adj_seg:
-                                           adj_words = []
-                                           for word in seg.get('words', []):
-                                               word_start = word.get('start', 0); word_end = word.get('end', 0)
-                                               if max(start_time, word_start) < min(end_time, word_end):
-                                                    adj_word = copy.deepcopy(word)
-                                                    adj_word['start'] = max(0, word_start - start_time)
-                                                    adj_word['end'] = min(subclip_duration_secs, word_end - start_time)
-                                                    if adj_word['end'] > adj_word['start']: adj_words.append(adj_word)
-                                           adj_seg['words'] = adj_words
-                                           if not adj_words and not adj_seg.get('text','').strip(): continue
-                                       relevant_segments.append(adj_seg)
+                           # Binary-search slice of the prebuilt index; no scan or copy of the whole transcript per cut.
+                           relevant_segments = subtitle_index.slice(start_time, end_time).segments()
 
                            if relevant_segments:
                                # Using the class's own helper method
@@ -232,6 +269,7 @@ class MovieRenderer(object):
 
                                if subtitle_clips_list:
                                    all_clips = [processed_video_clip.with_position(("center", "center"))] + subtitle_clips_list
+                                   all_clips = flatten_static_layers(all_clips, (w_target, h_target))
                                    final_clip_for_render = CompositeVideoClip(all_clips, size=(w_target, h_target))
                                    if processed_video_clip.audio:
                                        final_clip_for_render = final_clip_for_render.with_audio(processed_video_clip.audio)
@@ -288,13 +326,15 @@ class MovieRenderer(object):
                     # --- Write Video ---
                     logger.info(f"Writing final subclip {subclip_index} to {local_output_path}...")
                     write_params = {
-                        "codec": "libx264",
+                        "codec": profile_write_params['codec'],
+                        "preset": profile_write_params['preset'],
                         "audio_codec": "aac",
                         "audio_bitrate": "192k",
                         "temp_audiofile": os.path.join(temp_dir, f"temp_audio_{subclip_index}.m4a"),
                         "remove_temp": True,
                         "ffmpeg_params": final_ffmpeg_params, # Use the final calculated params
-                        "threads": os.cpu_count(),
+                        "threads": profile_write_params['threads'],
+                        "fps": output_fps,
                         "logger": 'bar',
                     }
 
@@ -326,6 +366,7 @@ class MovieRenderer(object):
                         logger.error(f"Failed to upload subclip {subclip_index}.")
                     else:
                         logger.info(f"Subclip {subclip_index} uploaded successfully.")
+                        encoding_reports.append(dict(profile.report(output_fps, crf=profile.cut_crf), cutIndex=subclip_index))
 
                 except Exception as e:
                     logger.error(f"Error processing subclip {subclip_index} ({start_time:.2f}-{end_time:.2f}): {e}", exc_info=True)
@@ -368,7 +409,8 @@ class MovieRenderer(object):
                 try: shutil.rmtree(temp_dir)
                 except Exception as e: logger.error(f"Could not remove temporary directory {temp_dir}: {e}")
 
-        logger.info("Subclip creation process finished.")
+        logger.info(f"Subclip creation process finished. Encoding: {encoding_reports}")
+        return encoding_reports
 
 
     # --- Helper: _generate_subtitle_text_clips_for_subclip ---
@@ -425,7 +467,7 @@ class MovieRenderer(object):
         logger.info(f"Generated {len(text_clips)} subtitle text clips.")
         return text_clips
     
-    def process_video_new_style(self, input_video_path: str, output_filename: str):
+    def process_video_new_style(self, input_video_path: str, output_filename: str, encoding_profile: str = None):
         """
         Processes a video file using the newer MoviePy API style:
         1. Rotates slightly (expanding frame) using with_effects([rotate(...)]).
@@ -438,7 +480,12 @@ class MovieRenderer(object):
         Args:
             input_video_path: Path to the source video file.
             output_filename: Path where the processed video will be saved.
+            encoding_profile: Name of the encoding profile; defaults to ENCODING_PROFILE.
+
+        Returns:
+            The encoding report.
         """
+        profile = get_encoding_profile(encoding_profile)
         original_clip = None
         final_clip = None
 
@@ -468,8 +515,7 @@ class MovieRenderer(object):
             # Ensure 'speedx' is actually defined/imported before this point
             sped_up_clip = rotated_clip.with_effects([
                 vfx.MultiplySpeed(factor=speed_factor),
-                vfx.MultiplyColor(1.1),
-                vfx.LumContrast(0.1, 0.4)
+                FusedColorEffect(multiply=1.1, lum=0.1, contrast=0.4)
             ])
             # --- END CORRECTION ---
             new_duration = sped_up_clip.duration # Duration is now shorter
@@ -496,6 +542,7 @@ class MovieRenderer(object):
             all_clips.append(top_line_layer)
             all_clips.append(bottom_line_layer)
             all_clips.extend(watermark_clips)
+            all_clips = flatten_static_layers(all_clips, (w_rot, h_rot))
             final_clip = CompositeVideoClip(
                 clips=all_clips,
                 size=(w_rot, h_rot)
@@ -506,18 +553,19 @@ class MovieRenderer(object):
 
             # 6. Write out the final video file
             logger.info(f"Writing final processed video to: {output_filename}")
+            output_fps = profile.output_fps(original_clip.fps)
             final_clip.write_videofile(
                 output_filename,
-                codec='libx264',
                 audio_codec='aac',
-                preset='medium',
-                ffmpeg_params=["-map_metadata", "-1", "-crf", "20"],
-                threads=os.cpu_count(),
+                fps=output_fps,
                 logger='bar',
                 temp_audiofile=f'temp-audio-{random.randint(1000,9999)}.m4a',
-                remove_temp=True
+                remove_temp=True,
+                **profile.write_params(output_fps, extra_ffmpeg_params=["-map_metadata", "-1"], crf=profile.cut_crf)
             )
-            logger.info("Video processing completed successfully.")
+            encoding_report = profile.report(output_fps, crf=profile.cut_crf)
+            logger.info(f"Video processing completed successfully. Encoding: {encoding_report}")
+            return encoding_report
 
         except NameError as ne:
             logger.error(f"NameError: {ne}. An effect function (like 'rotate' or 'speedx') might not be available.", exc_info=True)
@@ -538,134 +586,321 @@ class MovieRenderer(object):
             logger.debug("Cleanup finished.")
 
     def render_video_with_music_scoring(self, source_video_file, baseline_audio_file,
-                                        rise_audio_file, climax_audio_file, important_moments_seconds, output_filename):
-        """output_filename must end w/ .mp4"""
-        video_clip = VideoFileClip(source_video_file)
-        background_music_layer = self.__create_background_music_scoring(baseline_audio_file, rise_audio_file, climax_audio_file,
-                                                                        important_moments_seconds, video_clip.duration)
-        background_music_layer.append(video_clip.audio)
-        composite_audio = CompositeAudioClip(np.array(
-            background_music_layer
-        ))
-        composite_video = video_clip.with_audio(composite_audio).with_duration(video_clip.duration)
+                                        rise_audio_file, climax_audio_file, important_moments_seconds, output_filename,
+                                        encoding_profile=None):
+        """output_filename must end w/ .mp4. Returns the encoding report.
+        Scoring only changes the soundtrack: the mixed audio is encoded on its own and muxed next to the source's
+        untouched video stream. The video is re-encoded only if mp4 cannot hold its codec or the remux fails."""
+        profile = get_encoding_profile(encoding_profile)
+        source_metadata = MediaMetadataCache().probe(source_video_file)
+        if source_metadata.video_codec in mp4_copyable_video_codecs:
+            try:
+                mixer = self.__create_scored_audio(source_video_file, source_metadata.has_audio, baseline_audio_file, rise_audio_file,
+                                                   climax_audio_file, important_moments_seconds, source_metadata.duration)
+                encoding_report = self.__mux_scored_audio(source_video_file, mixer, output_filename, source_metadata)
+                logger.info(f"Scored {output_filename} without re-encoding video. Encoding: {encoding_report}")
+                return encoding_report
+            except Exception as e:
+                logger.warning(f"Remuxing scored audio into {source_video_file} failed; re-encoding instead: {e}")
+        else:
+            logger.info(f"mp4 cannot hold {source_metadata.video_codec} video; re-encoding {source_video_file}")
+        return self.__encode_scored_video(source_video_file, source_metadata.has_audio, baseline_audio_file, rise_audio_file,
+                                          climax_audio_file, important_moments_seconds, output_filename, profile)
+
+    def __create_scored_audio(self, source_video_file, has_audio, baseline_audio_file, rise_audio_file, climax_audio_file,
+                              important_moments_seconds, duration):
+        """AudioMixer holding the background score with the source's own sound on top."""
+        mixer = AudioMixer(duration)
+        self.__create_background_music_scoring(mixer, baseline_audio_file, rise_audio_file, climax_audio_file,
+                                               important_moments_seconds, duration)
+        if has_audio:
+            mixer.add_streamed(source_video_file, start=0)
+        return mixer
+
+    def __mux_scored_audio(self, source_video_file, mixer, output_filename, source_metadata):
+        audio_path = output_filename + ".score.m4a"
+        muxed_path = output_filename + ".partial.mp4"
+        try:
+            mixer.write(audio_path, codec="aac")
+            cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-y", "-i", source_video_file, "-i", audio_path,
+                   "-map", "0:v:0", "-map", "1:a:0", "-c", "copy", "-movflags", "+faststart", muxed_path]
+            result = subprocess.run(cmd, capture_output=True)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.decode(errors='ignore'))
+            os.replace(muxed_path, output_filename)
+        finally:
+            for path in (audio_path, muxed_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        return {'videoCodec': 'copy', 'sourceVideoCodec': source_metadata.video_codec, 'fps': source_metadata.fps, 'audioCodec': 'aac'}
+
+    def __encode_scored_video(self, source_video_file, has_audio, baseline_audio_file, rise_audio_file, climax_audio_file,
+                              important_moments_seconds, output_filename, profile):
+        video_clip = VideoFileClip(source_video_file, audio=False)
+        mixer = self.__create_scored_audio(source_video_file, has_audio, baseline_audio_file, rise_audio_file, climax_audio_file,
+                                           important_moments_seconds, video_clip.duration)
+        composite_video = video_clip.with_audio(mixer.clip()).with_duration(video_clip.duration)
         aspect_ratio = '16:9'
         if composite_video.w < composite_video.h:
             aspect_ratio = '9:16'
     
-        composite_video.write_videofile(output_filename, fps=60, audio=True, audio_codec="aac", ffmpeg_params=['-crf','18', '-aspect', aspect_ratio])
+        # The source frame rate is kept (up to the former fixed 60).
+        fps = profile.output_fps(60, [video_clip.fps])
+        composite_video.write_videofile(output_filename, fps=fps, audio=True, audio_codec="aac",
+                                        **profile.write_params(fps, extra_ffmpeg_params=['-aspect', aspect_ratio]))
         composite_video.close()
-        pass
+        video_clip.close()
+        encoding_report = profile.report(fps)
+        logger.info(f"Scored {output_filename}. Encoding: {encoding_report}")
+        return encoding_report
 
-    def __create_background_music_scoring(self, baseline_audio_file, rise_audio_file, climax_audio_file, important_moments_seconds, end_time):
+    def __create_background_music_scoring(self, mixer, baseline_audio_file, rise_audio_file, climax_audio_file, important_moments_seconds, end_time):
         reduce_to_percent = 0.2
-        base_music = AudioFileClip(baseline_audio_file).with_volume_scaled(reduce_to_percent) # 200sec
-        rise_music = AudioFileClip(rise_audio_file).with_volume_scaled(reduce_to_percent) # 60 sec
-        climax_music = AudioFileClip(climax_audio_file).with_volume_scaled(reduce_to_percent) # 30 sec
-        ordered_clips = []
-        start_time = 0
-        
-        for i, cur_timestamp in enumerate(important_moments_seconds):
-            if start_time > cur_timestamp:
-                continue
-            time_to_fill = cur_timestamp - start_time
-            num_base_copies = int(time_to_fill // base_music.duration)
-            for c in range(num_base_copies):
-                ordered_clips.append(base_music.with_start(start_time))
-                start_time += base_music.duration
-            
-            if start_time < cur_timestamp:
-                ordered_clips.append(rise_music.with_start(start_time))
-                start_time += rise_music.duration
-            
-            if i % 5 == 0:
-                ordered_clips.append(climax_music.with_start(start_time))
-                start_time += climax_music.duration
-
-        remaining_time = end_time - start_time
-        num_padding = int(remaining_time // base_music.duration)
-        for p in range(num_padding):
-            ordered_clips.append(base_music.with_start(start_time))
-            start_time += base_music.duration
+        sources = (baseline_audio_file, rise_audio_file, climax_audio_file)
+        durations = [len(mixer.pcm(f)) / mixer.sample_rate for f in sources]
+        cues = self.__schedule_music_cues(durations, important_moments_seconds, end_time)
+        mixer.add_cues(sources, cues, gain=reduce_to_percent)
 
-        return self.__crossfade_audio_clips(ordered_clips)
-    
-
-
-    def __crossfade_audio_clips(self, audio_clips, crossfade_duration=3.0):
+    def __schedule_music_cues(self, durations, important_moments_seconds, end_time, crossfade_duration=3.0):
         """
-        Crossfades a list of AudioFileClip objects using MoviePy's audio effects.
+        Lays the score out back to back as a cue_dtype array of (cue, start, end, fade) rows, cue 0/1/2 being
+        the baseline/rise/climax. Baseline loops fill up to each important moment, which gets a rise (and every
+        fifth one a climax); the rest is baseline loops, the last one cut at end_time. Every cue but the last
+        fades in and out over crossfade_duration.
 
         Parameters:
-        audio_clips (list): List of AudioFileClip objects.
-        crossfade_duration (float): Duration of crossfade in seconds.
-
-        Returns:
-        list: A list containing a single AudioClip with crossfades applied.
+        durations (list): Seconds of the baseline, rise and climax audio.
+        important_moments_seconds (list): Timestamps in ascending order.
+        end_time (float): Length of the scored video.
         """
-        if not audio_clips:
-            return []
-
-        if len(audio_clips) == 1:
-            return audio_clips
-
-        faded_clips = []
-        for i in range(len(audio_clips)):
-            clip = audio_clips[i]
-            if i > 0:
-                # Apply fade-out to the end of the previous clip
-                faded_clips[-1] = faded_clips[-1].with_effects([AudioFadeOut(duration=crossfade_duration)])
-
-            if i < len(audio_clips) - 1:
-                # Apply fade-in to the beginning of the current clip
-                clip = clip.with_effects([AudioFadeIn(duration=crossfade_duration)])
+        baseline, rise, climax = 0, 1, 2
+        base_duration = durations[baseline] # 200sec
+        starts = []
+        cue_ids = []
+        start_time = 0
 
-            faded_clips.append(clip)
+        def append_baseline_loops(count):
+            nonlocal start_time
+            starts.append(start_time + base_duration * np.arange(count))
+            cue_ids.append(np.full(count, baseline))
+            start_time += base_duration * count
 
-        # Concatenate the faded clips
-        final_clip = concatenate_audioclips(faded_clips)
+        def append_cue(cue):
+            nonlocal start_time
+            starts.append(np.array([start_time]))
+            cue_ids.append(np.array([cue]))
+            start_time += durations[cue]
 
-        return [final_clip]
+        for i, cur_timestamp in enumerate(important_moments_seconds):
+            if start_time > cur_timestamp:
+                continue
+            append_baseline_loops(int((cur_timestamp - start_time) // base_duration))
+            if start_time < cur_timestamp:
+                append_cue(rise) # 60 sec
+            if i % 5 == 0:
+                append_cue(climax) # 30 sec
+
+        append_baseline_loops(int(max(0, end_time - start_time) // base_duration))
+        if start_time < end_time:
+            append_cue(baseline) # cut short at end_time below
+
+        cue_ids = np.concatenate(cue_ids) if cue_ids else np.zeros(0, dtype=np.int32)
+        starts = np.concatenate(starts) if starts else np.zeros(0)
+        cues = np.zeros(len(cue_ids), dtype=cue_dtype)
+        cues['cue'] = cue_ids
+        cues['start'] = starts
+        cues['end'] = starts + np.asarray(durations)[cue_ids]
+        cues = cues[cues['start'] < end_time]
+        cues['end'] = np.minimum(cues['end'], end_time)
+        cues['fade'] = crossfade_duration
+        if len(cues):
+            cues['fade'][-1] = 0
+        return cues
 
     def perform_render(self, is_short_form, thumbnail_text,
                        final_render_sequences,
                        language,
                        watermark_text,
                        local_save_as,
-                       filepath_prefix) -> bool:
+                       filepath_prefix,
+                       encoding_profile=None,
+                       segments=None,
+                       preview=False,
+                       storyboard_interval=None) -> dict:
+        """segments > 1 (default RENDER_SEGMENTS) renders the picture in that many chunks, split at sequence boundaries:
+        in local processes or, with RENDER_CHUNK_QUEUE set, by the render workers polling that queue.
+        With RENDER_SEGMENT_CACHE_DIR set, segments whose content is unchanged since an earlier render are reused.
+        preview renders a quick draft of the same timeline instead (see __render_preview).
+        Returns the encoding report."""
+        # Everything another process needs to rebuild exactly this timeline; see render_segment.
+        request = dict(is_short_form=is_short_form, thumbnail_text=thumbnail_text, final_render_sequences=final_render_sequences,
+                       language=language, watermark_text=watermark_text, filepath_prefix=filepath_prefix,
+                       encoding_profile=encoding_profile)
+        # Write local file
+        target_save_path = filepath_prefix + local_save_as
+        if preview or storyboard_interval:
+            return self.__render_preview(dict(request, encoding_profile=preview_encoding_profile), target_save_path,
+                                         storyboard_interval)
+        render = self.__build_render(**request)
+        # Moviepy uses the path file extension, mp4, to determine which codec to use.
+        codec_save_path = filepath_prefix + local_save_as + ".mp4"
+        segment_count = render_segments if segments is None else segments
+        duration = render.composite_video.duration
+        if segment_cache_dir:
+            # Boundaries on sequence boundaries, so an edit to one sequence leaves the other segments' keys alone.
+            segment_seconds = segment_cache_seconds
+            if segment_count > 1:
+                segment_seconds = min(segment_seconds, max(min_segment_seconds, duration / segment_count))
+            frame_ranges = plan_aligned_segments(duration, render.fps, render.cut_points, segment_seconds)
+        else:
+            frame_ranges = plan_segments(duration, render.fps, render.cut_points, segment_count)
+        audio_path = codec_save_path + ".mix.m4a"
+        segment_files = segment_filenames(codec_save_path, len(frame_ranges))
+        threads = None
+        try:
+            render.mixer.write(audio_path, codec="aac")
+            if len(frame_ranges) > 1 or segment_cache_dir:
+                files, threads = self.__render_segments(request, render, frame_ranges, segment_files)
+                concat_segments(files, codec_save_path, audio_path)
+            else:
+                # Each frame first lets the reader manager release decoders whose clips have ended.
+                write_videofile(render.composite_video, codec_save_path, render.fps, audio_file=audio_path,
+                                before_frame=render.readers.advance,
+                                **render.profile.write_params(render.fps, extra_ffmpeg_params=render.extra_ffmpeg_params))
+        finally:
+            render.readers.close_all()
+            for path in [audio_path] + segment_files:
+                if os.path.exists(path):
+                    os.remove(path)
+        os.rename(codec_save_path, target_save_path)
+        render.composite_video.close()
+        encoding_report = dict(render.profile.report(render.fps, threads), segments=len(frame_ranges))
+        logger.info(f"Rendered {target_save_path} in {len(frame_ranges)} segment(s). Encoding: {encoding_report}")
+        return encoding_report
+
+    def __render_preview(self, request, target_save_path, storyboard_interval=None):
+        """Renders request with the preview profile (its fps and preset) in one pass, its timeline laid out at
+        preview_resolution lines; with storyboard_interval (seconds), a contact sheet (JPEG) of a frame every that many
+        seconds instead. Returns the encoding report."""
+        render = self.__build_render(**request, with_audio=storyboard_interval is None, preview=True)
+        codec_save_path = target_save_path + ".mp4"
+        audio_path = codec_save_path + ".mix.m4a"
+        try:
+            if storyboard_interval:
+                write_storyboard(render.composite_video, target_save_path, storyboard_interval,
+                                 before_frame=render.readers.advance)
+            else:
+                render.mixer.write(audio_path, codec="aac")
+                write_videofile(render.composite_video, codec_save_path, render.fps, audio_file=audio_path,
+                                before_frame=render.readers.advance,
+                                **render.profile.write_params(render.fps, extra_ffmpeg_params=render.extra_ffmpeg_params))
+                os.rename(codec_save_path, target_save_path)
+        finally:
+            render.readers.close_all()
+            render.composite_video.close()
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+        if storyboard_interval:
+            encoding_report = {'storyboardIntervalSeconds': storyboard_interval}
+        else:
+            encoding_report = render.profile.report(render.fps)
+        logger.info(f"Rendered preview {target_save_path}. Encoding: {encoding_report}")
+        return encoding_report
+
+    def __render_segments(self, request, render, frame_ranges, segment_files):
+        """Encodes render's frame ranges as segments, except those found in the segment cache. Returns the segment
+        files to join, in order, and the encoder threads of each local encode (None if there were none). New segments
+        are added to the cache."""
+        cache = SegmentCache() if segment_cache_dir else None
+        params = dict(render.profile.write_params(render.fps, extra_ffmpeg_params=render.extra_ffmpeg_params + closed_gop_params),
+                      threads=None, fps=render.fps, size=render.composite_video.size)
+        keys = [cache.key(render.timeline, frame_range, params) if cache else None for frame_range in frame_ranges]
+        files = [cache.get(key) if cache else None for key in keys]
+        dirty = [i for i, path in enumerate(files) if path is None]
+        if cache:
+            logger.info(f"Reusing {len(frame_ranges) - len(dirty)} of {len(frame_ranges)} segments from the segment cache")
+        dirty_ranges = [frame_ranges[i] for i in dirty]
+        dirty_files = [segment_files[i] for i in dirty]
+        segment_request = dict(request, transcripts=render.transcripts)
+        threads = None
+        if len(dirty) == 1:
+            self.__encode_segment(render, dirty_ranges[0], dirty_files[0])
+            threads = render.profile.threads
+        elif dirty and chunk_queue_url:
+            render_distributed(segment_request, dirty_ranges, dirty_files) # workers pick their own thread counts
+        elif dirty:
+            threads = render_segmented(segment_request, dirty_ranges, dirty_files)
+        for i in dirty:
+            files[i] = cache.put(keys[i], segment_files[i]) if cache else segment_files[i]
+        return files, threads
+
+    def render_segment(self, request, frame_range, filename, threads=None):
+        """Encodes frames [first, stop) of the video perform_render makes from request (its arguments plus the
+        transcripts that make the timeline reproducible) to filename: picture only, opening on a closed GOP."""
+        render = self.__build_render(**request, with_audio=False)
+        try:
+            self.__encode_segment(render, frame_range, filename, threads)
+        finally:
+            render.readers.close_all()
+            render.composite_video.close()
+
+    def __encode_segment(self, render, frame_range, filename, threads=None):
+        write_videofile(render.composite_video, filename, render.fps, frame_range=frame_range,
+                        before_frame=render.readers.advance,
+                        **render.profile.write_params(render.fps, extra_ffmpeg_params=render.extra_ffmpeg_params + closed_gop_params,
+                                                      threads=threads))
+
+    def __build_render(self, is_short_form, thumbnail_text, final_render_sequences, language, watermark_text,
+                       filepath_prefix, encoding_profile=None, transcripts=None, with_audio=True, preview=False):
+        """The render's timeline: the composite (its file clips not yet opened), the mixed soundtrack (with_audio),
+        the output fps and encoder settings, the sequence boundaries and, for the segment cache, what is shown when
+        (timeline: (start, end, description) entries). transcripts (narration filename -> segments) skips
+        transcription, so the same request rebuilds it exactly. preview lays everything out at preview_resolution
+        lines instead of 1080, so no frame is composed at full size."""
+        profile = get_encoding_profile(encoding_profile)
+        width, height = (1080, 1920) if is_short_form else (1920, 1080)
+        scale = 1
+        if preview:
+            scale = preview_resolution / min(width, height)
+            width, height = 2 * round(width * scale / 2), 2 * round(height * scale / 2)
+        transcripts = {} if transcripts is None else transcripts
         render_sequences = json.loads(final_render_sequences, object_hook=lambda d: SimpleNamespace(**d))
-        video_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Video', is_short_form, filepath_prefix, language)
-        image_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Image', is_short_form, filepath_prefix, language) # lang=> if we need to overlay text info
-        vocal_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Vocal', is_short_form, filepath_prefix, language)
-        music_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Music', is_short_form, filepath_prefix, language) # lang=> songs dubbing
-        sfx_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Sfx', is_short_form, filepath_prefix, language)
+        # Durations come from cached ffprobe records; the whole timeline is scheduled before any decoder is opened.
+        media_metadata = MediaMetadataCache().probe_many([filepath_prefix + s.ContentLookupKey for s in render_sequences
+                                                          if s.MediaType in timed_media_types])
+        video_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Video', is_short_form, filepath_prefix, media_metadata, language)
+        image_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Image', is_short_form, filepath_prefix, media_metadata, language) # lang=> if we need to overlay text info
+        vocal_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Vocal', is_short_form, filepath_prefix, media_metadata, language, transcripts)
+        music_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Music', is_short_form, filepath_prefix, media_metadata, language) # lang=> songs dubbing
+        sfx_clips = self.__collect_render_clips_by_media_type(render_sequences, 'Sfx', is_short_form, filepath_prefix, media_metadata, language)
         # TODO: Support text clips
         #text_clips = self.collect_render_clips_by_media_type(render_sequences, 'Text', language)
         visual_layer = self.__create_visual_layer(image_clips=image_clips, 
-                                                  video_clips=video_clips, video_title=thumbnail_text, is_short_form=is_short_form)
+                                                  video_clips=video_clips, video_title=thumbnail_text, is_short_form=is_short_form,
+                                                  scale=scale)
         audio_layer = self.__create_audio_layer(vocal_clips, music_clips, sfx_clips)
         seconds_narration = self.__get_duration_narration(audio_layer=audio_layer)
-        subtitle_layer = self.__get_subtitle_clips(audio_clips=audio_layer, is_short_form=is_short_form)
+        timeline = [(rc.start, rc.end, self.__describe_render_clip(rc)) for rc in visual_layer]
+        subtitle_layer = self.__get_subtitle_clips(audio_clips=audio_layer, is_short_form=is_short_form, timeline=timeline,
+                                                   scale=scale)
         duration_watermark = 900
         if seconds_narration > narrator_padding:
             duration_watermark = seconds_narration
-        watermark_layer = self.__get_watermark_clips(watermark_text=watermark_text, duration=duration_watermark)
+        watermark_layer = self.__get_watermark_clips(watermark_text=watermark_text, duration=duration_watermark, scale=scale)
+        timeline += [(clip.start, clip.end, {'watermark': watermark_text, 'position': clip.pos(0), 'static': True})
+                     for clip in watermark_layer]
+        readers = ClipReaderManager()
+        self.__open_render_clips(visual_layer, (width, height), readers)
         visual_clips = self.__collect_moviepy_clips(visual_layer)
         visual_clips.extend(subtitle_layer)
         visual_clips.extend(watermark_layer)
+        # The composite takes its size from the bottom clip; fix it before static overlays are merged.
+        frame_size = visual_clips[0].size
+        visual_clips = flatten_static_layers(visual_clips, frame_size)
         composite_video = CompositeVideoClip(np.array(
-            visual_clips))
+            visual_clips), size=frame_size)
         is_music_video = len(vocal_clips) == 0 and len(music_clips) > 0
         should_mute = is_short_form or is_music_video
-        self.__reduce_background_audio(composite_video=composite_video, should_mute=should_mute)
-        self.__reduce_background_music(audio_layer=audio_layer, is_music_video=is_music_video)
-        audio_layer_clips = self.__collect_moviepy_clips(audio_layer)
-        audio_layer_clips.append(composite_video.audio)
-
-        composite_audio = CompositeAudioClip(np.array(
-            audio_layer_clips
-        ))
-        
-        composite_video = composite_video.with_audio(composite_audio)
         max_length_short_video_sec = 60
         if not is_music_video and seconds_narration > narrator_padding:
             composite_video = composite_video.with_duration(seconds_narration)
@@ -674,22 +909,30 @@ class MovieRenderer(object):
         if is_short_form and seconds_narration > narrator_padding:
             duration = min(max_length_short_video_sec, seconds_narration)
             composite_video = composite_video.with_duration(duration)
+        mixer = None
+        if with_audio:
+            mixer = self.__mix_audio(audio_layer, visual_layer, composite_video.duration, should_mute, is_music_video)
         aspect_ratio = '16:9'
         if is_short_form:
             aspect_ratio = '9:16'
-        # Write local file
-        target_save_path = filepath_prefix + local_save_as
-        # Moviepy uses the path file extension, mp4, to determine which codec to use.
-        codec_save_path = filepath_prefix + local_save_as + ".mp4"
         fps = 30
         if is_short_form:
             fps = 60
-        composite_video.write_videofile(codec_save_path, fps=fps, audio=True, audio_codec="aac", ffmpeg_params=['-crf','18', '-aspect', aspect_ratio])
-        os.rename(codec_save_path, target_save_path)
-        composite_video.close()
-        return True
+        # Never above the fastest video source; image-only renders keep the requested rate.
+        fps = profile.output_fps(fps, [rc.media_metadata.fps for rc in video_clips])
+        cut_points = sorted({rc.start for rc in visual_layer} | {rc.end for rc in visual_layer})
+        return SimpleNamespace(composite_video=composite_video, mixer=mixer, readers=readers, fps=fps, profile=profile,
+                               extra_ffmpeg_params=['-aspect', aspect_ratio], cut_points=cut_points, timeline=timeline,
+                               transcripts={rc.filename: rc.subtitle_segments for rc in vocal_clips})
     
 
+    def __describe_render_clip(self, rc):
+        """What decides a visual clip's frames: its sequence, file (hashed by the segment cache), schedule and effects."""
+        # Where it plays is the timeline entry's start and end; the sequence number only decides that.
+        sequence = {k: v for k, v in vars(rc.render_metadata).items() if k not in ('ContentLookupKey', 'RenderSequence')}
+        return {'sequence': sequence, 'file': rc.filename, 'duration': rc.duration,
+                'hold': rc.hold_duration, 'effects': [repr(e) for e in rc.effects], 'fingerprint': rc.fingerprint}
+
     def get_total_duration(clips):
         seconds = 0
         for c in clips:
@@ -697,17 +940,8 @@ class MovieRenderer(object):
         return seconds
     
 
-    def __collect_render_clips_by_media_type(self, final_render_sequences, target_media_type, is_short_form, filepath_prefix, transcriptionLanguage = "en"):
+    def __collect_render_clips_by_media_type(self, final_render_sequences, target_media_type, is_short_form, filepath_prefix, media_metadata, transcriptionLanguage = "en", transcripts={}):
         clips = list()
-        width = 1920
-        height = 1080
-        xc = 960
-        yc = 540
-        if is_short_form:
-            width = 1080
-            height = 1920
-            xc = 540
-            yc = 960
         for s in final_render_sequences:
             if s.MediaType != target_media_type:
                 continue
@@ -716,23 +950,26 @@ class MovieRenderer(object):
                 raise Exception("missing file: " + filename)
             
             if s.MediaType == 'Vocal':
-                subtitle_segments = self.__get_transcribed_text(filename=filename, language=transcriptionLanguage)
-                clips.append(RenderClip(clip=AudioFileClip(filename), render_metadata=s, subtitle_segments=subtitle_segments))
+                subtitle_segments = transcripts.get(filename)
+                if subtitle_segments is None:
+                    subtitle_segments = self.__get_transcribed_text(filename=filename, language=transcriptionLanguage)
+                clips.append(RenderClip(clip=None, render_metadata=s, subtitle_segments=subtitle_segments,
+                                        filename=filename, duration=media_metadata[filename].duration, media_metadata=media_metadata[filename]))
             elif s.MediaType == 'Music':
                 #return clips
                 # TODO dubbing? For music videos.
-                clips.append(RenderClip(clip=AudioFileClip(filename), render_metadata=s))
+                clips.append(RenderClip(clip=None, render_metadata=s, filename=filename, duration=media_metadata[filename].duration,
+                                        media_metadata=media_metadata[filename]))
             elif s.MediaType == 'Sfx':
-                clips.append(RenderClip(clip=AudioFileClip(filename), render_metadata=s))
+                clips.append(RenderClip(clip=None, render_metadata=s, filename=filename, duration=media_metadata[filename].duration,
+                                        media_metadata=media_metadata[filename]))
             elif s.MediaType == 'Video':
-                clips.append(RenderClip(clip=VideoFileClip(filename).resized(height=height)
-                                        .cropped(x_center=xc, y_center=yc, height=height, width=width).resized(width=width)
-                                        .with_position(("center", "center")), render_metadata=s))
+                clips.append(RenderClip(clip=None, render_metadata=s, filename=filename, duration=media_metadata[filename].duration,
+                                        media_metadata=media_metadata[filename]))
             elif target_media_type == 'Image':
                 # TODO overlay text? Probably not.
-                clips.append(RenderClip(clip=ImageClip(filename).resized(height=height)
-                                        .cropped(x_center=xc, y_center=yc, height=height, width=width).resized(width=width)
-                                        .with_position(("center", "center")), render_metadata=s))
+                # Stills have no duration of their own; the visual layer assigns one.
+                clips.append(RenderClip(clip=None, render_metadata=s, filename=filename, duration=0))
             elif target_media_type == 'Text':
                 return clips
                 # TODO: Need to unpack this first to raw-text, not json.
@@ -742,38 +979,71 @@ class MovieRenderer(object):
 
         return clips
 
-    def __reduce_background_audio(self, composite_video, should_mute):
-        reduce_to_percent = 0.4
-        if should_mute:
-            reduce_to_percent = 0 # scale to zero
-        composite_video.audio = composite_video.audio.with_volume_scaled(reduce_to_percent)
-    
-    def __reduce_background_music(self, audio_layer, is_music_video):
-        if is_music_video:
-            # Keep any background music at 100
-            return
-        reduce_to_percent = 0.3
-        increase_by_percent = 1.7
+    def __open_render_clips(self, render_clips, frame_size, readers):
+        """Builds the MoviePy clip of every scheduled visual RenderClip, applying its hold duration, effects and start;
+        pictures are fit to frame_size. Videos become lazy clips whose decoders readers opens at their start time and
+        releases after their end. Audio is not built here: __mix_audio decodes it into the render's AudioMixer."""
+        width, height = frame_size
+        xc = width // 2
+        yc = height // 2
+        fit_to_frame = lambda c: (c.resized(height=height)
+                                  .cropped(x_center=xc, y_center=yc, height=height, width=width).resized(width=width))
+        for rc in render_clips:
+            clip = rc.clip
+            if clip is None:
+                media_type = rc.render_metadata.MediaType
+                metadata = rc.media_metadata
+                if media_type == 'Video':
+                    # Picture only; the sound is decoded and mixed by __mix_audio.
+                    clip = readers.video_clip(rc.filename, metadata.size, metadata.duration, metadata.fps,
+                                              transform=fit_to_frame, timeline_end=rc.end)
+                    clip = clip.with_position(("center", "center"))
+                elif media_type == 'Image':
+                    # Stills hold one decoded frame and no reader, so they are opened directly.
+                    clip = fit_to_frame(ImageClip(rc.filename)).with_position(("center", "center"))
+                else:
+                    raise Exception('unsupported media type to moviepy clip')
+            if rc.hold_duration is not None:
+                clip = clip.with_duration(rc.hold_duration)
+            if rc.effects:
+                clip = clip.with_effects(rc.effects)
+            rc.clip = clip.with_start(rc.start)
+
+    def __mix_audio(self, audio_layer, visual_layer, duration, should_mute, is_music_video):
+        """The render's whole soundtrack in one AudioMixer: every audio file and the sound of every video clip
+        is decoded once and mixed in at its scheduled start with its volume (and speed, for videos).
+        Narration is raised by narration_gain and background music (unless it is a music video) and the videos' own
+        sound are lowered by their bus gains, as before ducking; both are also ducked under the narration, and the
+        mix is normalized to target_loudness_lufs."""
+        mixer = AudioMixer(duration)
         for rc in audio_layer:
-            if rc.render_metadata.PositionLayer == 'BackgroundMusic':
-                rc.clip = rc.clip.with_volume_scaled(reduce_to_percent)
+            bus, gain = master_bus, 1.0
             if rc.render_metadata.PositionLayer == 'Narrator':
-                rc.clip = rc.clip.with_volume_scaled(increase_by_percent)
+                bus, gain = narration_bus, narration_gain
+            elif rc.render_metadata.PositionLayer == 'BackgroundMusic' and not is_music_video:
+                bus, gain = ducked_bus, background_music_gain
+            mixer.add(rc.filename, start=rc.start, duration=rc.duration, gain=gain * volume_factor(rc.effects), bus=bus)
+        for rc in visual_layer:
+            if not should_mute and rc.render_metadata.MediaType == 'Video' and rc.media_metadata.has_audio:
+                mixer.add(rc.filename, start=rc.start, duration=rc.duration, gain=video_sound_gain,
+                          speed=speed_factor(rc.effects), bus=ducked_bus)
+        mixer.finalize(target_lufs=target_loudness_lufs)
+        return mixer
     
     def __get_duration_narration(self, audio_layer):
         seconds = 0
         for rc in audio_layer:
             if rc.render_metadata.PositionLayer == 'Narrator':
-                seconds += rc.clip.duration
+                seconds += rc.duration
         # Add some padding to avoid abrupt cutoffs; ending.
         return seconds + narrator_padding
             
         
-    def __create_visual_layer(self, image_clips, video_clips, video_title, is_short_form):
+    def __create_visual_layer(self, image_clips, video_clips, video_title, is_short_form, scale=1):
         # TODO: Group and order by PositionLayer + RenderSequence
         # Sequence full-screen content first.
         # Then sequence partials overlaying.
-        self.__set_thumbnail_text_rclip(video_title=video_title, visual_clips=image_clips)
+        self.__set_thumbnail_text_rclip(video_title=video_title, visual_clips=image_clips, scale=scale)
         self.__set_image_clips(image_clips=image_clips, duration_sec=2)
         visual_clips = image_clips + video_clips
         if is_short_form:
@@ -790,26 +1060,27 @@ class MovieRenderer(object):
     def __optimize_short_form_vfx(self, visual_clips):
         for vc in visual_clips:
             if vc.render_metadata.PositionLayer == 'Thumbnail':
-                vc.clip = vc.clip.with_effects([vfx.MultiplyColor(1.1), vfx.LumContrast(0.1, 0.4)])
+                vc.effects += [FusedColorEffect(multiply=1.1, lum=0.1, contrast=0.4)]
                 continue
             # Ideally, we want each clip to be at most 10-15 seconds.
             speed_multiplier = 1.20
-            if vc.clip.duration >= 50:
+            if vc.duration >= 50:
                 speed_multiplier = 6
-            elif vc.clip.duration >= 20:
+            elif vc.duration >= 20:
                 speed_multiplier = 4
 
-            vc.clip = vc.clip.with_effects([vfx.MirrorX(), vfx.MultiplyColor(1.1), 
-                                                vfx.LumContrast(0.1, 0.4), vfx.MultiplySpeed(factor=speed_multiplier)])
+            vc.effects += [FusedColorEffect(multiply=1.1, lum=0.1, contrast=0.4, mirror_x=True),
+                           vfx.MultiplySpeed(factor=speed_multiplier)]
+            vc.duration = vc.duration / speed_multiplier
         
     
-    def __get_random_color(self):
+    def __get_random_color(self, rng):
         yellow = "#FFFF00"
         red = "#FF0000"
         lime_green = "#4be506"
         white = "white"
         selected_color = white
-        randomNum = random.randint(0, 10)
+        randomNum = rng.randint(0, 10)
         if randomNum >= 8:
             selected_color = red
         elif randomNum < 8 and randomNum >= 7:
@@ -821,7 +1092,7 @@ class MovieRenderer(object):
         return selected_color
         
     
-    def __set_thumbnail_text_rclip(self, video_title, visual_clips):
+    def __set_thumbnail_text_rclip(self, video_title, visual_clips, scale=1):
         new_line_word_limit = 4
         words = video_title.split(" ")
         word_count = 1
@@ -837,35 +1108,40 @@ class MovieRenderer(object):
         video_title_top = " ".join(words_formatted[:partition_index])
         video_title_bottom = " ".join(words_formatted[partition_index:])
         thumbnail_dur_sec = thumbnail_duration
-        secondary_color = self.__get_random_color()
+        # Drawn from the text itself: the same title gets the same color in every render (and render process).
+        secondary_color = self.__get_random_color(random.Random(video_title))
         thumbnail_clip = self.__get_thumbnail_render_clip(visual_clips)
-        thumbnail_clip.clip = thumbnail_clip.clip.with_duration(thumbnail_dur_sec)
+        thumbnail_clip.hold_duration = thumbnail_dur_sec
+        thumbnail_clip.duration = thumbnail_dur_sec
         thumbnail_text_1 = TextClip(
             font="Impact",
             text=video_title_top,
-            font_size=125,
+            font_size=round(125 * scale),
             method='caption',
-            size=(1000, 1000),
+            size=(round(1000 * scale), round(1000 * scale)),
             color="#FFFFFF",
             stroke_color="#000000",
-            stroke_width=10,
-            margin=(50, 50),
-        ).with_position((0.05, 0.2), relative=True).with_duration(thumbnail_dur_sec).with_start(thumbnail_clip.clip.start)
+            stroke_width=round(10 * scale),
+            margin=(round(50 * scale), round(50 * scale)),
+        ).with_position((0.05, 0.2), relative=True).with_duration(thumbnail_dur_sec)
         thumbnail_text_2 = TextClip(
             font="Impact",
             text=video_title_bottom,
-            font_size=150,
+            font_size=round(150 * scale),
             method='caption',
-            size=(1000, 1000),
-            stroke_width=10,
+            size=(round(1000 * scale), round(1000 * scale)),
+            stroke_width=round(10 * scale),
             color=secondary_color,
             stroke_color="#000000",
-            margin=(50, 50),
-        ).with_position((0.05, 0.5), relative=True).with_duration(thumbnail_dur_sec).with_start(thumbnail_clip.clip.start)
+            margin=(round(50 * scale), round(50 * scale)),
+        ).with_position((0.05, 0.5), relative=True).with_duration(thumbnail_dur_sec)
         render_meta_copy = copy.copy(thumbnail_clip.render_metadata)
         render_meta_copy.MediaType = 'Text'
-        visual_clips.append(RenderClip(clip=thumbnail_text_1, render_metadata=render_meta_copy))
-        visual_clips.append(RenderClip(clip=thumbnail_text_2, render_metadata=render_meta_copy))
+        for thumbnail_text in (thumbnail_text_1, thumbnail_text_2):
+            text_rclip = RenderClip(clip=thumbnail_text, render_metadata=render_meta_copy)
+            text_rclip.start = thumbnail_clip.start
+            text_rclip.fingerprint = {'text': video_title, 'color': secondary_color}
+            visual_clips.append(text_rclip)
     
     def __get_thumbnail_render_clip(self, visual_clips):
         for rc in visual_clips:
@@ -884,15 +1160,15 @@ class MovieRenderer(object):
     def __set_start_time_narrator(self, audio_layer):
         for rclip in audio_layer:
             if rclip.render_metadata.RenderSequence == 0 and rclip.render_metadata.MediaType == 'Vocal':
-                rclip.clip = rclip.clip.with_start(thumbnail_duration)
+                rclip.start = thumbnail_duration
                 break
     
     def __set_image_clips(self, image_clips, duration_sec):
         for i, ic in enumerate(image_clips):
             if ic.render_metadata.PositionLayer == 'Thumbnail':
                 continue
-            image_clips[i].clip = image_clips[i].clip.with_duration(duration_sec)
-            image_clips[i].clip = image_clips[i].clip.with_position("center", "center")
+            image_clips[i].hold_duration = duration_sec
+            image_clips[i].duration = duration_sec
 
     def __combine_sequences(self, layer_clips):
         # allocate grouping by sequence numbers
@@ -912,12 +1188,12 @@ class MovieRenderer(object):
             if prev_render_sequence in sequenceNumberToClipsList:
                 clips_in_prev_sequence = sequenceNumberToClipsList[prev_render_sequence]
                 max_end_clip = self.__get_longest_render_clip(clips_in_prev_sequence)
-                layer_clips[i].clip = rclip.clip.with_start(max_end_clip.clip.end)
+                layer_clips[i].start = max_end_clip.end
 
     def __get_longest_render_clip(self, clips):
         max_dur_clip = clips[0]
         for rc in clips:
-            if rc.clip.duration > max_dur_clip.clip.duration:
+            if rc.duration > max_dur_clip.duration:
                 max_dur_clip = rc
         return max_dur_clip
         
@@ -927,29 +1203,35 @@ class MovieRenderer(object):
             movie_clips.append(r.clip)
         return movie_clips
     
-    def __get_subtitle_clips(self, audio_clips, is_short_form):
+    def __get_subtitle_clips(self, audio_clips, is_short_form, timeline, scale=1):
+        """Subtitle clips of the narration; each narration's subtitles are added to timeline as one entry."""
         subtitles = []
         prev_clip_dur = thumbnail_duration # initial offset for thumbnail image.
         for i, ac in enumerate(audio_clips):
             if len(ac.subtitle_segments) > 0:
+                # Drawn from the transcript, so the color is the same in every render of this narration.
+                color = self.__get_random_color(random.Random(" ".join(str(s.get('text', '')) for s in ac.subtitle_segments)))
                 text_clips = self.__get_text_clips(text=ac.subtitle_segments, 
                                                    is_short_form=is_short_form,
                                                    offset_sec=prev_clip_dur,
-                                                   color=self.__get_random_color())
+                                                   color=color,
+                                                   scale=scale)
                 subtitles.extend(text_clips)
-            prev_clip_dur += ac.clip.duration
+                end = prev_clip_dur + max([ac.duration] + [s.get('end', 0) for s in ac.subtitle_segments])
+                timeline.append((prev_clip_dur, end, {'subtitles': ac.subtitle_segments, 'color': color}))
+            prev_clip_dur += ac.duration
         return subtitles
     
 
     # Ref: https://www.angel1254.com/blog/posts/word-by-word-captions
     # Note: this should be done FIRST for narrator clips to avoid file moviepy clip file locks.
-    def __get_transcribed_text(self, filename, language):
-        audio = whisper.load_audio(filename)
-        model = whisper.load_model("tiny") # tiny, base, small, medium, large
-        results = whisper.transcribe(model, audio, language=language)
+    def __get_transcribed_text(self, filename, language, audio=None, audio_path=None):
+        if audio is None:
+            audio = whisper.load_audio(filename)
+        results = TranscriptionEngine().transcribe(audio, language=language, audio_path=audio_path)
         return results["segments"]
     
-    def __get_text_clips(self, text, is_short_form, offset_sec, color):
+    def __get_text_clips(self, text, is_short_form, offset_sec, color, scale=1):
         text_clips = []
         position = "bottom"
         if is_short_form:
@@ -958,9 +1240,9 @@ class MovieRenderer(object):
             for word in segment["words"]:
                 clip = TextClip(
                         text=word["text"],
-                        font_size=125,
-                        stroke_width=5,
-                        margin=(100, 100),
+                        font_size=round(125 * scale),
+                        stroke_width=round(5 * scale),
+                        margin=(round(100 * scale), round(100 * scale)),
                         stroke_color="black", 
                         font="Arial Bold",
                         color=color)
@@ -970,14 +1252,14 @@ class MovieRenderer(object):
                 text_clips.append(clip)
         return text_clips
     
-    def __get_watermark_clips(self, watermark_text, duration=900):
+    def __get_watermark_clips(self, watermark_text, duration=900, scale=1):
         clips = []
         water_seg_dur = duration / 4
         clip_instance = TextClip(
             text=watermark_text,
             font="Arial", # OpenType
             color="white",
-            font_size = 35,
+            font_size = round(35 * scale),
         ).with_duration(water_seg_dur)
 
         start_bl = 2.0
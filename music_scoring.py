@@ -25,7 +25,8 @@ class MusicScoring(object):
         pass
 
     
-    def score_media(self, prompt, sourceMediaID, callbackMediaID) -> bool:
+    def score_media(self, prompt, sourceMediaID, callbackMediaID):
+        """Returns the encoding report of the scored video (also uploaded in its -metadata.json), or False."""
         if media_exists(callbackMediaID):
             return False
         
@@ -46,13 +47,14 @@ class MusicScoring(object):
         self.music_generator.save_audio(rise, rise_audio_file)
         self.music_generator.save_audio(climax, climax_audio_file)
         # 4. Apply music to final output media; crossfade sfx, etc.
-        self.movie_renderer.render_video_with_music_scoring(temp_source_file, baseline_audio_file, rise_audio_file, climax_audio_file,
-                                                            noteable_timestamps_seconds, callbackMediaID)
+        encoding_report = self.movie_renderer.render_video_with_music_scoring(temp_source_file, baseline_audio_file, rise_audio_file, climax_audio_file,
+                                                                              noteable_timestamps_seconds, callbackMediaID)
+        logger.info(f"Scored {callbackMediaID}: {encoding_report}")
         
         metadata_filename = str(random.randint(0, 1000)) + "data.json"
 
         with open(metadata_filename, 'w') as file:
-            json.dump(metadata, file, indent=4)
+            json.dump({'TimestampMetadata': metadata, 'Encoding': encoding_report}, file, indent=4)
 
         # 5. Upload to s3 by callbackMediaID.
         if not upload_file(callbackMediaID, callbackMediaID):
@@ -67,5 +69,5 @@ class MusicScoring(object):
         os.remove(callbackMediaID)
         os.remove(metadata_filename)
 
-        return True
+        return encoding_report
         
\ No newline at end of file
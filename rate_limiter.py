@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket.
+    Tokens refill continuously at rate_per_second up to capacity; acquire() blocks until one is available."""
+    def __init__(self, rate_per_second, capacity=1):
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second must be positive")
+        self.rate_per_second = rate_per_second
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self.__refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_seconds = (tokens - self.tokens) / self.rate_per_second
+            time.sleep(wait_seconds)
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_per_second)
+        self.last_refill = now
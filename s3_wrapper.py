@@ -94,13 +94,14 @@ def download_file_via_presigned_url(presigned_url: str, save_to_filename: str) -
     return True
 
 
-def upload_file_via_presigned_url(presigned_url: str, local_file_path: str) -> bool:
+def upload_file_via_presigned_url(presigned_url: str, local_file_path: str, content_type: str = None) -> bool:
     """
     Uploads a local file to S3 using a provided presigned PUT URL.
 
     Args:
         presigned_url (str): The presigned URL generated for a PUT request.
         local_file_path (str): The path to the local file to upload.
+        content_type (str): Content-Type header to send; guessed from the filename if omitted.
 
     Returns:
         bool: True if upload was successful, False otherwise.
@@ -116,7 +117,8 @@ def upload_file_via_presigned_url(presigned_url: str, local_file_path: str) -> b
         return False
 
     # Guess content type based on filename, default if unknown
-    content_type, encoding = mimetypes.guess_type(local_file)
+    if content_type is None:
+        content_type, encoding = mimetypes.guess_type(local_file)
     if content_type is None:
         content_type = 'application/json' # Fallback
     logger.debug(f"Using Content-Type: {content_type} for upload.")
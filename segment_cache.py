@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+segment_cache_dir = os.environ.get('RENDER_SEGMENT_CACHE_DIR') # unset: segments are not cached
+segment_cache_max_bytes = int(os.environ.get('RENDER_SEGMENT_CACHE_MAX_BYTES', 50 * 1024 ** 3))
+# With the cache on, renders are split into segments of about this length, the unit of reuse.
+segment_cache_seconds = int(os.environ.get('RENDER_SEGMENT_CACHE_SECONDS', 60))
+# Part of every key: bump it when a rendering change makes different frames from the same inputs.
+segment_cache_version = 2
+hash_chunk_bytes = 1 << 20
+
+# content_hash results by (absolute path, size, mtime); a file is read in full once per version.
+content_hashes = {}
+content_hashes_lock = threading.Lock()
+
+
+def content_hash(filename):
+    """sha256 of filename's bytes, memoized per version (path, size and mtime) of the file."""
+    stat = os.stat(filename)
+    version = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    with content_hashes_lock:
+        hexdigest = content_hashes.get(version)
+    if hexdigest is not None:
+        return hexdigest
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(hash_chunk_bytes), b''):
+            digest.update(chunk)
+    hexdigest = digest.hexdigest()
+    with content_hashes_lock:
+        content_hashes[version] = hexdigest
+    return hexdigest
+
+
+class SegmentCache(object):
+    """Encoded picture segments (see MovieRenderer.render_segment) keyed by a hash of everything their frames depend
+    on, so a revised timeline re-encodes only the segments whose content changed. Least recently used segments are
+    evicted past segment_cache_max_bytes."""
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(SegmentCache, cls).__new__(cls)
+            cls.instance.initialized = False
+        return cls.instance
+
+    def __init__(self):
+        if self.initialized == True:
+            return
+        self.cache_dir = segment_cache_dir
+        self.max_bytes = segment_cache_max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.initialized = True
+
+    def key(self, timeline, frame_range, params):
+        """Hash of frames [first, stop) of a render: its params (frame size, fps, encoder settings), the frame count
+        and each timeline entry (start, end, description) showing during them, a 'file' in the description standing
+        for its content. Times are relative to the segment's start, so a segment showing the same content at another
+        point of the render (e.g. after an earlier sequence changed length) gets the same key. An entry whose frames
+        do not change over time ('static' in its description) only counts while it shows."""
+        first, stop = frame_range
+        fps = params['fps']
+        segment_start, segment_end = first / fps, stop / fps
+        last_frame = (stop - 1) / fps
+        entries = []
+        for start, end, description in timeline:
+            # Shown in some frame t of the segment (start <= t < end); the tolerance only admits more entries.
+            if start > last_frame + 1e-6 or end <= segment_start:
+                continue
+            entry = {'shows': [_relative_time(max(start, segment_start) - segment_start),
+                               _relative_time(min(end, segment_end) - segment_start)],
+                     'description': dict(description, file=content_hash(description['file'])) if description.get('file') else description}
+            if not description.get('static'):
+                entry['start'] = _relative_time(start - segment_start)
+            entries.append(entry)
+        payload = json.dumps({'version': segment_cache_version, 'params': params, 'frames': stop - first, 'entries': entries},
+                             sort_keys=True, default=_json_value)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """The cached segment for key, or None."""
+        path = self.__segment_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, filename):
+        """Moves the segment filename into the cache as key's and returns its cached path."""
+        path = self.__segment_path(key)
+        partial_path = path + ".partial"
+        shutil.move(filename, partial_path)
+        os.replace(partial_path, path)
+        self.__evict()
+        return path
+
+    def __evict(self):
+        segments = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".segment.ts"):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                segments.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in segments)
+        for _, size, path in sorted(segments):
+            if total <= self.max_bytes:
+                break
+            logger.info(f"Evicting render segment {path}")
+            try: os.remove(path)
+            except OSError: continue
+            total -= size
+
+    def __segment_path(self, key):
+        return os.path.join(self.cache_dir, key + ".segment.ts")
+
+
+def _relative_time(seconds):
+    return round(seconds, 6) # float noise from the subtraction must not change keys
+
+
+def _json_value(value):
+    if hasattr(value, 'item'):
+        return value.item() # numpy scalars in transcripts
+    return vars(value) # parsed sequences (SimpleNamespace)
@@ -0,0 +1,104 @@
+import logging
+import multiprocessing
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+from encoding_profiles import get_encoding_profile
+
+logger = logging.getLogger(__name__)
+
+render_segments = int(os.environ.get('RENDER_SEGMENTS', 1))
+min_segment_seconds = 10
+# Each segment opens on an IDR frame and no GOP references across segments, so they concatenate without re-encoding.
+closed_gop_params = ['-flags', '+cgop']
+
+
+def plan_segments(duration, fps, cut_points=(), count=render_segments):
+    """Frame ranges [(first, stop), ...] covering the int(duration * fps) frames of a render in at most count segments
+    of at least min_segment_seconds. Each boundary is the cut point (sequence start or end, in seconds) nearest to an
+    even split, if one is within a quarter segment of it, so segments start on a new scene where possible."""
+    total = int(duration * fps)
+    count = max(1, min(count, int(duration // min_segment_seconds)))
+    if count == 1:
+        return [(0, total)]
+    cut_frames = np.unique(np.round(np.asarray(cut_points, dtype=np.float64) * fps).astype(np.int64))
+    cut_frames = cut_frames[(cut_frames > 0) & (cut_frames < total)]
+    tolerance = total / count / 4
+    bounds = [0]
+    for k in range(1, count):
+        boundary = int(round(total * k / count))
+        if len(cut_frames):
+            nearest = cut_frames[np.argmin(np.abs(cut_frames - boundary))]
+            if abs(nearest - boundary) <= tolerance:
+                boundary = int(nearest)
+        if bounds[-1] < boundary < total:
+            bounds.append(boundary)
+    bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def plan_aligned_segments(duration, fps, cut_points, segment_seconds):
+    """Frame ranges [(first, stop), ...] covering the int(duration * fps) frames of a render, each ending at the first
+    cut point at least segment_seconds after its start; a stretch with no cut point is split every segment_seconds from
+    its start. Boundaries follow the cut points rather than the total, so when one sequence changes length the later
+    boundaries move with their sequences and those segments keep their content (see SegmentCache.key)."""
+    total = int(duration * fps)
+    step = max(1, int(round(segment_seconds * fps)))
+    cut_frames = np.unique(np.round(np.asarray(cut_points, dtype=np.float64) * fps).astype(np.int64))
+    cut_frames = cut_frames[(cut_frames > 0) & (cut_frames < total)]
+    bounds = [0]
+    for point in list(cut_frames) + [total]:
+        while point - bounds[-1] >= 2 * step:
+            bounds.append(bounds[-1] + step)
+        if point - bounds[-1] >= step and point < total:
+            bounds.append(int(point))
+    if bounds[-1] < total:
+        bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def render_segmented(request, frame_ranges, segment_files):
+    """Renders the frame ranges of request (see MovieRenderer.render_segment) to segment_files in parallel processes,
+    each encoder getting an equal share of the profile's threads. Returns that share."""
+    workers = min(len(frame_ranges), os.cpu_count() or 1)
+    threads = max(1, get_encoding_profile(request.get('encoding_profile')).threads // workers)
+    logger.info(f"Rendering {len(frame_ranges)} segments in {workers} processes: {frame_ranges}")
+    # spawn: forking a process that already holds torch/ffmpeg threads can deadlock.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(_render_segment, request, frame_range, path, threads)
+                   for frame_range, path in zip(frame_ranges, segment_files)]
+        for future in futures:
+            future.result()
+    return threads
+
+
+def segment_filenames(filename, count):
+    # MPEG-TS: no per-file edit lists or moov to reconcile at the joins, unlike mp4 segments.
+    return [f"{filename}.segment{i:03d}.ts" for i in range(count)]
+
+
+def concat_segments(segment_files, filename, audio_file=None):
+    """Joins identically encoded segments, in order, with the concat demuxer (stream copy); audio_file is muxed as-is."""
+    list_path = filename + ".segments.txt"
+    with open(list_path, 'w') as f:
+        for path in segment_files:
+            f.write("file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n")
+    cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_file is not None:
+        cmd += ["-i", audio_file, "-map", "0:v:0", "-map", "1:a:0"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", filename]
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to concatenate segments into {filename}: {result.stderr.decode(errors='ignore')}")
+    finally:
+        os.remove(list_path)
+
+
+def _render_segment(request, frame_range, filename, threads):
+    from movie_render import MovieRenderer
+    MovieRenderer().render_segment(request, frame_range, filename, threads)
@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings(object):
+    """Wall-clock timings for the stages of one job.
+    Stages may overlap (run on different threads); each records start/end offsets from job start,
+    and depends_on lets report() walk back the critical path."""
+    def __init__(self, job_name):
+        self.job_name = job_name
+        self.job_start = time.monotonic()
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def begin(self, name, depends_on=()):
+        with self.lock:
+            if name in self.stages:
+                return
+            self.stages[name] = {'start': time.monotonic() - self.job_start, 'end': None, 'depends_on': list(depends_on)}
+
+    def end(self, name):
+        with self.lock:
+            self.stages[name]['end'] = time.monotonic() - self.job_start
+
+    @contextmanager
+    def stage(self, name, depends_on=()):
+        self.begin(name, depends_on)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def timed(self, name, func, *args, depends_on=(), **kwargs):
+        """Runs func inside a stage; convenient for executor.submit."""
+        with self.stage(name, depends_on):
+            return func(*args, **kwargs)
+
+    def critical_path(self):
+        """Stage names on the critical path: start from the last stage to finish, then repeatedly
+        step to whichever dependency finished last."""
+        finished = {k: v for k, v in self.stages.items() if v['end'] is not None}
+        if not finished:
+            return []
+        current = max(finished, key=lambda k: finished[k]['end'])
+        path = [current]
+        while True:
+            deps = [d for d in finished[current]['depends_on'] if d in finished]
+            if not deps:
+                break
+            current = max(deps, key=lambda d: finished[d]['end'])
+            path.append(current)
+        return list(reversed(path))
+
+    def report(self):
+        with self.lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+        summary = {
+            'job': self.job_name,
+            'totalSeconds': round(time.monotonic() - self.job_start, 3),
+            'stages': {k: {'startSeconds': round(v['start'], 3),
+                           'endSeconds': round(v['end'], 3) if v['end'] is not None else None,
+                           'durationSeconds': round(v['end'] - v['start'], 3) if v['end'] is not None else None}
+                       for k, v in stages.items()},
+            'criticalPath': self.critical_path(),
+        }
+        logger.info("stage timings: " + str(summary))
+        return summary
@@ -0,0 +1,167 @@
+import logging
+
+import numpy as np
+from PIL import Image
+from moviepy import ImageClip, VideoClip
+from moviepy.tools import compute_position
+
+logger = logging.getLogger(__name__)
+
+window_tolerance_seconds = 1e-6
+
+
+class StaticLayerClip(VideoClip):
+    """One or more static overlays (ImageClip/TextClip with a constant position) sharing the same active
+    window, pre-blended once into a single RGBA layer cropped to the frame and to its visible pixels.
+    The flattened layer is built when the segment is flattened and reused for every frame of it;
+    compose_on then does one alpha blend over that region instead of a full-frame canvas per overlay."""
+    def __init__(self, clips, frame_size):
+        VideoClip.__init__(self)
+        layer = _flatten(clips, frame_size)
+        self.layer_count = len(clips)
+        first = clips[0]
+        self.start = first.start
+        self.end = first.end
+        self.duration = first.duration
+        self.layer_index = first.layer_index
+        if layer is None: # nothing visible; kept so the composite's duration is unchanged
+            rgb = np.zeros((1, 1, 3), dtype=np.uint8)
+            alpha = np.zeros((1, 1), dtype=np.uint8)
+            position = (0, 0)
+        else:
+            rgb, alpha, position = layer
+        self.frame_function = lambda t: rgb
+        self.size = (rgb.shape[1], rgb.shape[0])
+        self.pos = lambda t: position
+        self.relative_pos = False
+        self.layer_position = position
+        self.layer_pixels = (rgb, alpha)
+        self.layer_rgb = Image.fromarray(rgb, 'RGB')
+        self.layer_alpha = Image.fromarray(alpha, 'L')
+        self.layer_rgba = Image.fromarray(np.dstack([rgb, alpha]), 'RGBA')
+        self.mask = ImageClip(alpha / 255.0, is_mask=True).with_duration(self.duration).with_start(self.start)
+
+    def compose_on(self, background, t):
+        if background.mode == 'RGBA':
+            background.alpha_composite(self.layer_rgba, dest=self.layer_position)
+        else:
+            background.paste(self.layer_rgb, self.layer_position, self.layer_alpha)
+        return background
+
+
+def flatten_static_layers(clips, frame_size):
+    """Returns clips with every static overlay replaced by a StaticLayerClip; static overlays with identical
+    active windows are merged into one when no clip between them (in layer order) plays during that window,
+    so the stacking order seen at any time is unchanged."""
+    flattened = []
+    groups = {}
+    for clip in clips:
+        if not _is_static(clip):
+            flattened.append(clip)
+            continue
+        target = None
+        for i in range(len(flattened) - 1, -1, -1):
+            item = flattened[i]
+            if id(item) in groups and _same_window(groups[id(item)][0], clip):
+                target = item
+                break
+            if _overlaps(item, clip):
+                break
+        if target is not None:
+            groups[id(target)].append(clip)
+        else:
+            flattened.append(clip)
+            groups[id(clip)] = [clip]
+
+    result = []
+    static_count = 0
+    layer_count = 0
+    for item in flattened:
+        if id(item) not in groups:
+            result.append(item)
+            continue
+        members = groups[id(item)]
+        result.append(StaticLayerClip(members, frame_size))
+        static_count += len(members)
+        layer_count += 1
+    logger.info(f"Flattened {static_count} static overlays into {layer_count} layers")
+    return result
+
+
+def _is_static(clip):
+    if not isinstance(clip, ImageClip) or clip.audio is not None:
+        return False
+    if clip.start is None or clip.end is None:
+        return False
+    if clip.mask is not None and not isinstance(clip.mask, ImageClip):
+        return False
+    return _position_key(clip.pos(0)) == _position_key(clip.pos(clip.duration))
+
+
+def _position_key(pos):
+    return tuple(pos) if isinstance(pos, (list, tuple)) else pos
+
+
+def _same_window(a, b):
+    return (abs(a.start - b.start) <= window_tolerance_seconds and abs(a.end - b.end) <= window_tolerance_seconds
+            and a.layer_index == b.layer_index)
+
+
+def _overlaps(a, b):
+    if a.start is None or b.start is None:
+        return True
+    a_end = a.end if a.end is not None else np.inf
+    b_end = b.end if b.end is not None else np.inf
+    return a.start < b_end and b.start < a_end
+
+
+def _flatten(clips, frame_size):
+    """Premultiplied "over" of clips (in order) clipped to the frame.
+    Returns (rgb uint8, alpha uint8, (x, y)) of the visible region with straight color, or None if nothing shows."""
+    frame_w, frame_h = frame_size
+    parts = []
+    for clip in clips:
+        rgb = np.asarray(clip.get_frame(0))[:, :, :3].astype(np.uint8)
+        h, w = rgb.shape[:2]
+        if clip.mask is not None:
+            # Same quantization as VideoClip.compose_on so single overlays blend identically.
+            alpha = (clip.mask.get_frame(0) * 255).astype(np.uint8)
+            padded = np.zeros((h, w), dtype=np.uint8)
+            padded[:min(h, alpha.shape[0]), :min(w, alpha.shape[1])] = alpha[:h, :w]
+            alpha = padded
+        else:
+            alpha = np.full((h, w), 255, dtype=np.uint8)
+        x, y = compute_position((w, h), (frame_w, frame_h), clip.pos(0), clip.relative_pos)
+        x, y = int(x), int(y)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, frame_w), min(y + h, frame_h)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        parts.append((x0, y0, x1, y1, rgb[y0 - y:y1 - y, x0 - x:x1 - x], alpha[y0 - y:y1 - y, x0 - x:x1 - x]))
+    if not parts:
+        return None
+
+    left = min(p[0] for p in parts)
+    top = min(p[1] for p in parts)
+    right = max(p[2] for p in parts)
+    bottom = max(p[3] for p in parts)
+    color = np.zeros((bottom - top, right - left, 3), dtype=np.float32)
+    coverage = np.zeros((bottom - top, right - left), dtype=np.float32)
+    for x0, y0, x1, y1, rgb, alpha in parts:
+        a = alpha.astype(np.float32) / 255
+        region = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        color[region] = rgb * a[:, :, None] + color[region] * (1 - a[:, :, None])
+        coverage[region] = a + coverage[region] * (1 - a)
+
+    visible_rows = np.flatnonzero(coverage.any(axis=1))
+    visible_cols = np.flatnonzero(coverage.any(axis=0))
+    if len(visible_rows) == 0:
+        return None
+    r0, r1 = visible_rows[0], visible_rows[-1] + 1
+    c0, c1 = visible_cols[0], visible_cols[-1] + 1
+    color = color[r0:r1, c0:c1]
+    coverage = coverage[r0:r1, c0:c1]
+    straight = np.divide(color, coverage[:, :, None], out=np.zeros_like(color), where=coverage[:, :, None] > 0)
+    rgb = np.clip(np.round(straight), 0, 255).astype(np.uint8)
+    alpha = np.clip(np.round(coverage * 255), 0, 255).astype(np.uint8)
+    return rgb, alpha, (left + int(c0), top + int(r0))
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class SubtitleIndex(object):
+    """Columnar, time-sorted view of a Whisper transcription for fast per-cut slicing.
+    Segment and word start/end times live in NumPy arrays and their text in one string addressed by offsets,
+    so slicing a time range is a binary search plus array views instead of a scan and deepcopy of every word."""
+    def __init__(self, whisper_segments):
+        segments = sorted(whisper_segments, key=lambda seg: seg.get('start', 0))
+        self.seg_starts = np.array([seg.get('start', 0) for seg in segments], dtype=np.float64)
+        self.seg_ends = np.array([seg.get('end', 0) for seg in segments], dtype=np.float64)
+        self.seg_text, self.seg_text_offsets = self.__pack_text(seg.get('text', '') for seg in segments)
+        self.seg_has_words = np.array(['words' in seg for seg in segments], dtype=bool)
+
+        words = []
+        word_segments = []
+        for i, seg in enumerate(segments):
+            for word in seg.get('words', []):
+                words.append(word)
+                word_segments.append(i)
+        word_order = np.argsort([word.get('start', 0) for word in words], kind='stable')
+        words = [words[i] for i in word_order]
+        self.word_segments = np.array(word_segments, dtype=np.int64)[word_order]
+        self.word_starts = np.array([word.get('start', 0) for word in words], dtype=np.float64)
+        self.word_ends = np.array([word.get('end', 0) for word in words], dtype=np.float64)
+        self.word_text, self.word_text_offsets = self.__pack_text(word.get('text', '') for word in words)
+        # NaN where Whisper gave no confidence for the word.
+        self.word_confidences = np.array([word.get('confidence', np.nan) for word in words], dtype=np.float64)
+        # Ends are not guaranteed monotonic; their running max is, which keeps the lower bound searchable.
+        self.seg_ends_max = np.maximum.accumulate(self.seg_ends) if len(self.seg_ends) else self.seg_ends
+        self.word_ends_max = np.maximum.accumulate(self.word_ends) if len(self.word_ends) else self.word_ends
+
+    def __len__(self):
+        return len(self.seg_starts)
+
+    def slice(self, start_time, end_time):
+        """Segments and words overlapping [start_time, end_time), shifted so start_time is 0."""
+        seg_lo, seg_hi = self.__bounds(self.seg_starts, self.seg_ends_max, start_time, end_time)
+        word_lo, word_hi = self.__bounds(self.word_starts, self.word_ends_max, start_time, end_time)
+        return SubtitleSlice(self, start_time, end_time, seg_lo, seg_hi, word_lo, word_hi)
+
+    def __bounds(self, starts, ends_max, start_time, end_time):
+        lo = int(np.searchsorted(ends_max, start_time, side='right'))
+        hi = int(np.searchsorted(starts, end_time, side='left'))
+        return lo, max(lo, hi)
+
+    def __pack_text(self, texts):
+        texts = list(texts)
+        lengths = [len(t) for t in texts]
+        return "".join(texts), np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+
+
+class SubtitleSlice(object):
+    """Time-shifted window over a SubtitleIndex. Times are computed on the array views; text is only
+    materialized for the segments/words actually returned."""
+    def __init__(self, index, start_time, end_time, seg_lo, seg_hi, word_lo, word_hi):
+        self.index = index
+        self.duration = end_time - start_time
+        self.start_time = start_time
+        self.end_time = end_time
+        self.seg_range = (seg_lo, seg_hi)
+        self.word_range = (word_lo, word_hi)
+
+    def segment_times(self):
+        """(indices, starts, ends) of overlapping segments, clamped to the slice and shifted to its start."""
+        return self.__shifted(self.index.seg_starts, self.index.seg_ends, *self.seg_range)
+
+    def word_times(self):
+        return self.__shifted(self.index.word_starts, self.index.word_ends, *self.word_range)
+
+    def segments(self):
+        """Overlapping segments as {'start', 'end', 'text', 'words'} dicts in slice time; 'words' holds only
+        the segment's words that overlap the slice. A segment with words but none in the slice and no text is skipped."""
+        index = self.index
+        words_by_segment = {}
+        word_indices = self.word_times()[0]
+        for word_index, word in zip(word_indices, self.words()):
+            words_by_segment.setdefault(int(index.word_segments[word_index]), []).append(word)
+        segments = []
+        for i, start, end in zip(*self.segment_times()):
+            text = index.seg_text[index.seg_text_offsets[i]:index.seg_text_offsets[i + 1]]
+            words = words_by_segment.get(int(i), [])
+            if index.seg_has_words[i] and not words and not text.strip():
+                continue
+            segments.append({'start': float(start), 'end': float(end), 'text': text, 'words': words})
+        return segments
+
+    def words(self):
+        """Overlapping words as {'start', 'end', 'text', 'confidence'} dicts in slice time; 'confidence' only
+        where Whisper gave one."""
+        index = self.index
+        words = []
+        for i, start, end in zip(*self.word_times()):
+            word = {'start': float(start), 'end': float(end),
+                    'text': index.word_text[index.word_text_offsets[i]:index.word_text_offsets[i + 1]]}
+            if not np.isnan(index.word_confidences[i]):
+                word['confidence'] = float(index.word_confidences[i])
+            words.append(word)
+        return words
+
+    def __shifted(self, all_starts, all_ends, lo, hi):
+        starts = all_starts[lo:hi]
+        ends = all_ends[lo:hi]
+        # Inside [lo, hi) only items whose own end precedes the slice (non-monotonic ends) can miss it.
+        overlapping = (ends > self.start_time) & (starts < self.end_time)
+        shifted_starts = np.maximum(0, starts - self.start_time)
+        shifted_ends = np.minimum(self.duration, ends - self.start_time)
+        keep = overlapping & (shifted_ends > shifted_starts)
+        return np.flatnonzero(keep) + lo, shifted_starts[keep], shifted_ends[keep]
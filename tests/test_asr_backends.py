@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from asr_backends import FasterWhisperBackend, whisper_window_seconds
+from decoded_audio import asr_sample_rate
+from transcription import _assembled_windows
+
+
+class Word(object):
+    def __init__(self, word, start, end):
+        self.word, self.start, self.end, self.probability = word, start, end, 0.9
+
+
+class Segment(object):
+    def __init__(self, start, end, text):
+        self.start, self.end, self.text = start, end, text
+        self.words = [Word(' ' + text.strip(), start, end)]
+
+
+class FakeBatchedPipeline(object):
+    """Behaves like faster-whisper 1.1's BatchedInferencePipeline: without vad_filter it refuses audio of more than
+    one window unless clip_timestamps (sample offsets) say what to decode."""
+    def __init__(self):
+        self.clip_timestamps = None
+
+    def transcribe(self, audio, language=None, clip_timestamps=None, vad_filter=False, **options):
+        if not clip_timestamps:
+            if vad_filter or len(audio) / asr_sample_rate >= whisper_window_seconds:
+                raise RuntimeError("No clip timestamps found. Set 'vad_filter' to True or provide 'clip_timestamps'.")
+            clip_timestamps = [{'start': 0, 'end': len(audio)}]
+        self.clip_timestamps = clip_timestamps
+        return iter([Segment(c['start'] / asr_sample_rate, c['end'] / asr_sample_rate, 'clip') for c in clip_timestamps]), None
+
+
+class FakeModel(object):
+    def __init__(self):
+        self.audio_seconds = None
+
+    def transcribe(self, audio, language=None, **options):
+        self.audio_seconds = len(audio) / asr_sample_rate
+        return iter([Segment(0.0, self.audio_seconds, 'whole')]), None
+
+
+@pytest.fixture
+def backend():
+    backend = FasterWhisperBackend.__new__(FasterWhisperBackend)
+    backend.model = FakeModel()
+    backend.pipeline = FakeBatchedPipeline()
+    return backend
+
+
+def test_chunk_longer_than_a_window_is_decoded_in_windows_of_speech(backend):
+    # A VAD chunk of two speech intervals, 50s and 20s, packed with a spacer between them.
+    intervals = [(0, 50 * asr_sample_rate), (60 * asr_sample_rate, 80 * asr_sample_rate)]
+    windows = _assembled_windows(intervals)
+    audio = np.zeros(windows[-1][1], dtype=np.float32)
+    assert len(audio) / asr_sample_rate > whisper_window_seconds
+
+    result = backend.transcribe(audio, 'en', speech_windows=windows)
+
+    clips = backend.pipeline.clip_timestamps
+    assert all(c['end'] - c['start'] <= whisper_window_seconds * asr_sample_rate for c in clips)
+    # Every speech sample is covered exactly once, and the spacer not at all.
+    covered = np.zeros(len(audio), dtype=int)
+    for c in clips:
+        covered[c['start']:c['end']] += 1
+    expected = np.zeros(len(audio), dtype=int)
+    for start, end in windows:
+        expected[start:end] = 1
+    assert np.array_equal(covered, expected)
+    assert len(result['segments']) == len(clips)
+    assert result['segments'][0]['words'][0] == {'text': 'clip', 'start': 0.0, 'end': clips[0]['end'] / asr_sample_rate,
+                                                 'confidence': 0.9}
+
+
+def test_chunk_without_speech_windows_uses_sequential_transcription(backend):
+    audio = np.zeros(300 * asr_sample_rate, dtype=np.float32)
+
+    result = backend.transcribe(audio, 'en')
+
+    assert backend.model.audio_seconds == 300
+    assert backend.pipeline.clip_timestamps is None
+    assert [seg['text'] for seg in result['segments']] == ['whole']
+
+
+def test_assembled_windows_follow_the_spacers():
+    windows = _assembled_windows([(100, 200), (500, 550)])
+    spacer = windows[1][0] - windows[0][1]
+    assert windows[0] == (0, 100)
+    assert windows[1][1] - windows[1][0] == 50
+    assert spacer > 0
+    assert _assembled_windows([(100, 200)]) == [(0, 100)]
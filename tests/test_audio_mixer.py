@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+import audio_mixer
+from audio_mixer import AudioMixer, ducked_bus, master_bus, mix_sample_rate, narration_bus
+
+
+def noise(seconds, level, seed):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((int(seconds * mix_sample_rate), 2)) * level).astype(np.float32)
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Placements then straddle several blocks.
+    monkeypatch.setattr(audio_mixer, 'mix_block_seconds', 1)
+
+
+def test_ducked_bus_is_mixed_block_wise_under_the_duck_gain(small_blocks):
+    narration = noise(4, 0.1, seed=1)
+    music = noise(8, 0.05, seed=2)
+    mixer = AudioMixer(10)
+    mixer.add(narration, start=2.5, bus=narration_bus)
+    mixer.add(music, start=0.75, gain=0.3, fade_in=1, fade_out=2, bus=ducked_bus)
+    mixer.add(music, start=5.5, speed=1.5, duration=3, bus=ducked_bus)
+    expected_master = mixer.master.copy()
+    duck_gain = mixer.duck_gain_curve()
+
+    # Reference: the whole ducked bus in one buffer, as a second AudioMixer's master.
+    reference = AudioMixer(10)
+    reference.add(music, start=0.75, gain=0.3, fade_in=1, fade_out=2)
+    reference.add(music, start=5.5, speed=1.5, duration=3)
+    window_centers = (np.arange(len(mixer.sidechain)) + 0.5) * mixer.duck_window
+    gain = np.interp(np.arange(len(expected_master)), window_centers, duck_gain).astype(np.float32)
+    expected_master += reference.master * gain[:, None]
+
+    mixer.finalize()
+
+    assert mixer.ducked_placements == []
+    np.testing.assert_allclose(mixer.master, expected_master, atol=1e-6)
+    # Ducked under the narration, unity well away from it.
+    assert duck_gain[int(4 / audio_mixer.duck_window_seconds)] < 0.2
+    assert duck_gain[int(1 / audio_mixer.duck_window_seconds)] == pytest.approx(1.0)
+
+
+def test_write_streams_the_gained_and_clipped_master(small_blocks, tmp_path):
+    mixer = AudioMixer(3.5)
+    mixer.add(noise(3.5, 0.4, seed=3), start=0, bus=master_bus)
+    mixer.finalize()
+    mixer.output_gain = 2.0
+    expected = np.clip(mixer.master * np.float32(2.0), -1.0, 1.0)
+
+    path = str(tmp_path / "mix.wav")
+    mixer.write(path, codec="pcm_f32le")
+
+    sample_rate, written = wavfile.read(path)
+    assert sample_rate == mix_sample_rate
+    assert np.array_equal(written, expected)
+
+
+def test_write_reports_encoder_failure(tmp_path):
+    mixer = AudioMixer(1)
+    with pytest.raises(RuntimeError):
+        mixer.write(str(tmp_path / "mix.wav"), codec="no-such-codec")
+
+
+@pytest.mark.parametrize('start, duration', [(0.5, 6), (-1.25, 6), (0, 2.5)])
+def test_streamed_source_mixes_like_a_decoded_one(small_blocks, tmp_path, start, duration):
+    path = str(tmp_path / "source.wav")
+    wavfile.write(path, mix_sample_rate, noise(4.5, 0.2, seed=4))
+    decoded = AudioMixer(duration)
+    decoded.add(path, start=start, gain=0.4, bus=narration_bus)
+    streamed = AudioMixer(duration)
+
+    streamed.add_streamed(path, start=start, gain=0.4, bus=narration_bus)
+
+    assert streamed.sources == {}
+    assert np.array_equal(streamed.master, decoded.master)
+    np.testing.assert_allclose(streamed.sidechain, decoded.sidechain, rtol=1e-9)
+
+
+def test_streamed_source_cannot_be_ducked(tmp_path):
+    with pytest.raises(ValueError):
+        AudioMixer(1).add_streamed(str(tmp_path / "source.wav"), start=0, bus=ducked_bus)
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import types
+
+import pytest
+
+import distributed_render
+from distributed_render import FileChunkQueue, RenderChunkWorker, get_chunk_queue, render_distributed
+
+
+@pytest.fixture
+def chunk_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(distributed_render, 'poll_interval_seconds', 0.01)
+    return FileChunkQueue(str(tmp_path / "queue"))
+
+
+class FakeRenderer(object):
+    """Stands in for MovieRenderer in the worker: records its chunks and writes the segment."""
+    def __init__(self, render=None):
+        self.chunks = []
+        self.render = render
+
+    def render_segment(self, request, frame_range, filename, threads=None):
+        self.chunks.append((request, frame_range))
+        if self.render is not None:
+            self.render(frame_range)
+        with open(filename, 'w') as f:
+            f.write(f"{request['title']} {frame_range[0]}-{frame_range[1]}")
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    fake = FakeRenderer()
+    monkeypatch.setitem(sys.modules, 'movie_render', types.SimpleNamespace(MovieRenderer=lambda: fake))
+    return fake
+
+
+def test_each_message_is_claimed_once_oldest_first(chunk_queue):
+    chunk_queue.send({'index': 0})
+    chunk_queue.send({'index': 1})
+
+    first, first_handle = chunk_queue.receive(visibility_timeout=60)
+    second, _ = chunk_queue.receive(visibility_timeout=60)
+
+    assert (first, second) == ({'index': 0}, {'index': 1})
+    assert chunk_queue.receive(visibility_timeout=60, wait_seconds=0) == (None, None)
+    chunk_queue.delete(first_handle)
+    chunk_queue.delete(first_handle) # deleting twice is harmless
+    assert len(os.listdir(chunk_queue.claimed_dir)) == 1
+
+
+def test_claim_is_redelivered_after_its_visibility_timeout_unless_extended(chunk_queue):
+    chunk_queue.send({'index': 0})
+    chunk_queue.send({'index': 1})
+    _, expired = chunk_queue.receive(visibility_timeout=60)
+    _, extended = chunk_queue.receive(visibility_timeout=60)
+    stale = time.time() - 120
+    os.utime(expired, (stale, stale))
+    os.utime(extended, (stale, stale))
+    chunk_queue.extend(extended, visibility_timeout=60)
+
+    body, _ = chunk_queue.receive(visibility_timeout=60)
+
+    assert body == {'index': 0}
+    assert chunk_queue.receive(visibility_timeout=60, wait_seconds=0) == (None, None)
+
+
+def test_worker_keeps_its_chunk_invisible_while_rendering(chunk_queue, renderer, tmp_path, monkeypatch):
+    monkeypatch.setattr(distributed_render, 'chunk_visibility_timeout_seconds', 0.3)
+    request_path = str(tmp_path / "request.json")
+    with open(request_path, 'w') as f:
+        f.write('{"title": "t"}')
+    output = str(tmp_path / "segment000.ts")
+    chunk_queue.send({'renderId': 'r', 'index': 0, 'requestPath': request_path, 'frameRange': [0, 30], 'output': output})
+    seen_by_others = []
+    def render_slowly(frame_range):
+        # Longer than the visibility timeout: only the heartbeat keeps other workers from claiming the chunk.
+        for _ in range(8):
+            time.sleep(0.1)
+            seen_by_others.append(chunk_queue.receive(visibility_timeout=0.3)[0])
+    renderer.render = render_slowly
+
+    assert RenderChunkWorker(chunk_queue).run_once(wait_seconds=0)
+
+    assert seen_by_others == [None] * 8
+    assert renderer.chunks == [({'title': 't'}, (0, 30))]
+    assert open(output).read() == "t 0-30"
+    assert os.listdir(chunk_queue.claimed_dir) == [] and os.listdir(chunk_queue.pending_dir) == []
+
+
+def test_worker_drops_chunks_of_a_finished_render(chunk_queue, renderer, tmp_path):
+    chunk_queue.send({'renderId': 'r', 'index': 0, 'requestPath': str(tmp_path / "gone.json"), 'frameRange': [0, 30],
+                      'output': str(tmp_path / "segment000.ts")})
+
+    assert RenderChunkWorker(chunk_queue).run_once(wait_seconds=0)
+
+    assert renderer.chunks == []
+    assert chunk_queue.receive(visibility_timeout=60, wait_seconds=0) == (None, None)
+
+
+def test_render_distributed_renders_every_chunk_with_its_own_worker(chunk_queue, renderer, tmp_path):
+    segment_files = [str(tmp_path / f"segment{i:03d}.ts") for i in range(3)]
+
+    render_distributed({'title': 't'}, [(0, 30), (30, 60), (60, 75)], segment_files, queue=chunk_queue, timeout=10)
+
+    assert [open(path).read() for path in segment_files] == ["t 0-30", "t 30-60", "t 60-75"]
+    assert sorted(os.listdir(tmp_path / "queue" / "pending")) == []
+    assert not os.path.exists(segment_files[0] + ".render.json")
+
+
+def test_render_distributed_raises_a_failed_chunk_and_cleans_up(chunk_queue, renderer, tmp_path):
+    def fail_second_chunk(frame_range):
+        if frame_range[0] == 30:
+            raise ValueError("bad frame")
+    renderer.render = fail_second_chunk
+    segment_files = [str(tmp_path / f"segment{i:03d}.ts") for i in range(3)]
+
+    with pytest.raises(RuntimeError, match="bad frame"):
+        render_distributed({'title': 't'}, [(0, 30), (30, 60), (60, 75)], segment_files, queue=chunk_queue, timeout=10)
+
+    assert not os.path.exists(segment_files[1])
+    assert not any(name.endswith('.failed') or name.endswith('.render.json') or '.partial' in name
+                   for name in os.listdir(tmp_path))
+    # The chunk queued after the failure finds its request gone and is dropped.
+    rendered = len(renderer.chunks)
+    assert RenderChunkWorker(chunk_queue).run_once(wait_seconds=0)
+    assert len(renderer.chunks) == rendered and not os.path.exists(segment_files[2])
+
+
+def test_render_distributed_times_out(chunk_queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(RenderChunkWorker, 'run_once', lambda self, wait_seconds=0: False) # no worker picks anything up
+
+    with pytest.raises(TimeoutError):
+        render_distributed({'title': 't'}, [(0, 30)], [str(tmp_path / "segment000.ts")], queue=chunk_queue, timeout=0)
+
+
+def test_get_chunk_queue_rejects_unknown_urls(tmp_path):
+    assert isinstance(get_chunk_queue("file://" + str(tmp_path)), FileChunkQueue)
+    with pytest.raises(ValueError):
+        get_chunk_queue("redis://localhost")
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from moviepy import ColorClip, CompositeVideoClip, ImageClip
+
+from frame_pipeline import FrameCompositor
+
+size = (64, 48)
+
+
+def image(width, height, seed, alpha=False):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 4 if alpha else 3), dtype=np.uint8)
+
+
+def soft_alpha(width, height):
+    """An alpha ramp with fully transparent and fully opaque parts."""
+    ramp = np.clip(np.linspace(-0.25, 1.25, width), 0, 1)
+    return np.tile(ramp, (height, 1))
+
+
+def rgba_clip(width, height, seed):
+    # MoviePy builds the mask from the alpha channel.
+    return ImageClip(image(width, height, seed, alpha=True), transparent=True)
+
+
+def masked_clip(width, height, seed):
+    clip = ImageClip(image(width, height, seed))
+    return clip.with_mask(ImageClip(soft_alpha(width, height), is_mask=True))
+
+
+def composites():
+    opaque_background = ColorClip(size, color=(20, 40, 60))
+    return {
+        'opaque layers': CompositeVideoClip([
+            opaque_background,
+            ImageClip(image(30, 20, 1)).with_position((5, 7)),
+            ImageClip(image(25, 25, 2)).with_position((30, 10)),
+        ], size=size),
+        'alpha layers': CompositeVideoClip([
+            opaque_background,
+            rgba_clip(40, 30, 3).with_position((4, 4)),
+            masked_clip(36, 28, 4).with_position((20, 12)),
+        ], size=size),
+        'partially off-frame layers': CompositeVideoClip([
+            opaque_background,
+            ImageClip(image(30, 30, 5)).with_position((-10, -12)),
+            rgba_clip(40, 20, 6).with_position((44, 38)),
+            masked_clip(80, 16, 7).with_position((-8, 20)),
+        ], size=size),
+        'transparent background': CompositeVideoClip([
+            rgba_clip(40, 30, 8).with_position((-6, 10)),
+            ImageClip(image(20, 20, 9)).with_position((30, -4)),
+            masked_clip(50, 30, 10).with_position((16, 22)),
+        ], size=size),
+    }
+
+
+@pytest.mark.parametrize('name', list(composites()))
+def test_compose_matches_composite_video_clip(name):
+    clip = composites()[name].with_duration(1)
+    expected = clip.get_frame(0.5)
+
+    out = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    FrameCompositor(clip).compose(0.5, out)
+
+    assert np.array_equal(out, expected[:, :, :3])
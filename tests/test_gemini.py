@@ -0,0 +1,121 @@
+import importlib
+import json
+import sys
+import types
+
+import pytest
+
+
+class FakeGenerativeModel(object):
+    """Stands in for vertexai's GenerativeModel: answers every prompt with a fixed reply and records the prompts."""
+    prompts = []
+
+    def __init__(self, model_name, system_instruction=None, safety_settings=None):
+        self.model_name = model_name
+
+    def generate_content(self, prompt_text):
+        FakeGenerativeModel.prompts.append(prompt_text)
+        return types.SimpleNamespace(text=f"reply {len(FakeGenerativeModel.prompts)}",
+                                     candidates=[types.SimpleNamespace(finish_reason=1)])
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """The gemini module imported against a fake vertexai SDK, which is not needed to parse or cache responses."""
+    safety_setting = type('SafetySetting', (object,), {
+        '__init__': lambda self, category, threshold: None,
+        'HarmCategory': types.SimpleNamespace(HARM_CATEGORY_DANGEROUS_CONTENT=1, HARM_CATEGORY_HARASSMENT=2,
+                                              HARM_CATEGORY_HATE_SPEECH=3, HARM_CATEGORY_SEXUALLY_EXPLICIT=4,
+                                              HARM_CATEGORY_CIVIC_INTEGRITY=5, HARM_CATEGORY_UNSPECIFIED=0),
+        'HarmBlockThreshold': types.SimpleNamespace(BLOCK_ONLY_HIGH=3),
+    })
+    vertexai = types.ModuleType('vertexai')
+    vertexai.init = lambda **kwargs: None
+    generative_models = types.ModuleType('vertexai.generative_models')
+    generative_models.GenerativeModel = FakeGenerativeModel
+    generative_models.SafetySetting = safety_setting
+    vertexai.generative_models = generative_models
+    monkeypatch.setitem(sys.modules, 'vertexai', vertexai)
+    monkeypatch.setitem(sys.modules, 'vertexai.generative_models', generative_models)
+    monkeypatch.delitem(sys.modules, 'gemini', raising=False)
+    monkeypatch.setattr(FakeGenerativeModel, 'prompts', [])
+    module = importlib.import_module('gemini')
+    yield module
+    sys.modules.pop('gemini', None)
+
+
+@pytest.fixture
+def clock(gemini, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(gemini.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_repairs_a_truncated_reply(gemini):
+    text = '{"AllTimestampSeconds": [12, 40], "TimestampMetadata": [{"StartSeconds": 12, "Reason": "the [first] cue'
+
+    assert json.loads(gemini.GeminiClient().repair_json(text)) == {
+        'AllTimestampSeconds': [12, 40],
+        'TimestampMetadata': [{'StartSeconds': 12, 'Reason': "the [first] cue"}]}
+
+
+def test_repairs_a_reply_wrapped_in_prose_with_trailing_commas(gemini):
+    text = 'Here is the json:\n{"AllTimestampSeconds": [1, 2,], "Note": "keep ,] and true", "Done": true,}\nThanks!'
+
+    assert json.loads(gemini.GeminiClient().repair_json(text)) == {
+        'AllTimestampSeconds': [1, 2], 'Note': "keep ,] and true", 'Done': True}
+
+
+def test_fenced_reply_is_unwrapped_without_a_repair_call(gemini, monkeypatch):
+    client = gemini.GeminiClient()
+    monkeypatch.setattr(client, 'call_model', lambda system_instruction, prompt_text: '```json\n{"AllTimestampSeconds": [3],}\n```')
+
+    assert json.loads(client.call_model_json_out("instruction", "prompt")) == {'AllTimestampSeconds': [3]}
+    assert FakeGenerativeModel.prompts == []
+
+
+def test_unrepairable_text_is_not_repaired_locally(gemini):
+    assert gemini.GeminiClient().repair_json("no json here") is None
+
+
+def test_identical_calls_are_answered_from_the_cache(gemini, clock):
+    client = gemini.GeminiClient()
+
+    first = client.call_model("instruction", "prompt")
+    second = client.call_model("instruction", "prompt")
+    other = client.call_model("other instruction", "prompt")
+
+    assert first == second == "reply 1"
+    assert other == "reply 2"
+    assert FakeGenerativeModel.prompts == ["prompt", "prompt"]
+
+
+def test_cached_responses_expire(gemini, clock):
+    client = gemini.GeminiClient()
+    client.call_model("instruction", "prompt")
+    clock.now += gemini.response_cache_ttl_seconds - 1
+    assert client.call_model("instruction", "prompt") == "reply 1"
+
+    clock.now += 2
+    assert client.call_model("instruction", "prompt") == "reply 2"
+
+
+def test_least_recently_used_response_is_evicted(gemini, clock, monkeypatch):
+    monkeypatch.setattr(gemini, 'response_cache_max_entries', 2)
+    client = gemini.GeminiClient()
+    client.call_model("instruction", "a")
+    client.call_model("instruction", "b")
+    client.call_model("instruction", "a") # now more recently used than b
+    client.call_model("instruction", "c") # evicts b
+
+    assert client.call_model("instruction", "a") == "reply 1"
+    assert client.call_model("instruction", "c") == "reply 3"
+    assert client.call_model("instruction", "b") == "reply 4"
@@ -0,0 +1,67 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import TokenBucket
+
+
+class FakeClock(object):
+    """Stands in for time.monotonic/time.sleep: sleeping advances the clock instead of blocking."""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_burst_up_to_capacity_without_waiting(clock):
+    bucket = TokenBucket(rate_per_second=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_waits_for_refill_once_burst_is_spent(clock):
+    bucket = TokenBucket(rate_per_second=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+    assert clock.now == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate_per_second=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    clock.now += 60 # idle far longer than it takes to refill
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_sustained_rate(clock):
+    bucket = TokenBucket(rate_per_second=4, capacity=1)
+    for _ in range(9):
+        bucket.acquire()
+    # The first token is there from the start; the other 8 arrive at 4 per second.
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate_per_second=0)
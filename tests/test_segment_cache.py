@@ -0,0 +1,82 @@
+import pytest
+
+import segment_cache
+from segment_cache import SegmentCache
+from segmented_render import plan_aligned_segments
+
+fps = 30
+params = {'fps': fps, 'size': [1920, 1080], 'preset': 'medium'}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(segment_cache, 'segment_cache_dir', str(tmp_path / "segments"))
+    monkeypatch.delattr(SegmentCache, 'instance', raising=False) # a fresh singleton per test
+    yield SegmentCache()
+    monkeypatch.delattr(SegmentCache, 'instance', raising=False)
+
+
+@pytest.fixture
+def media(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"clip{i}.mp4"
+        path.write_bytes(bytes([i]) * 64)
+        paths.append(str(path))
+    return paths
+
+
+def timeline(media, first_duration):
+    """Three back to back clips and a static watermark over all of them."""
+    durations = [first_duration, 70, 65]
+    starts = [0, first_duration, first_duration + 70]
+    entries = [(start, start + duration, {'file': path, 'duration': duration})
+               for start, duration, path in zip(starts, durations, media)]
+    entries.append((0, starts[-1] + 65, {'watermark': 'wm', 'static': True}))
+    return entries, [t for start, duration in zip(starts, durations) for t in (start, start + duration)]
+
+
+def keys(cache, entries, cut_points):
+    total = max(end for _, end, _ in entries)
+    frame_ranges = plan_aligned_segments(total, fps, cut_points, 30)
+    return [cache.key(entries, frame_range, params) for frame_range in frame_ranges]
+
+
+def test_changing_a_sequence_length_keeps_the_keys_of_later_segments(cache, media):
+    before = keys(cache, *timeline(media, 40))
+    after = keys(cache, *timeline(media, 45))
+
+    assert len(before) == len(after) == 5
+    assert before[0] != after[0]
+    assert before[1:] == after[1:]
+
+
+def test_key_changes_with_content_shown_in_the_segment(cache, media, tmp_path):
+    entries, cut_points = timeline(media, 40)
+    original = keys(cache, entries, cut_points)
+    with open(media[1], 'ab') as f:
+        f.write(b'edited')
+
+    edited = keys(cache, entries, cut_points)
+
+    # The second clip shows in the second and third segments.
+    assert edited[0] == original[0] and edited[3:] == original[3:]
+    assert edited[1] != original[1] and edited[2] != original[2]
+
+
+def test_key_depends_on_where_a_clip_starts_within_the_segment(cache, media):
+    clip = {'file': media[0], 'duration': 20}
+    at_start = cache.key([(10, 30, clip)], (300, 900), params)
+    later = cache.key([(12, 32, clip)], (300, 900), params)
+    shifted_with_segment = cache.key([(12, 32, clip)], (360, 960), params)
+
+    assert at_start != later
+    assert at_start == shifted_with_segment
+
+
+def test_aligned_segments_end_on_cut_points():
+    assert plan_aligned_segments(175, fps, [0, 40, 40, 110, 110, 175], 60) == [(0, 3300), (3300, 5250)]
+    # A stretch without cut points is split every segment_seconds from its start.
+    assert plan_aligned_segments(200, fps, [0, 10, 200], 60) == [(0, 1800), (1800, 3600), (3600, 6000)]
+    assert plan_aligned_segments(200, fps, [0, 70, 200], 60) == [(0, 2100), (2100, 3900), (3900, 6000)]
+    assert plan_aligned_segments(30, fps, [0, 10, 30], 60) == [(0, 900)]
@@ -0,0 +1,40 @@
+import pytest
+
+from subtitle_index import SubtitleIndex
+
+
+def whisper_segments():
+    return [
+        {'start': 0.0, 'end': 2.0, 'text': ' Hello there.',
+         'words': [{'text': 'Hello', 'start': 0.0, 'end': 0.8, 'confidence': 0.91},
+                   {'text': 'there.', 'start': 0.9, 'end': 2.0, 'confidence': 0.42}]},
+        {'start': 2.0, 'end': 6.0, 'text': ' ',
+         'words': [{'text': '', 'start': 5.5, 'end': 6.0}]},
+        {'start': 4.0, 'end': 9.0, 'text': ' No words here.'},
+    ]
+
+
+def test_slice_shifts_times_and_keeps_word_confidence():
+    segments = SubtitleIndex(whisper_segments()).slice(0.5, 1.5).segments()
+
+    assert len(segments) == 1
+    assert segments[0]['start'] == 0.0 and segments[0]['end'] == 1.0
+    assert segments[0]['words'] == [{'text': 'Hello', 'start': 0.0, 'end': pytest.approx(0.3), 'confidence': 0.91},
+                                    {'text': 'there.', 'start': pytest.approx(0.4), 'end': 1.0, 'confidence': 0.42}]
+
+
+def test_word_without_confidence_has_no_confidence_key():
+    words = SubtitleIndex(whisper_segments()).slice(5.0, 6.0).words()
+    assert words == [{'text': '', 'start': 0.5, 'end': 1.0}]
+
+
+def test_segment_with_no_text_and_no_words_in_the_slice_is_skipped():
+    segments = SubtitleIndex(whisper_segments()).slice(3.0, 5.0).segments()
+    # The blank segment's only word lies after the slice; the segment without word timings is kept.
+    assert [seg['text'] for seg in segments] == [' No words here.']
+    assert segments[0]['start'] == 1.0 and segments[0]['end'] == 2.0
+
+
+def test_blank_segment_with_a_word_in_the_slice_is_kept():
+    segments = SubtitleIndex(whisper_segments()).slice(5.0, 10.0).segments()
+    assert [seg['text'] for seg in segments] == [' ', ' No words here.']
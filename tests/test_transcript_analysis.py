@@ -0,0 +1,112 @@
+import json
+import threading
+
+import pytest
+from google.api_core.exceptions import TooManyRequests
+
+import rate_limiter
+import transcript_analysis
+from transcript_analysis import TranscriptAnalyzer, max_slice_size
+
+
+class StubClient(object):
+    """Stands in for GeminiClient: answers each slice with its first segment id as the notable timestamp.
+    Slices starting at an id in invalid get a non-json reply; the first quota_errors calls raise TooManyRequests."""
+    def __init__(self, invalid=(), quota_errors=0, hold_first_slice=None):
+        self.invalid = set(invalid)
+        self.quota_errors = quota_errors
+        self.hold_first_slice = hold_first_slice
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def call_model_json_out(self, system_instruction, prompt_text):
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.quota_errors:
+                raise TooManyRequests("quota exceeded")
+        first_id = json.loads(prompt_text)[0]['id']
+        if first_id == 0 and self.hold_first_slice is not None:
+            # Finish last, so merging cannot rely on completion order.
+            assert self.hold_first_slice.wait(timeout=10)
+        if first_id in self.invalid:
+            return "not json {"
+        return json.dumps({'AllTimestampSeconds': [first_id],
+                           'TimestampMetadata': [{'StartSeconds': first_id, 'Reason': "slice " + str(first_id)}]})
+
+
+class FakeClock(object):
+    """Stands in for time.monotonic/time.sleep: sleeping advances the clock instead of blocking."""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def segments(count):
+    return [{'id': i, 'start': i, 'end': i + 1, 'text': "word"} for i in range(count)]
+
+
+def slice_starts(count):
+    return list(range(0, count, max_slice_size))
+
+
+def test_results_are_merged_in_slice_order():
+    last_slices_done = threading.Event()
+    client = StubClient(hold_first_slice=last_slices_done)
+    analyzer = TranscriptAnalyzer(analysis_client=client, max_parallel=4, requests_per_minute=6000, burst=10)
+    count = 3 * max_slice_size + 50
+    session = analyzer.start_session()
+    session.submit(segments(count))
+    for future in session.futures[1:]:
+        future.result(timeout=10)
+    last_slices_done.set()
+
+    notable_timestamps, timestamp_metadata = session.finish()
+
+    assert notable_timestamps == slice_starts(count)
+    assert [m['StartSeconds'] for m in timestamp_metadata] == slice_starts(count)
+
+
+def test_quota_errors_back_off_and_retry_through_the_bucket(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', clock.sleep)
+    monkeypatch.setattr(transcript_analysis.random, 'uniform', lambda low, high: 0)
+    client = StubClient(quota_errors=2)
+    analyzer = TranscriptAnalyzer(analysis_client=client, requests_per_minute=60, burst=1, backoff_base_seconds=0.1)
+
+    response = analyzer.analyze_slice(segments(10))
+
+    assert response['AllTimestampSeconds'] == [0]
+    assert client.calls == 3
+    # Exponential backoff, then each retry still waits for the bucket's next token (one per second).
+    assert clock.sleeps == [pytest.approx(0.1), pytest.approx(0.9), pytest.approx(0.2), pytest.approx(0.8)]
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_quota_errors_past_max_retries_are_raised(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', clock.sleep)
+    client = StubClient(quota_errors=10)
+    analyzer = TranscriptAnalyzer(analysis_client=client, max_retries=2)
+
+    with pytest.raises(TooManyRequests):
+        analyzer.analyze_slice(segments(10))
+    assert client.calls == 3
+
+
+def test_a_slice_with_invalid_json_is_skipped():
+    client = StubClient(invalid=[max_slice_size])
+    analyzer = TranscriptAnalyzer(analysis_client=client, requests_per_minute=6000, burst=10)
+
+    notable_timestamps, timestamp_metadata = analyzer.analyze(segments(3 * max_slice_size))
+
+    assert notable_timestamps == [0, 2 * max_slice_size]
+    assert [m['StartSeconds'] for m in timestamp_metadata] == [0, 2 * max_slice_size]
@@ -0,0 +1,141 @@
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core.exceptions import TooManyRequests
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+max_slice_size = 100
+
+
+class TranscriptAnalyzer(object):
+    """Sends transcript slices to the analysis model concurrently.
+    Calls are paced by a shared token bucket, quota errors are retried with exponential backoff,
+    and results are merged back in slice order regardless of completion order.
+    analysis_client only needs call_model_json_out(system_instruction, prompt_text) -> str,
+    so a local stub can stand in for GeminiClient."""
+    def __init__(self, analysis_client=None, max_parallel=4, requests_per_minute=30, burst=2,
+                 max_retries=5, backoff_base_seconds=2.0, backoff_max_seconds=60.0):
+        if analysis_client is None:
+            from gemini import GeminiClient
+            analysis_client = GeminiClient()
+        self.analysis_client = analysis_client
+        self.max_parallel = max(1, max_parallel)
+        self.rate_limiter = TokenBucket(rate_per_second=requests_per_minute / 60.0, capacity=burst)
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+    def analyze(self, segments):
+        """Returns (notable_timestamps, timestamp_metadata) merged in transcript order."""
+        session = self.start_session()
+        session.submit(segments)
+        return session.finish()
+
+    def start_session(self):
+        """Starts an incremental analysis; see AnalysisSession."""
+        return AnalysisSession(self)
+
+    def analyze_slice(self, subslice):
+        """Analyzes one slice of transcript segments. Returns the parsed response, or None if the model refused it or its json could not be repaired."""
+        prompt = json.dumps(subslice)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                respJsonStr = self.analysis_client.call_model_json_out(self.get_analysis_query(), prompt)
+                break
+            except ValueError as e:
+                # The model's output could not be made into json, even by asking it to repair it.
+                logger.warning("gemini returned invalid json for slice starting at segment " + str(subslice[0].get('id')) + ": " + str(e))
+                return None
+            except TooManyRequests as e:
+                if attempt >= self.max_retries:
+                    logger.error("gemini quota retries exhausted: " + str(e))
+                    raise
+                backoff_seconds = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+                backoff_seconds += random.uniform(0, backoff_seconds / 2)
+                logger.info("gemini quota exceeded, backing off " + str(round(backoff_seconds, 2)) + "s")
+                time.sleep(backoff_seconds)
+                attempt += 1
+
+        if not isinstance(respJsonStr, str) or "EDITOR_FORBIDDEN" in respJsonStr:
+            logger.warning("gemini returned no usable analysis for slice starting at segment " + str(subslice[0].get('id')))
+            return None
+        try:
+            responseData = json.loads(respJsonStr)
+        except ValueError as e:
+            logger.warning("gemini returned invalid json for slice starting at segment " + str(subslice[0].get('id')) + ": " + str(e))
+            return None
+        logger.debug('gemini response: ' + json.dumps(responseData))
+        return responseData
+
+    def get_analysis_query(self):
+        request = """You are a musical scoring professional. You are able to identify emotional, climactic, and significant moments from media.
+        Your goal is to analyze the following transcript for significant moments that should be punctuated in music. Your output will be a json valid array of integers.
+        Expected json output:
+        {
+            "AllTimestampSeconds": int[],
+            "TimestampMetadata": [
+                {
+                    "StartSeconds": int,
+                    "Reason": "A reason for the inclusion of this timestamp as a noteable moment. Should include relevant details to justify its inclusion, and provide context."
+                },
+            ]
+        }
+        ###
+        """
+        return request
+
+
+class AnalysisSession(object):
+    """Incremental analysis for transcripts that arrive in pieces.
+    Each full slice is dispatched as soon as enough segments have been submitted; finish() sends the
+    remainder and merges every slice's result in transcript order. Use it as a context manager so its
+    workers are shut down even if the transcription feeding it fails."""
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.executor = ThreadPoolExecutor(max_workers=analyzer.max_parallel)
+        self.pending_segments = []
+        self.futures = []
+
+    def submit(self, segments):
+        self.pending_segments += segments
+        while len(self.pending_segments) >= max_slice_size:
+            self.__dispatch(self.pending_segments[:max_slice_size])
+            self.pending_segments = self.pending_segments[max_slice_size:]
+
+    def finish(self):
+        if len(self.pending_segments) > 0:
+            self.__dispatch(self.pending_segments)
+            self.pending_segments = []
+        notable_timestamps = []
+        timestamp_metadata = []
+        try:
+            for future in self.futures:
+                responseData = future.result()
+                if responseData is None:
+                    continue
+                notable_timestamps += responseData.get('AllTimestampSeconds', [])
+                timestamp_metadata += responseData.get('TimestampMetadata', [])
+        finally:
+            self.close()
+        return notable_timestamps, timestamp_metadata
+
+    def close(self):
+        """Shuts down the workers; slices not yet started are dropped."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __dispatch(self, subslice):
+        self.futures.append(self.executor.submit(self.analyzer.analyze_slice, subslice))
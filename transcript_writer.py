@@ -0,0 +1,132 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+default_transcript_format = 'json'
+
+
+def _timestamp(seconds, decimal_separator):
+    millis = int(round(max(0, seconds) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{decimal_separator}{millis:03d}"
+
+
+class TranscriptWriter(object):
+    """Streams minified transcript segments ({'id', 'text', 'timestampStartSeconds', 'timestampEndSeconds'})
+    to a file as they are produced. Every write is flushed; when streamable, the file is a valid document
+    after each write, so a partial upload can already be consumed."""
+    name = None
+    file_extension = None
+    content_type = None
+    streamable = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "w", encoding="utf-8")
+        self.segment_count = 0
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_segments(self, segments):
+        for segment in segments:
+            self.write_segment(segment)
+            self.segment_count += 1
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.write_footer()
+        self.file.close()
+
+    def write_header(self):
+        pass
+
+    def write_segment(self, segment):
+        raise NotImplementedError
+
+    def write_footer(self):
+        pass
+
+
+class JsonTranscriptWriter(TranscriptWriter):
+    """The original {'segments': [...], 'transcript': '...'} document; only valid once closed."""
+    name = 'json'
+    file_extension = '.json'
+    content_type = 'application/json'
+    streamable = False
+
+    def write_header(self):
+        self.transcript_parts = []
+        self.file.write('{"segments": [')
+
+    def write_segment(self, segment):
+        if self.segment_count > 0:
+            self.file.write(', ')
+        self.file.write(json.dumps(segment))
+        self.transcript_parts.append(segment['text'])
+
+    def write_footer(self):
+        self.file.write('], "transcript": ' + json.dumps("".join(self.transcript_parts)) + '}')
+
+
+class JsonLinesTranscriptWriter(TranscriptWriter):
+    name = 'jsonl'
+    file_extension = '.jsonl'
+    content_type = 'application/x-ndjson'
+
+    def write_segment(self, segment):
+        self.file.write(json.dumps(segment) + '\n')
+
+
+class SrtTranscriptWriter(TranscriptWriter):
+    name = 'srt'
+    file_extension = '.srt'
+    content_type = 'application/x-subrip'
+
+    def write_segment(self, segment):
+        self.file.write(str(self.segment_count + 1) + '\n')
+        self.file.write(_timestamp(segment['timestampStartSeconds'], ',') + ' --> '
+                        + _timestamp(segment['timestampEndSeconds'], ',') + '\n')
+        self.file.write(segment['text'].strip() + '\n\n')
+
+
+class VttTranscriptWriter(TranscriptWriter):
+    name = 'vtt'
+    file_extension = '.vtt'
+    content_type = 'text/vtt'
+
+    def write_header(self):
+        self.file.write('WEBVTT\n\n')
+
+    def write_segment(self, segment):
+        self.file.write(str(segment['id']) + '\n')
+        self.file.write(_timestamp(segment['timestampStartSeconds'], '.') + ' --> '
+                        + _timestamp(segment['timestampEndSeconds'], '.') + '\n')
+        self.file.write(segment['text'].strip() + '\n\n')
+
+
+transcript_writers = {
+    JsonTranscriptWriter.name: JsonTranscriptWriter,
+    JsonLinesTranscriptWriter.name: JsonLinesTranscriptWriter,
+    SrtTranscriptWriter.name: SrtTranscriptWriter,
+    VttTranscriptWriter.name: VttTranscriptWriter,
+}
+
+
+def get_transcript_writer_class(format_name):
+    if format_name not in transcript_writers:
+        raise ValueError("unsupported transcript format: " + str(format_name) + ". Expected one of " + ", ".join(transcript_writers))
+    return transcript_writers[format_name]
+
+
+def create_transcript_writer(format_name, filename):
+    return get_transcript_writer_class(format_name)(filename)
@@ -0,0 +1,252 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from asr_backends import create_backend, default_backend_name, default_model_name
+from decoded_audio import asr_sample_rate
+from voice_activity import detect_speech_intervals
+
+logger = logging.getLogger(__name__)
+
+default_chunk_seconds = 300
+silence_search_seconds = 20
+silence_frame_seconds = 0.02
+silence_smoothing_frames = 15
+chunk_overlap_seconds = 1.0
+interval_spacer_seconds = 0.3
+
+# Per worker process state; populated by _init_worker.
+worker_backend = None
+
+
+def _init_worker(backend_name, model_name, threads):
+    global worker_backend
+    worker_backend = create_backend(backend_name, model_name, threads)
+
+
+def _transcribe_chunk(audio_source, intervals, language, speech_windows=None):
+    """Runs in a pool worker. audio_source is either the path of a memory-mapped .npy or the samples themselves."""
+    if isinstance(audio_source, str):
+        audio = np.load(audio_source, mmap_mode='c')
+    else:
+        audio = audio_source
+    return worker_backend.transcribe(_assemble(audio, intervals), language, speech_windows)
+
+
+def _assemble(audio, intervals):
+    """Concatenates the source intervals into one buffer, with a short silent spacer between them."""
+    if len(intervals) == 1:
+        start, end = intervals[0]
+        return np.ascontiguousarray(audio[start:end], dtype=np.float32)
+    spacer = np.zeros(int(interval_spacer_seconds * asr_sample_rate), dtype=np.float32)
+    parts = []
+    for i, (start, end) in enumerate(intervals):
+        if i > 0:
+            parts.append(spacer)
+        parts.append(np.asarray(audio[start:end], dtype=np.float32))
+    return np.concatenate(parts)
+
+
+def _assembled_windows(intervals):
+    """Where each source interval lies in the _assemble()d buffer, as (start, end) samples."""
+    spacer = int(interval_spacer_seconds * asr_sample_rate) if len(intervals) > 1 else 0
+    windows = []
+    position = 0
+    for start, end in intervals:
+        windows.append((position, position + end - start))
+        position += end - start + spacer
+    return windows
+
+
+class TimelineMap(object):
+    """Maps times in an assembled chunk buffer back to the source timeline."""
+    def __init__(self, intervals):
+        spacer = int(interval_spacer_seconds * asr_sample_rate) if len(intervals) > 1 else 0
+        self.source_starts = np.array([start for start, _ in intervals], dtype=float) / asr_sample_rate
+        self.source_ends = np.array([end for _, end in intervals], dtype=float) / asr_sample_rate
+        lengths = self.source_ends - self.source_starts
+        self.chunk_starts = np.concatenate(([0.0], np.cumsum(lengths[:-1] + spacer / asr_sample_rate)))
+
+    def to_source(self, chunk_time, is_start=False):
+        i = max(0, int(np.searchsorted(self.chunk_starts, chunk_time, side='right')) - 1)
+        source_time = self.source_starts[i] + (chunk_time - self.chunk_starts[i])
+        # Times inside a spacer belong to no interval: starts move forward to the next interval, ends back to the previous.
+        if i < len(self.source_starts) - 1 and source_time > self.source_ends[i]:
+            source_time = self.source_starts[i + 1] if is_start else self.source_ends[i]
+        return float(source_time)
+
+
+class TranscriptionEngine(object):
+    """Whisper transcription that scales with core count.
+    With use_vad, only detected speech intervals are transcribed: they are packed into chunks of up to
+    chunk_seconds of speech and each chunk's intervals are concatenated for Whisper. Without it, audio longer
+    than one chunk is cut at the quietest point near every chunk_seconds and each chunk gets a little overlap
+    for context. Chunks are transcribed in a process pool and segment/word timestamps are mapped back onto the
+    source timeline. A segment is kept only by the chunk whose owned range holds its midpoint, which removes
+    the duplicates the overlap produces."""
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(TranscriptionEngine, cls).__new__(cls)
+            cls.instance.initialized = False
+        return cls.instance
+
+    def __init__(self):
+        if self.initialized == True:
+            return
+        self.backend_name = default_backend_name
+        self.model_name = default_model_name
+        self.chunk_seconds = default_chunk_seconds
+        self.use_vad = True
+        self.max_workers = max(1, (os.cpu_count() or 1) // 2)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.local_backend = None
+        self.initialized = True
+
+    def transcribe(self, audio, language, audio_path=None):
+        """Returns a whisper-style result: {'text', 'segments', 'language'} on the source timeline.
+        audio_path, if given, is a .npy holding exactly these samples (e.g. DecodedAudio.asr_path);
+        workers then memory-map it instead of receiving pickled chunks."""
+        segments = []
+        for chunk_segments in self.transcribe_iter(audio, language, audio_path):
+            segments += chunk_segments
+        return {
+            'text': "".join(seg['text'] for seg in segments),
+            'segments': segments,
+            'language': language,
+        }
+
+    def transcribe_iter(self, audio, language, audio_path=None):
+        """Yields each chunk's stitched segments in timeline order as soon as that chunk is done."""
+        chunks = self.plan_chunks(audio)
+        if len(chunks) == 0:
+            return
+        if len(chunks) == 1:
+            intervals, owned_start_sec, owned_end_sec = chunks[0]
+            result = self.__transcribe_locally(_assemble(audio, intervals), language, self.__speech_windows(intervals))
+            yield self.__stitch(result, TimelineMap(intervals), owned_start_sec, owned_end_sec, 0)
+            return
+
+        futures = []
+        pool = self.__get_pool()
+        for intervals, owned_start_sec, owned_end_sec in chunks:
+            # Memory-mapped input is handed to workers by path so chunks are never pickled.
+            if audio_path is not None:
+                future = pool.submit(_transcribe_chunk, audio_path, intervals, language, self.__speech_windows(intervals))
+            else:
+                assembled = _assemble(audio, intervals)
+                future = pool.submit(_transcribe_chunk, assembled, [(0, len(assembled))], language, self.__speech_windows(intervals))
+            futures.append((TimelineMap(intervals), owned_start_sec, owned_end_sec, future))
+        logger.info(f"Transcribing {len(futures)} chunks across {self.max_workers} workers")
+
+        next_id = 0
+        for timeline_map, owned_start_sec, owned_end_sec, future in futures:
+            chunk_segments = self.__stitch(future.result(), timeline_map, owned_start_sec, owned_end_sec, next_id)
+            next_id += len(chunk_segments)
+            yield chunk_segments
+
+    def plan_chunks(self, audio):
+        """[(intervals, owned_start_sec, owned_end_sec), ...]; intervals are source sample ranges
+        transcribed together as one Whisper call."""
+        if self.use_vad:
+            return self.__plan_speech_chunks(detect_speech_intervals(audio, asr_sample_rate))
+        boundaries = self.get_chunk_boundaries(audio)
+        overlap = int(chunk_overlap_seconds * asr_sample_rate)
+        chunks = []
+        for i, (owned_start, owned_end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+            start = max(0, owned_start - overlap)
+            end = min(len(audio), owned_end + overlap)
+            # Outer edges are unbounded so segments whisper places slightly past either end survive.
+            owned_start_sec = owned_start / asr_sample_rate if i > 0 else -np.inf
+            owned_end_sec = owned_end / asr_sample_rate if owned_end < len(audio) else np.inf
+            chunks.append(([(start, end)], owned_start_sec, owned_end_sec))
+        return chunks
+
+    def __plan_speech_chunks(self, speech_intervals):
+        """Packs speech intervals, in order, into chunks of at most chunk_seconds of speech.
+        Intervals longer than a chunk are split; chunks never overlap, so ownership only decides the edges."""
+        chunk_samples = int(self.chunk_seconds * asr_sample_rate)
+        pieces = []
+        for start, end in speech_intervals:
+            for piece_start in range(start, end, chunk_samples):
+                pieces.append((piece_start, min(end, piece_start + chunk_samples)))
+        grouped = []
+        current = []
+        current_samples = 0
+        for start, end in pieces:
+            if current and current_samples + (end - start) > chunk_samples:
+                grouped.append(current)
+                current = []
+                current_samples = 0
+            current.append((start, end))
+            current_samples += end - start
+        if current:
+            grouped.append(current)
+
+        chunks = []
+        for i, intervals in enumerate(grouped):
+            owned_start_sec = intervals[0][0] / asr_sample_rate if i > 0 else -np.inf
+            owned_end_sec = grouped[i + 1][0][0] / asr_sample_rate if i < len(grouped) - 1 else np.inf
+            chunks.append((intervals, owned_start_sec, owned_end_sec))
+        return chunks
+
+    def get_chunk_boundaries(self, audio):
+        """Sample indexes [0, cut_1, ..., len(audio)], cutting at the quietest point near each chunk_seconds."""
+        total = len(audio)
+        chunk = int(self.chunk_seconds * asr_sample_rate)
+        search = int(silence_search_seconds * asr_sample_rate)
+        boundaries = [0]
+        while total - boundaries[-1] > chunk + search:
+            target = boundaries[-1] + chunk
+            boundaries.append(self.__quietest_sample(audio, target - search, target + search))
+        boundaries.append(total)
+        return boundaries
+
+    def __quietest_sample(self, audio, window_start, window_end):
+        frame = int(silence_frame_seconds * asr_sample_rate)
+        window = np.asarray(audio[window_start:window_end], dtype=np.float32)
+        frame_count = len(window) // frame
+        energy = np.mean(np.square(window[:frame_count * frame].reshape(frame_count, frame)), axis=1)
+        # Prefer a sustained pause over a single quiet frame between words.
+        smoothed = np.convolve(energy, np.ones(silence_smoothing_frames) / silence_smoothing_frames, mode='same')
+        return window_start + int(np.argmin(smoothed)) * frame + frame // 2
+
+    def __stitch(self, result, timeline_map, owned_start_sec, owned_end_sec, first_id):
+        stitched = []
+        for seg in result['segments']:
+            seg['start'] = timeline_map.to_source(seg['start'], is_start=True)
+            seg['end'] = timeline_map.to_source(seg['end'])
+            midpoint = (seg['start'] + seg['end']) / 2
+            if midpoint < owned_start_sec or midpoint >= owned_end_sec:
+                continue
+            for word in seg.get('words', []):
+                word['start'] = timeline_map.to_source(word['start'], is_start=True)
+                word['end'] = timeline_map.to_source(word['end'])
+            seg['id'] = first_id + len(stitched)
+            stitched.append(seg)
+        return stitched
+
+    def __speech_windows(self, intervals):
+        """A chunk's speech intervals within its assembled buffer, for backends that decode only speech windows.
+        None without VAD: the chunk is then one stretch of audio, not known to be speech."""
+        return _assembled_windows(intervals) if self.use_vad else None
+
+    def __transcribe_locally(self, audio, language, speech_windows=None):
+        if self.local_backend is None:
+            self.local_backend = create_backend(self.backend_name, self.model_name, os.cpu_count() or 1)
+        return self.local_backend.transcribe(audio, language, speech_windows)
+
+    def __get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+                # spawn: forking a process that already holds torch/ffmpeg threads can deadlock.
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_init_worker,
+                                                initargs=(self.backend_name, self.model_name, threads))
+            return self.pool
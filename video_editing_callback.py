@@ -11,6 +11,7 @@ import context_generator
 import boto3
 from botocore.exceptions import ClientError
 import s3_wrapper
+from transcript_writer import default_transcript_format
 logger = logging.getLogger(__name__)
 class VideoEditCallbackHandler(object):
     def __new__(cls):
@@ -38,17 +39,26 @@ class VideoEditCallbackHandler(object):
         if misc_payload['sinkPresignedS3Url'] != '' or len(misc_payload['sinkPresignedS3Url']) != 0:
             return self.__create_transcript(misc_payload)
         
-        return self.__perform_render(self, misc_payload)
+        return self.__perform_render(misc_payload)
 
 
     def __perform_render(self, data) -> bool:
+        storyboard_interval = data.get("storyboardIntervalSeconds")
+        if not movie_render.is_valid_storyboard_interval(storyboard_interval):
+            # Redelivering the message cannot fix it, so it is consumed (as the API rejects it with a 400).
+            logger.error(f"Invalid storyboardIntervalSeconds: {storyboard_interval}. Expected a positive number")
+            return True
         return self.video_editor.perform_render(is_short_form=data["isShortForm"],
                             thumbnail_text=data["thumbnailText"],
                             final_render_sequences=data["finalRenderSequences"],
                             language=data["language"],
                             watermark_text=data["watermarkText"],
                             local_save_as=data["contentLookupKey"],
-                            filepath_prefix=data["filepathPrefix"])
+                            filepath_prefix=data["filepathPrefix"],
+                            encoding_profile=data.get("encodingProfile"),
+                            preview=data.get("preview", False),
+                            storyboard_interval=storyboard_interval)
     
     def __create_transcript(self, data) -> bool:
-        return self.context_generator.transcribe_video_to_cloud(data['sourcePresignedS3Url'], data['sinkPresignedS3Url'])
\ No newline at end of file
+        return self.context_generator.transcribe_video_to_cloud(data['sourcePresignedS3Url'], data['sinkPresignedS3Url'],
+                                                               data.get('transcriptFormat', default_transcript_format))
\ No newline at end of file
@@ -0,0 +1,98 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+frame_seconds = 0.02
+block_seconds = 60 # Features are computed a block at a time so long memory-mapped sources stay out of RAM.
+speech_band_hz = (300, 3400)
+energy_floor_percentile = 10
+energy_above_floor_db = 12 # Frame must be this far above the source's noise floor.
+min_speech_band_ratio = 0.4 # Share of frame energy inside speech_band_hz.
+modulation_window_seconds = 0.5
+min_modulation_db = 3.0 # Syllabic energy swings; sustained music beds sit below this.
+smoothing_frames = 11
+merge_gap_seconds = 0.5
+min_speech_seconds = 0.25
+padding_seconds = 0.2
+
+
+def detect_speech_intervals(audio, sample_rate):
+    """Energy/spectral voice activity detection, CPU only.
+    A frame counts as speech when it is well above the noise floor, most of its energy is in the speech band,
+    and the surrounding half second shows the syllabic loudness modulation that steady music and ambience lack.
+    Returns [(start_sample, end_sample), ...] sorted, padded, with short gaps merged."""
+    frame = int(frame_seconds * sample_rate)
+    frame_count = len(audio) // frame
+    if frame_count == 0:
+        return []
+
+    energy_db, band_ratio = _frame_features(audio, sample_rate, frame, frame_count)
+    noise_floor_db = np.percentile(energy_db, energy_floor_percentile)
+    loud = energy_db > noise_floor_db + energy_above_floor_db
+
+    modulation_frames = max(1, int(modulation_window_seconds / frame_seconds))
+    modulation = _moving_std(energy_db, modulation_frames)
+    voiced = loud & (band_ratio >= min_speech_band_ratio) & (modulation >= min_modulation_db)
+    # Majority vote over neighbouring frames to ignore isolated flips.
+    voiced = np.convolve(voiced.astype(np.float32), np.ones(smoothing_frames), mode='same') > smoothing_frames / 2
+
+    intervals = _runs(voiced)
+    merged = []
+    merge_gap = merge_gap_seconds / frame_seconds
+    for start, end in intervals:
+        if merged and start - merged[-1][1] <= merge_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    padding = int(padding_seconds * sample_rate)
+    min_frames = min_speech_seconds / frame_seconds
+    speech = []
+    for start, end in merged:
+        if end - start < min_frames:
+            continue
+        start_sample = max(0, start * frame - padding)
+        end_sample = min(len(audio), end * frame + padding)
+        if speech and start_sample <= speech[-1][1]:
+            speech[-1] = (speech[-1][0], end_sample)
+        else:
+            speech.append((start_sample, end_sample))
+
+    speech_seconds = sum(end - start for start, end in speech) / sample_rate
+    logger.info(f"VAD kept {speech_seconds:.1f}s of speech out of {len(audio) / sample_rate:.1f}s in {len(speech)} intervals")
+    return speech
+
+
+def _frame_features(audio, sample_rate, frame, frame_count):
+    """Per-frame log energy (dB) and speech-band energy ratio."""
+    energy_db = np.empty(frame_count, dtype=np.float32)
+    band_ratio = np.empty(frame_count, dtype=np.float32)
+    freqs = np.fft.rfftfreq(frame, d=1.0 / sample_rate)
+    in_band = (freqs >= speech_band_hz[0]) & (freqs <= speech_band_hz[1])
+    window = np.hanning(frame).astype(np.float32)
+    frames_per_block = max(1, int(block_seconds / frame_seconds))
+    for block_start in range(0, frame_count, frames_per_block):
+        block_end = min(frame_count, block_start + frames_per_block)
+        frames = np.asarray(audio[block_start * frame:block_end * frame], dtype=np.float32).reshape(-1, frame)
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        total = power.sum(axis=1) + 1e-12
+        energy_db[block_start:block_end] = 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-12)
+        band_ratio[block_start:block_end] = power[:, in_band].sum(axis=1) / total
+    return energy_db, band_ratio
+
+
+def _moving_std(values, window):
+    kernel = np.ones(window) / window
+    mean = np.convolve(values, kernel, mode='same')
+    mean_sq = np.convolve(np.square(values), kernel, mode='same')
+    return np.sqrt(np.maximum(mean_sq - np.square(mean), 0))
+
+
+def _runs(mask):
+    """[(start, end), ...] frame index ranges where mask is True."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return list(zip(starts.tolist(), ends.tolist()))